@@ -1,14 +1,37 @@
+import time
+
+# Startup timing starts before the heavy imports
+startup_begin = time.perf_counter()
+
+import argparse
+import collections
+import copy
+import functools
 import pygame
 import random
 import math
+import warnings
+import numpy as np
 
-# Initialize pygame
-pygame.init()
+from batch_draw import CircleStamp
+from bullets import BulletPool
+from campaign import Campaign, level_files, read_level
+from collision import sweep_aabb_first
+from dirty_rects import DirtyRectRenderer
+from frametime import HitchDetector, StatsOverlay, detector_lines
+from kinds import CAUSES, ENEMY_TYPES
+from levelpack import ChunkStreamer, LevelPack
+from memprofile import MemoryProfiler
+from parallax import ParallaxBackground, ParallaxLayer, make_tile
+from spatial import PlatformGrid
+from sim_thread import SimulationThread
+from spawning import SpawnScheduler, spawn_table
+from surface_cache import SurfaceCache
+from telemetry import BOSS_PATTERN, DAMAGE, HIT, KILL, LEVEL, PICKUP, RESET, SHOT, TelemetryWriter
+from tilemap import SOLID, SPIKE, RunLengthTileMap, TileMap, TileRenderer, TileWindow
 
 # Screen dimensions
 WIDTH, HEIGHT = 800, 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Metroidvania Platformer")
 
 # Colors
 BLACK = (0, 0, 0)
@@ -22,12 +45,50 @@ YELLOW = (255, 255, 0)
 DARK_BLUE = (50, 50, 80)
 
 # Game variables
-clock = pygame.time.Clock()
 FPS = 60
 gravity = 0.5
 scroll_threshold = 200
 level_length = 5000
 
+# Key state used when there is no keyboard (headless runs)
+NO_KEYS = collections.defaultdict(bool)
+
+# Ticks the level complete banner stays up before the next level starts
+LEVEL_BANNER_TICKS = 120
+
+# Frame time histogram and hitch log, F3 shows it in game
+frame_stats = HitchDetector(budget_ms=1000 / FPS)
+
+# Where the game notes its events: the frames, or with --threaded the sim
+# thread's own ticks
+tick_stats = frame_stats
+
+# Pre-rendered sprites and text, within a memory budget
+surface_cache = SurfaceCache()
+fonts = {}
+
+# Gameplay event log, only while --telemetry is given
+telemetry = None
+
+# Fonts are created on first use, note it so hitches can be attributed to it
+def make_font(size):
+    if size not in fonts:
+        frame_stats.note("font", str(size))
+        fonts[size] = pygame.font.SysFont(None, size)
+    return fonts[size]
+
+# Rendered text comes from the surface cache
+def render_text(text, size, color):
+    return surface_cache.get(("text", text, size, color),
+                             lambda: make_font(size).render(text, True, color))
+
+# Helper function for a blank sprite surface with a transparent colorkey
+def make_sprite(width, height, colorkey=(255, 0, 255)):
+    sprite = pygame.Surface((width, height))
+    sprite.fill(colorkey)
+    sprite.set_colorkey(colorkey)
+    return sprite
+
 # Helper function for bounding box collision detection
 def check_collision(rect1, rect2):
     return (rect1[0] < rect2[0] + rect2[2] and
@@ -35,6 +96,14 @@ def check_collision(rect1, rect2):
             rect1[1] < rect2[1] + rect2[3] and
             rect1[1] + rect1[3] > rect2[1])
 
+# First rect a box moving by (dx, dy) runs into: one of platform_rects, or a
+# solid tile when the level is a TileMap (platform_rects is None then)
+def first_contact(platforms, platform_rects, rect, dx, dy):
+    if platform_rects is None:
+        return platforms.sweep_rect(rect, dx, dy)
+    hit = sweep_aabb_first(rect, dx, dy, platform_rects)
+    return platform_rects[hit[3]] if hit else None
+
 # Player class
 class Player:
     def __init__(self, x, y):
@@ -58,7 +127,19 @@ class Player:
     def get_rect(self):
         return (self.x, self.y, self.width, self.height)
         
-    def move(self, platforms):
+    # Everything move() reads and writes, as a plain tuple
+    def get_state(self):
+        return (self.x, self.y, self.vel_x, self.vel_y, self.is_jumping,
+                self.direction, self.shoot_direction)
+        
+    def set_state(self, state):
+        (self.x, self.y, self.vel_x, self.vel_y, self.is_jumping,
+         self.direction, self.shoot_direction) = state
+        
+    # One tick of movement. Only depends on the player state, keys and
+    # platforms (a list, or the level's TileMap), so a client can replay it
+    # to predict its own player.
+    def move(self, platforms, keys, length=level_length):
         dx = 0
         dy = 0
         
@@ -67,9 +148,6 @@ class Player:
         if self.vel_y > 10:
             self.vel_y = 10
             
-        # Process key presses
-        keys = pygame.key.get_pressed()
-        
         # Horizontal movement with air control factor
         control_factor = 1 if not self.is_jumping else self.air_control
         if keys[pygame.K_LEFT]:
@@ -113,33 +191,29 @@ class Player:
         dx += self.vel_x
         dy += self.vel_y
         
-        # Check for collisions with platforms
-        for platform in platforms:
-            platform_rect = (platform.x, platform.y, platform.width, platform.height)
-            player_rect = (self.x + dx, self.y, self.width, self.height)
-            
-            # Check for horizontal collisions
-            if check_collision(player_rect, platform_rect):
-                if dx > 0:  # Moving right
-                    self.x = platform.x - self.width
-                    dx = 0
-                elif dx < 0:  # Moving left
-                    self.x = platform.x + platform.width
-                    dx = 0
-                    
-            player_rect = (self.x, self.y + dy, self.width, self.height)
+        # Sweep the move against the platforms, horizontal first then vertical,
+        # so fast falls can't tunnel through thin platforms between frames
+        platform_rects = None if isinstance(platforms, TileMap) else [platform.get_rect() for platform in platforms]
+        
+        # Check for horizontal collisions
+        hit = first_contact(platforms, platform_rects, self.get_rect(), dx, 0)
+        if hit:
+            if dx > 0:  # Moving right
+                self.x = hit[0] - self.width
+            else:  # Moving left
+                self.x = hit[0] + hit[2]
+            dx = 0
             
-            # Check for vertical collisions
-            if check_collision(player_rect, platform_rect):
-                if dy > 0:  # Falling
-                    self.y = platform.y - self.height
-                    self.is_jumping = False
-                    dy = 0
-                    self.vel_y = 0
-                elif dy < 0:  # Jumping
-                    self.y = platform.y + platform.height
-                    dy = 0
-                    self.vel_y = 0
+        # Check for vertical collisions
+        hit = first_contact(platforms, platform_rects, self.get_rect(), 0, dy)
+        if hit:
+            if dy > 0:  # Falling
+                self.y = hit[1] - self.height
+                self.is_jumping = False
+            else:  # Jumping
+                self.y = hit[1] + hit[3]
+            dy = 0
+            self.vel_y = 0
         
         # Update player position
         self.x += dx
@@ -148,8 +222,8 @@ class Player:
         # Keep player within screen boundaries
         if self.x < 0:
             self.x = 0
-        if self.x > level_length - self.width:
-            self.x = level_length - self.width
+        if self.x > length - self.width:
+            self.x = length - self.width
         if self.y < 0:
             self.y = 0
             self.vel_y = 0
@@ -191,57 +265,68 @@ class Player:
             return Bullet(bullet_x, bullet_y, dx, dy)
         return None
     
-    def draw(self, screen, scroll):
-        # Draw player
-        color = BLUE if self.invincibility == 0 else (200, 200, 255)
-        pygame.draw.rect(screen, color, (self.x - scroll, self.y, self.width, self.height))
+    def get_dirty_rects(self, scroll):
+        # Body plus room for the aim indicator, and the health bar
+        return [(self.x - scroll - 22, self.y - 22, self.width + 44, self.height + 44),
+                (10, 10, 200, 20)]
+    
+    def render_body(self, color, direction):
+        sprite = pygame.Surface((self.width, self.height))
+        pygame.draw.rect(sprite, color, (0, 0, self.width, self.height))
         
         # Draw eyes
         eye_size = 8
-        if self.direction == 1:
-            pygame.draw.ellipse(screen, WHITE, (self.x - scroll + 20, self.y + 10, eye_size, eye_size))
-            pygame.draw.ellipse(screen, BLACK, (self.x - scroll + 22, self.y + 12, eye_size//2, eye_size//2))
+        if direction == 1:
+            pygame.draw.ellipse(sprite, WHITE, (20, 10, eye_size, eye_size))
+            pygame.draw.ellipse(sprite, BLACK, (22, 12, eye_size//2, eye_size//2))
         else:
-            pygame.draw.ellipse(screen, WHITE, (self.x - scroll + 5, self.y + 10, eye_size, eye_size))
-            pygame.draw.ellipse(screen, BLACK, (self.x - scroll + 7, self.y + 12, eye_size//2, eye_size//2))
+            pygame.draw.ellipse(sprite, WHITE, (5, 10, eye_size, eye_size))
+            pygame.draw.ellipse(sprite, BLACK, (7, 12, eye_size//2, eye_size//2))
+        return sprite
+    
+    def render_health_bar(self, health, max_health):
+        sprite = pygame.Surface((200, 20))
+        pygame.draw.rect(sprite, RED, (0, 0, 200, 20))
+        pygame.draw.rect(sprite, GREEN, (0, 0, 200 * (health / max_health), 20))
+        pygame.draw.rect(sprite, WHITE, (0, 0, 200, 20), 2)
+        return sprite
+    
+    # The aim line as a sprite centred on the player's middle
+    def render_aim(self, shoot_direction):
+        sprite = make_sprite(44, 44)
+        pygame.draw.line(sprite, YELLOW, (22, 22),
+                         (22 + shoot_direction[0] * 20, 22 + shoot_direction[1] * 20), 2)
+        return sprite
+    
+    def draw(self, screen, scroll):
+        # Draw player
+        color = BLUE if self.invincibility == 0 else (200, 200, 255)
+        direction = self.direction
+        body = surface_cache.get(("player", color, direction), lambda: self.render_body(color, direction))
+        screen.blit(body, (self.x - scroll, self.y))
         
         # Draw health bar
-        pygame.draw.rect(screen, RED, (10, 10, 200, 20))
-        pygame.draw.rect(screen, GREEN, (10, 10, 200 * (self.health / self.max_health), 20))
-        pygame.draw.rect(screen, WHITE, (10, 10, 200, 20), 2)
+        health, max_health = self.health, self.max_health
+        bar = surface_cache.get(("health bar", health, max_health),
+                                lambda: self.render_health_bar(health, max_health))
+        screen.blit(bar, (10, 10))
         
         # Draw shoot direction indicator when aiming
         if self.shoot_direction != (self.direction, 0):
             aim_x = self.x - scroll + self.width//2
             aim_y = self.y + self.height//2
-            pygame.draw.line(screen, YELLOW, 
-                            (aim_x, aim_y),
-                            (aim_x + self.shoot_direction[0] * 20, aim_y + self.shoot_direction[1] * 20),
-                            2)
+            shoot_direction = self.shoot_direction
+            aim = surface_cache.get(("aim", shoot_direction), lambda: self.render_aim(shoot_direction))
+            screen.blit(aim, (aim_x - 22, aim_y - 22))
 
-# Bullet class
+# Bullet class - a newly fired bullet, moved into a BulletPool where it is
+# updated, collided and drawn together with the others
 class Bullet:
     def __init__(self, x, y, vel_x, vel_y):
         self.x = x
         self.y = y
         self.vel_x = vel_x
         self.vel_y = vel_y
-        self.radius = 5
-        self.color = YELLOW
-        
-    def update(self):
-        self.x += self.vel_x
-        self.y += self.vel_y
-        
-    def get_rect(self):
-        return (self.x - self.radius, self.y - self.radius, self.radius * 2, self.radius * 2)
-        
-    def draw(self, screen, scroll):
-        pygame.draw.circle(screen, self.color, (int(self.x - scroll), int(self.y)), self.radius)
-        
-    def is_off_screen(self, scroll):
-        return (self.x < scroll or self.x > scroll + WIDTH or 
-                self.y < 0 or self.y > HEIGHT)
 
 # Enemy class
 class Enemy:
@@ -282,6 +367,11 @@ class Enemy:
             
     def get_rect(self):
         return (self.x, self.y, self.width, self.height)
+    
+    def get_dirty_rects(self, scroll):
+        # The boss health bar sits 20 px above the body
+        top = 20 if self.type == "boss" else 0
+        return [(self.x - scroll - 2, self.y - top - 2, self.width + 4, self.height + top + 4)]
             
     def update(self, player_x):
         if self.type == "ground":
@@ -377,51 +467,66 @@ class Enemy:
                     return bullets
         return []
     
-    def draw(self, screen, scroll):
+    def render_body(self, direction):
         if self.type == "ground":
-            color = RED
-            pygame.draw.rect(screen, color, (self.x - scroll, self.y, self.width, self.height))
+            sprite = pygame.Surface((self.width, self.height))
+            pygame.draw.rect(sprite, RED, (0, 0, self.width, self.height))
             # Draw eyes
             eye_size = 8
-            if self.direction == 1:
-                pygame.draw.ellipse(screen, WHITE, (self.x - scroll + 25, self.y + 10, eye_size, eye_size))
-                pygame.draw.ellipse(screen, BLACK, (self.x - scroll + 27, self.y + 12, eye_size//2, eye_size//2))
+            if direction == 1:
+                pygame.draw.ellipse(sprite, WHITE, (25, 10, eye_size, eye_size))
+                pygame.draw.ellipse(sprite, BLACK, (27, 12, eye_size//2, eye_size//2))
             else:
-                pygame.draw.ellipse(screen, WHITE, (self.x - scroll + 10, self.y + 10, eye_size, eye_size))
-                pygame.draw.ellipse(screen, BLACK, (self.x - scroll + 12, self.y + 12, eye_size//2, eye_size//2))
+                pygame.draw.ellipse(sprite, WHITE, (10, 10, eye_size, eye_size))
+                pygame.draw.ellipse(sprite, BLACK, (12, 12, eye_size//2, eye_size//2))
                 
         elif self.type == "flying":
-            color = PURPLE
-            pygame.draw.ellipse(screen, color, (self.x - scroll, self.y, self.width, self.height))
+            sprite = make_sprite(self.width, self.height)
+            pygame.draw.ellipse(sprite, PURPLE, (0, 0, self.width, self.height))
             # Draw eyes
             eye_size = 8
-            if self.direction == 1:
-                pygame.draw.ellipse(screen, WHITE, (self.x - scroll + 22, self.y + 10, eye_size, eye_size))
-                pygame.draw.ellipse(screen, BLACK, (self.x - scroll + 24, self.y + 12, eye_size//2, eye_size//2))
+            if direction == 1:
+                pygame.draw.ellipse(sprite, WHITE, (22, 10, eye_size, eye_size))
+                pygame.draw.ellipse(sprite, BLACK, (24, 12, eye_size//2, eye_size//2))
             else:
-                pygame.draw.ellipse(screen, WHITE, (self.x - scroll + 8, self.y + 10, eye_size, eye_size))
-                pygame.draw.ellipse(screen, BLACK, (self.x - scroll + 10, self.y + 12, eye_size//2, eye_size//2))
+                pygame.draw.ellipse(sprite, WHITE, (8, 10, eye_size, eye_size))
+                pygame.draw.ellipse(sprite, BLACK, (10, 12, eye_size//2, eye_size//2))
                 
         else:  # boss
-            color = (180, 0, 0)
-            pygame.draw.rect(screen, color, (self.x - scroll, self.y, self.width, self.height))
+            sprite = pygame.Surface((self.width, self.height))
+            pygame.draw.rect(sprite, (180, 0, 0), (0, 0, self.width, self.height))
             # Draw details
-            pygame.draw.rect(screen, (100, 0, 0), (self.x - scroll, self.y, self.width, 30))
+            pygame.draw.rect(sprite, (100, 0, 0), (0, 0, self.width, 30))
             
             # Draw eyes
             eye_size = 20
-            if self.direction == 1:
-                pygame.draw.ellipse(screen, YELLOW, (self.x - scroll + 80, self.y + 40, eye_size, eye_size))
-                pygame.draw.ellipse(screen, BLACK, (self.x - scroll + 86, self.y + 46, eye_size//2, eye_size//2))
+            if direction == 1:
+                pygame.draw.ellipse(sprite, YELLOW, (80, 40, eye_size, eye_size))
+                pygame.draw.ellipse(sprite, BLACK, (86, 46, eye_size//2, eye_size//2))
             else:
-                pygame.draw.ellipse(screen, YELLOW, (self.x - scroll + 20, self.y + 40, eye_size, eye_size))
-                pygame.draw.ellipse(screen, BLACK, (self.x - scroll + 26, self.y + 46, eye_size//2, eye_size//2))
-                
+                pygame.draw.ellipse(sprite, YELLOW, (20, 40, eye_size, eye_size))
+                pygame.draw.ellipse(sprite, BLACK, (26, 46, eye_size//2, eye_size//2))
+        return sprite
+    
+    @staticmethod
+    def render_health_bar(health):
+        bar_width = 120
+        sprite = pygame.Surface((bar_width, 10))
+        pygame.draw.rect(sprite, RED, (0, 0, bar_width, 10))
+        pygame.draw.rect(sprite, GREEN, (0, 0, bar_width * (health / 300), 10))
+        pygame.draw.rect(sprite, WHITE, (0, 0, bar_width, 10), 1)
+        return sprite
+    
+    def draw(self, screen, scroll):
+        direction = self.direction
+        body = surface_cache.get((self.type, direction), lambda: self.render_body(direction))
+        screen.blit(body, (self.x - scroll, self.y))
+        
+        if self.type == "boss":
             # Draw health bar
-            bar_width = 120
-            pygame.draw.rect(screen, RED, (self.x - scroll, self.y - 20, bar_width, 10))
-            pygame.draw.rect(screen, GREEN, (self.x - scroll, self.y - 20, bar_width * (self.health / 300), 10))
-            pygame.draw.rect(screen, WHITE, (self.x - scroll, self.y - 20, bar_width, 10), 1)
+            health = self.health
+            bar = surface_cache.get(("boss health bar", health), lambda: self.render_health_bar(health))
+            screen.blit(bar, (self.x - scroll, self.y - 20))
 
 # Platform class
 class Platform:
@@ -449,14 +554,20 @@ class Spike:
         # Return a rect that matches the visual position of the spikes
         return (self.x, self.y, self.width, self.height)
         
-    def draw(self, screen, scroll):
+    def render(self):
+        sprite = make_sprite(self.width + 1, self.height + 1)
         for i in range(self.width // 20):
             points = [
-                (self.x - scroll + i * 20, self.y + self.height),
-                (self.x - scroll + i * 20 + 10, self.y),
-                (self.x - scroll + i * 20 + 20, self.y + self.height)
+                (i * 20, self.height),
+                (i * 20 + 10, 0),
+                (i * 20 + 20, self.height)
             ]
-            pygame.draw.polygon(screen, RED, points)
+            pygame.draw.polygon(sprite, RED, points)
+        return sprite
+        
+    def draw(self, screen, scroll):
+        sprite = surface_cache.get(("spike", self.width), self.render)
+        screen.blit(sprite, (self.x - scroll, self.y))
 
 # Health pickup class
 class HealthPickup:
@@ -469,6 +580,11 @@ class HealthPickup:
         
     def get_rect(self):
         return (self.x, self.y, self.width, self.height)
+    
+    def get_dirty_rects(self, scroll):
+        if self.collected:
+            return []
+        return [(self.x - scroll - 2, self.y - 2, self.width + 4, self.height + 4)]
         
     def draw(self, screen, scroll):
         if not self.collected:
@@ -483,262 +599,750 @@ class HealthPickup:
             return True
         return False
 
-# Initialize game objects
-player = Player(100, 100)
-platforms = []
-enemies = []
-player_bullets = []
-enemy_bullets = []
-spikes = []
-health_pickups = []
-scroll = 0
-game_over = False
-level_complete = False
-
-# Create platforms
-platforms.append(Platform(0, HEIGHT - 40, level_length, 40))  # Ground
-platforms.append(Platform(200, 450, 100, 20))
-platforms.append(Platform(400, 400, 100, 20))
-platforms.append(Platform(600, 350, 100, 20))
-platforms.append(Platform(800, 300, 100, 20))
-platforms.append(Platform(1000, 400, 100, 20))
-platforms.append(Platform(1200, 450, 100, 20))
-platforms.append(Platform(1400, 400, 100, 20))
-platforms.append(Platform(1600, 350, 100, 20))
-platforms.append(Platform(1800, 400, 100, 20))
-platforms.append(Platform(2000, 450, 100, 20))
-platforms.append(Platform(2200, 400, 100, 20))
-platforms.append(Platform(2400, 350, 100, 20))
-platforms.append(Platform(2600, 300, 100, 20))
-platforms.append(Platform(2800, 350, 100, 20))
-platforms.append(Platform(3000, 400, 100, 20))
-platforms.append(Platform(3200, 350, 100, 20))
-platforms.append(Platform(3400, 300, 100, 20))
-platforms.append(Platform(3600, 350, 100, 20))
-platforms.append(Platform(3800, 400, 100, 20))
-platforms.append(Platform(4000, 450, 100, 20))
-platforms.append(Platform(4200, 400, 100, 20))
-platforms.append(Platform(4400, 350, 100, 20))
-platforms.append(Platform(4600, 400, 100, 20))
-
-# Create spikes - positioned at the same level as the ground
-spikes.append(Spike(300, HEIGHT - 40, 60))
-spikes.append(Spike(500, HEIGHT - 40, 60))
-spikes.append(Spike(700, HEIGHT - 40, 60))
-spikes.append(Spike(1500, HEIGHT - 40, 60))
-spikes.append(Spike(1700, HEIGHT - 40, 60))
-spikes.append(Spike(2500, HEIGHT - 40, 60))
-spikes.append(Spike(2700, HEIGHT - 40, 60))
-spikes.append(Spike(3500, HEIGHT - 40, 60))
-spikes.append(Spike(3700, HEIGHT - 40, 60))
-spikes.append(Spike(4500, HEIGHT - 40, 60))
-
-# Create health pickups
-health_pickups.append(HealthPickup(300, HEIGHT - 100))
-health_pickups.append(HealthPickup(800, 250))
-health_pickups.append(HealthPickup(1500, HEIGHT - 100))
-health_pickups.append(HealthPickup(2200, 350))
-health_pickups.append(HealthPickup(3000, HEIGHT - 100))
-health_pickups.append(HealthPickup(3800, 350))
-health_pickups.append(HealthPickup(4500, HEIGHT - 100))
-
-# Create enemies
-enemies.append(Enemy(500, HEIGHT - 80, "ground"))
-enemies.append(Enemy(900, HEIGHT - 80, "ground"))
-enemies.append(Enemy(1300, HEIGHT - 80, "ground"))
-enemies.append(Enemy(1700, HEIGHT - 80, "ground"))
-enemies.append(Enemy(2100, HEIGHT - 80, "ground"))
-enemies.append(Enemy(2500, 300, "flying"))
-enemies.append(Enemy(2900, 250, "flying"))
-enemies.append(Enemy(3300, 200, "flying"))
-enemies.append(Enemy(3700, 250, "flying"))
-enemies.append(Enemy(4100, 300, "flying"))
-
-# Create final boss
-boss = Enemy(4800, HEIGHT - 190, "boss")
-enemies.append(boss)
-
-# Game loop
-running = True
-while running:
-    clock.tick(FPS)
+# Level contents, built by build_level() when the game starts rather than at import
+class Level:
+    def __init__(self, name="", length=level_length):
+        self.name = name
+        self.length = length
+        self.platforms = []
+        self.spikes = []
+        self.health_pickups = []
+        self.enemies = []
+        self.boss = None
+        self.platform_grid = None
+        self.tilemap = None  # Only when built with tiles
+        self.tile_renderer = None
+        self.streamer = None  # Only when opened from a level pack
+        self.spawner = None  # Only when enemies are spawned around the camera
+        self.background = None
+        self.bullet_stamp = None
+        
+    # Pre-render the parallax background layers and sprites (needs the display)
+    def prerender(self):
+        self.background = ParallaxBackground(DARK_BLUE)
+        self.background.add_layer(ParallaxLayer(
+            make_tile(800, 100, lambda tile: pygame.draw.rect(tile, (60, 60, 90), (0, 0, 100, 100))),
+            1 / 3, HEIGHT - 100))
+        self.bullet_stamp = CircleStamp(5, YELLOW)
+        if self.tilemap is not None:
+            self.tile_renderer = TileRenderer(self.tilemap, paint_tile, WIDTH)
+
+# Tile atlas artwork: platform tiles are plain, spike tiles are the part of a
+# spike tooth given by the high bits of the tile, drawn over any platform
+def paint_tile(tile, value):
+    if value & SOLID:
+        tile.fill(BROWN)
+    if value & SPIKE:
+        size = tile.get_width()
+        x = (value >> 4 & 3) * size
+        y = (value >> 6 & 3) * size
+        pygame.draw.polygon(tile, RED, [(-x, 20 - y), (10 - x, -y), (20 - x, 20 - y)])
+
+# Build a level from its parsed level file. tiles adds a tile map of it:
+# "dense" keeps every tile decoded, "compressed" run-length encodes the tiles
+# and only decodes the ones around the camera. scheduled spawns the enemies as
+# the camera nears them (see spawning.py) instead of creating them all here.
+def build_level(data=None, tiles=None, scheduled=False):
+    if data is None:
+        data = read_level(level_files()[0])
+    level = Level(data.get("name", ""), data.get("length", level_length))
     
-    # Handle events
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_SPACE:
-                bullet = player.shoot()
-                if bullet:
-                    player_bullets.append(bullet)
-            if event.key == pygame.K_r and (game_over or level_complete):
-                # Reset game
-                player = Player(100, 100)
-                player_bullets = []
-                enemy_bullets = []
-                scroll = 0
-                game_over = False
-                level_complete = False
-                
-                # Reset enemies
-                for enemy in enemies:
-                    if enemy.type == "ground":
-                        enemy.health = 30
-                    elif enemy.type == "flying":
-                        enemy.health = 20
-                    else:
-                        enemy.health = 300
-                
-                # Reset health pickups
-                for pickup in health_pickups:
-                    pickup.collected = False
+    # Create platforms
+    for x, y, width, height in data["platforms"]:
+        level.platforms.append(Platform(x, y, width, height))
     
-    if not game_over and not level_complete:
-        # Update player
-        player.move(platforms)
+    # Index the platforms once for the batched bullet queries
+    level.platform_grid = PlatformGrid(level.platforms)
+    
+    # Create spikes
+    for x, y, width in data["spikes"]:
+        level.spikes.append(Spike(x, y, width))
+    
+    # Create health pickups
+    for x, y in data["pickups"]:
+        level.health_pickups.append(HealthPickup(x, y))
+    
+    # Create final boss, and the enemies or their spawn schedule
+    level.boss = Enemy(data["boss"][0], data["boss"][1], "boss")
+    if scheduled:
+        level.spawner = SpawnScheduler(spawn_table(data["enemies"]), Enemy, WIDTH)
+        level.spawner.freeze(level.boss)
+    else:
+        for x, y, enemy_type in data["enemies"]:
+            level.enemies.append(Enemy(x, y, enemy_type))
+        level.enemies.append(level.boss)
+    
+    if tiles == "compressed":
+        level.tilemap = TileWindow(RunLengthTileMap.from_level(level, HEIGHT), WIDTH)
+    elif tiles:
+        level.tilemap = TileMap.from_level(level, HEIGHT)
+    if level.tilemap is not None:
+        check_tile_grid(level)
+    return level
+
+# The tiles only cover the same area as the platforms, spikes and pickups when
+# they lie on the tile grid. Otherwise the tile map rounds them out to whole
+# tiles, and collisions can be up to a tile off from the rect backend's. The
+# warning points at whoever built or opened the level.
+def check_tile_grid(level):
+    if not level.tilemap.exact:
+        warnings.warn("%s: not laid out on the %d px tile grid, tile collisions may be off by up to a tile" % (
+            level.name or "level", level.tilemap.tile_size), stacklevel=3)
+
+# Open a compiled level pack (see levelpack.py). The tiles stay in the mapped
+# file and pickups and enemies are only created as the camera nears them, so
+# this costs the same for any level size.
+def open_level(pack):
+    level = Level(pack.name, pack.length)
+    level.platform_grid = PlatformGrid([])
+    level.tilemap = pack.tilemap()
+    check_tile_grid(level)
+    x, y = pack.sections["boss"][0].tolist()
+    level.boss = Enemy(x, y, "boss")
+    level.spawner = SpawnScheduler(pack.sections["enemies"], Enemy, WIDTH)
+    level.spawner.freeze(level.boss)
+    level.streamer = ChunkStreamer(pack, level, HealthPickup, WIDTH)
+    return level
+
+# Move a camera scroll so the player stays inside the scroll thresholds
+def follow_scroll(scroll, player_x, length=level_length):
+    if player_x > scroll + WIDTH - scroll_threshold:
+        scroll = player_x - (WIDTH - scroll_threshold)
+    if player_x < scroll + scroll_threshold:
+        scroll = player_x - scroll_threshold
+    if scroll < 0:
+        scroll = 0
+    if scroll > length - WIDTH:
+        scroll = length - WIDTH
+    return scroll
+
+# Player movement as a pure function: the state after one tick of keys,
+# leaving the given state alone
+def step_player(state, keys, platforms, length=level_length):
+    player = Player(0, 0)
+    player.set_state(state)
+    player.move(platforms, keys, length)
+    return player.get_state()
+
+# The rules of a tick, over any number of players. Game plays them for its
+# one player and coop.CoopGame for every player on the server. game is either:
+# it holds the level's state and both bullet pools, and hurt(player, damage,
+# cause) decides what a player's damage does.
+
+# Take damage, the player is invincible for a moment afterwards. Returns
+# whether it was fatal.
+def damage_player(player, damage, cause):
+    player.health -= damage
+    player.invincibility = 30
+    if telemetry:
+        telemetry.emit(DAMAGE, CAUSES.index(cause), damage, player.x, player.y, player.health)
+    return player.health <= 0
+
+# Collide with the tile map when there is one, the platforms otherwise
+def walls(game):
+    return game.platform_grid if game.tilemap is None else game.tilemap
+
+def move_player(game, player, keys):
+    player.move(game.platforms if game.tilemap is None else game.tilemap, keys, game.level.length)
+
+# Bring in the level around the cameras, whose views start from scroll to
+# scroll + span: decoded tiles, streamed pickups and spawned enemies
+def follow_cameras(game, scroll, span=0):
+    if game.tilemap is not None:
+        game.tilemap.follow(scroll, span)
+    if game.streamer is not None:
+        game.streamer.follow(scroll, span)
+    if game.spawner is not None:
+        game.spawner.update(scroll, game.enemies, span)
+
+# Bullets outside every camera
+def off_screen(pool, scrolls):
+    spent = np.ones(len(pool), dtype=bool)
+    for scroll in scrolls:
+        spent &= pool.off_screen(scroll, WIDTH, HEIGHT)
+    return spent
+
+# The player closest to x, enemies aim at them
+def nearest_player(players, x):
+    best, best_distance = None, None
+    for player in players:
+        distance = abs(player.x - x)
+        if best is None or distance < best_distance:
+            best, best_distance = player, distance
+    return best
+
+# Update player bullets - sweep this tick's movement against the enemies and
+# walls first so fast bullets can't pass through them between frames
+def update_player_bullets(game, scrolls):
+    enemies = game.enemies
+    player_bullets = game.player_bullets
+    targets = enemies[:]
+    hit_t, hit_index = player_bullets.sweep([enemy.get_rect() for enemy in targets])
+    wall_t, _ = player_bullets.sweep_grid(walls(game))
+    player_bullets.update()
+    
+    # Bullets that reach a wall before any enemy despawn on it
+    spent = off_screen(player_bullets, scrolls) | np.isfinite(wall_t)
+    kills = 0
+    for i in np.flatnonzero((hit_index >= 0) & (hit_t <= wall_t)):
+        enemy = targets[hit_index[i]]
+        if enemy.health <= 0:
+            continue  # Already destroyed by an earlier bullet this tick
+        enemy.health -= 10
+        spent[i] = True
+        if telemetry:
+            telemetry.emit(HIT, ENEMY_TYPES.index(enemy.type), 10, enemy.x, enemy.y, enemy.health)
+        if enemy.health <= 0:
+            enemies.remove(enemy)
+            kills += 1
+            if telemetry:
+                telemetry.emit(KILL, ENEMY_TYPES.index(enemy.type), 10, enemy.x, enemy.y, enemy.health)
+    player_bullets.remove(spent)
+    if kills:
+        tick_stats.note("enemy deaths", str(kills))
+
+# Update enemy bullets. Only the first bullet to hit a player lands, the rest
+# pass through while they are invincible.
+def update_enemy_bullets(game, players, scrolls):
+    enemy_bullets = game.enemy_bullets
+    hit_t, hit_index = enemy_bullets.sweep([player.get_rect() for player in players])
+    wall_t, _ = enemy_bullets.sweep_grid(walls(game))
+    enemy_bullets.update()
+    spent = off_screen(enemy_bullets, scrolls) | np.isfinite(wall_t)
+    for i in np.flatnonzero((hit_index >= 0) & (hit_t <= wall_t)):
+        player = players[hit_index[i]]
+        if player.invincibility == 0:
+            game.hurt(player, 10, "enemy bullet")
+            spent[i] = True
+    enemy_bullets.remove(spent)
+
+# Update enemies, each one chases and shoots at its nearest player
+def update_enemies(game, players):
+    enemy_bullets = game.enemy_bullets
+    for enemy in game.enemies:
+        target = nearest_player(players, enemy.x)
+        if target is None:
+            continue
+        enemy.update(target.x)
         
-        # Update scroll based on player position
-        if player.x > scroll + WIDTH - scroll_threshold:
-            scroll = player.x - (WIDTH - scroll_threshold)
-        if player.x < scroll + scroll_threshold:
-            scroll = player.x - scroll_threshold
-        if scroll < 0:
-            scroll = 0
-        if scroll > level_length - WIDTH:
-            scroll = level_length - WIDTH
-            
-        # Update player bullets
-        for bullet in player_bullets[:]:
-            bullet.update()
-            if bullet.is_off_screen(scroll):
-                player_bullets.remove(bullet)
-                continue
+        # Check for collision with the players using bounding boxes
+        enemy_rect = enemy.get_rect()
+        for player in players:
+            if player.invincibility == 0 and check_collision(player.get_rect(), enemy_rect):
+                game.hurt(player, 5, "enemy contact")
                 
-            # Check for collision with enemies using bounding boxes
-            for enemy in enemies[:]:
-                if check_collision(bullet.get_rect(), enemy.get_rect()):
-                    enemy.health -= 10
-                    if bullet in player_bullets:
-                        player_bullets.remove(bullet)
-                    if enemy.health <= 0:
-                        enemies.remove(enemy)
-                    break
-                    
-        # Update enemy bullets
-        for bullet in enemy_bullets[:]:
-            bullet.update()
-            if bullet.is_off_screen(scroll):
-                enemy_bullets.remove(bullet)
-                continue
+        # Enemy shooting
+        if enemy.type == "boss":
+            # The attack timer restarts when the boss switches pattern
+            if telemetry and enemy.attack_timer == 0:
+                telemetry.emit(BOSS_PATTERN, enemy.attack_pattern, 0, enemy.x, enemy.y, enemy.health)
+            bullets = enemy.shoot(target.x, target.y)
+            if bullets:
+                tick_stats.note("boss volley", "pattern %d, %d bullets" % (enemy.attack_pattern, len(bullets)))
+            enemy_bullets.extend(bullets)
+        else:
+            bullet = enemy.shoot(target.x, target.y)
+            if bullet:
+                enemy_bullets.add(bullet)
+
+# Spikes and health pickups under the players: bounding boxes, or the tiles
+# under them when there is a tile map
+def touch_level(game, players):
+    tilemap = game.tilemap
+    for player in players:
+        if tilemap is not None:
+            if tilemap.flags_in_rect(player.get_rect()) & SPIKE and player.invincibility == 0:
+                game.hurt(player, 20, "spike")
+        else:
+            for spike in game.spikes:
+                if player.invincibility == 0 and check_collision(player.get_rect(), spike.get_rect()):
+                    game.hurt(player, 20, "spike")
+        pickups = game.health_pickups if tilemap is None else tilemap.pickups_in_rect(player.get_rect())
+        for pickup in pickups:
+            if pickup.check_collision(player) and telemetry:
+                telemetry.emit(PICKUP, 0, 20, pickup.x, pickup.y, player.health)
+
+# Drawing, shared by Game and the GameSnapshot copies drawn on --threaded runs
+class GameView:
+    # Draw the parts of the frame that only change when the camera moves
+    def draw_static(self, surface):
+        scroll = self.scroll
+        
+        # Draw the background
+        self.level.background.draw(surface, scroll)
+        
+        # Draw the tiles in view, or every platform and spike
+        if self.level.tile_renderer:
+            self.level.tile_renderer.draw(surface, scroll, self.tilemap)
+        else:
+            # Draw platforms
+            for platform in self.platforms:
+                platform.draw(surface, scroll)
                 
-            # Check for collision with player using bounding boxes
-            if check_collision(bullet.get_rect(), player.get_rect()) and player.invincibility == 0:
-                player.health -= 10
-                player.invincibility = 30
-                if bullet in enemy_bullets:
-                    enemy_bullets.remove(bullet)
-                if player.health <= 0:
-                    game_over = True
-                    
-        # Update enemies
-        for enemy in enemies:
-            enemy.update(player.x)
+            # Draw spikes
+            for spike in self.spikes:
+                spike.draw(surface, scroll)
+        
+        # Draw controls help
+        text = render_text("Arrow Keys: Move | W/Up: Jump | Space: Shoot (with direction) | S/Down: Move Down", 24, WHITE)
+        surface.blit(text, (10, HEIGHT - 30))
+        
+    # Draw everything that moves, returns the rects of the status text
+    def draw(self, screen):
+        scroll = self.scroll
+        
+        # Draw health pickups
+        for pickup in self.health_pickups:
+            pickup.draw(screen, scroll)
+        
+        # Draw enemies
+        for enemy in self.enemies:
+            enemy.draw(screen, scroll)
+        
+        # Draw player bullets
+        self.player_bullets.draw(screen, scroll)
             
-            # Check for collision with player using bounding boxes
-            if check_collision(player.get_rect(), enemy.get_rect()) and player.invincibility == 0:
-                player.health -= 5
-                player.invincibility = 30
-                if player.health <= 0:
-                    game_over = True
-                    
-            # Enemy shooting
-            if enemy.type == "boss":
-                bullets = enemy.shoot(player.x, player.y)
-                enemy_bullets.extend(bullets)
+        # Draw enemy bullets
+        self.enemy_bullets.draw(screen, scroll)
+        
+        # Draw player
+        self.player.draw(screen, scroll)
+        
+        # Draw game status
+        status_rects = []
+        if self.game_over:
+            text = render_text("GAME OVER", 72, RED)
+            status_rects.append(screen.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT//2 - text.get_height()//2)))
+            
+            text = render_text("Press R to restart", 36, WHITE)
+            status_rects.append(screen.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT//2 + 50)))
+            
+        if self.level_complete:
+            text = render_text("LEVEL COMPLETE!", 72, GREEN)
+            status_rects.append(screen.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT//2 - text.get_height()//2)))
+            
+            text = render_text("Get ready for the next level" if self.has_next_level else "Press R to play again", 36, WHITE)
+            status_rects.append(screen.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT//2 + 50)))
+        return status_rects
+        
+    # Screen regions drawn by draw(), for dirty-rect rendering
+    def get_dirty_rects(self):
+        scroll = self.scroll
+        rects = []
+        for pickup in self.health_pickups:
+            rects += pickup.get_dirty_rects(scroll)
+        for enemy in self.enemies:
+            rects += enemy.get_dirty_rects(scroll)
+        rects += self.player_bullets.get_dirty_rects(scroll)
+        rects += self.enemy_bullets.get_dirty_rects(scroll)
+        rects += self.player.get_dirty_rects(scroll)
+        return rects
+
+# Game state and rules for one level
+class Game(GameView):
+    def __init__(self, level):
+        self.level = level
+        self.platforms = level.platforms
+        self.platform_grid = level.platform_grid
+        self.tilemap = level.tilemap
+        self.streamer = level.streamer
+        self.spawner = level.spawner
+        self.spikes = level.spikes
+        self.health_pickups = level.health_pickups
+        self.enemies = level.enemies
+        self.boss = level.boss
+        self.player = Player(100, 100)
+        self.player_bullets = BulletPool(radius=5, color=YELLOW)
+        self.enemy_bullets = BulletPool(radius=5, color=YELLOW)
+        self.player_bullets.stamp = self.enemy_bullets.stamp = level.bullet_stamp
+        self.scroll = 0
+        self.game_over = False
+        self.death_cause = None
+        self.level_complete = False
+        self.has_next_level = False
+        self.log_boss_pattern()
+        
+    # The boss's attack pattern as the level starts or restarts. Later changes
+    # are logged by update_enemies as the pattern switches.
+    def log_boss_pattern(self):
+        boss = self.boss
+        if telemetry:
+            telemetry.emit(BOSS_PATTERN, boss.attack_pattern, 0, boss.x, boss.y, boss.health)
+            
+    def shoot(self):
+        bullet = self.player.shoot()
+        if bullet:
+            self.player_bullets.add(bullet)
+            if telemetry:
+                telemetry.emit(SHOT, x=bullet.x, y=bullet.y)
+            
+    # Damage the player, who is invincible for a moment afterwards
+    def hurt(self, player, damage, cause):
+        if damage_player(player, damage, cause):
+            self.game_over = True
+            self.death_cause = cause
+            
+    def reset(self):
+        tick_stats.note("reset")
+        if telemetry:
+            telemetry.emit(RESET)
+        self.player = Player(100, 100)
+        self.player_bullets.clear()
+        self.enemy_bullets.clear()
+        self.scroll = 0
+        self.game_over = False
+        self.death_cause = None
+        self.level_complete = False
+        
+        # Reset enemies, frozen ones too
+        for enemy in self.enemies if self.spawner is None else self.spawner.living(self.enemies):
+            if enemy.type == "ground":
+                enemy.health = 30
+            elif enemy.type == "flying":
+                enemy.health = 20
             else:
-                bullet = enemy.shoot(player.x, player.y)
-                if bullet:
-                    enemy_bullets.append(bullet)
-                    
-        # Check for collision with spikes using bounding boxes
-        for spike in spikes:
-            spike_rect = spike.get_rect()
+                enemy.health = 300
+        
+        # Reset health pickups
+        for pickup in self.health_pickups:
+            pickup.collected = False
+        self.log_boss_pattern()
             
-            # Check if player is touching the spike
-            if check_collision(player.get_rect(), spike_rect) and player.invincibility == 0:
-                player.health -= 20
-                player.invincibility = 30
-                if player.health <= 0:
-                    game_over = True
-                    
-        # Check for health pickups
-        for pickup in health_pickups:
-            pickup.check_collision(player)
+    # Advance the simulation by one tick
+    def update(self, keys):
+        if self.game_over or self.level_complete:
+            return
+        player = self.player
+        follow_cameras(self, self.scroll)
+        
+        # Update player
+        move_player(self, player, keys)
+        
+        # Update scroll based on player position
+        self.scroll = follow_scroll(self.scroll, player.x, self.level.length)
+        
+        players = [player]
+        scrolls = [self.scroll]
+        update_player_bullets(self, scrolls)
+        update_enemy_bullets(self, players, scrolls)
+        update_enemies(self, players)
+        touch_level(self, players)
                     
         # Check if boss is defeated
-        if boss not in enemies and not level_complete:
-            level_complete = True
-    
-    # Draw everything
-    screen.fill(DARK_BLUE)  # Background color
-    
-    # Draw a simple background
-    for i in range(10):
-        pygame.draw.rect(screen, (60, 60, 90), (i * 800 - scroll // 3 % 800, HEIGHT - 100, 100, 100))
-    
-    # Draw platforms
-    for platform in platforms:
-        platform.draw(screen, scroll)
+        if self.boss.health <= 0 and not self.level_complete:
+            self.level_complete = True
+
+# An immutable copy of what GameView draws, taken at the end of a tick. The
+# level geometry is shared, it doesn't change while playing. A TileWindow
+# moves on as the game follows the camera, so the tile map is copied with the
+# window it has now.
+class GameSnapshot(GameView):
+    def __init__(self, game):
+        self.level = game.level
+        self.platforms = game.platforms
+        self.spikes = game.spikes
+        self.tilemap = copy.copy(game.tilemap)
+        self.scroll = game.scroll
+        self.health_pickups = [copy.copy(pickup) for pickup in game.health_pickups if not pickup.collected]
+        self.enemies = [copy.copy(enemy) for enemy in game.enemies]
+        self.player = copy.copy(game.player)
+        self.player_bullets = game.player_bullets.copy()
+        self.enemy_bullets = game.enemy_bullets.copy()
+        self.game_over = game.game_over
+        self.level_complete = game.level_complete
+        self.has_next_level = game.has_next_level
+
+def parse_options(argv=None):
+    parser = argparse.ArgumentParser(description="Metroidvania Platformer")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="only push changed screen regions while the camera is still")
+    parser.add_argument("--frame-stats", action="store_true",
+                        help="track GC passes too and print a frame time and hitch summary at exit")
+    parser.add_argument("--headless", action="store_true",
+                        help="run the simulation without initializing any pygame subsystem")
+    parser.add_argument("--ticks", type=int, default=600,
+                        help="ticks to simulate in headless mode")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="print how long each startup step took")
+    parser.add_argument("--surface-budget-mb", type=float, default=16,
+                        help="memory budget of the sprite and text cache")
+    parser.add_argument("--memory-profile", action="store_true",
+                        help="trace allocations and print a memory report at exit (slow)")
+    parser.add_argument("--memory-interval", type=int, default=600,
+                        help="frames between memory samples")
+    parser.add_argument("--tilemap", nargs="?", const="dense", choices=["dense", "compressed"],
+                        help="collide with and draw a tile map of the level instead of its platforms")
+    parser.add_argument("--spawn-all", action="store_true",
+                        help="create every enemy when the level starts instead of as the camera nears it")
+    parser.add_argument("--level-pack", nargs="+", metavar="PATH",
+                        help="play these compiled level packs (see levelpack.py) instead of the level files")
+    parser.add_argument("--threaded", action="store_true",
+                        help="run the simulation on its own thread and draw from its snapshots")
+    parser.add_argument("--telemetry", metavar="PATH",
+                        help="log gameplay events and frame times to this file (see telemetry.py)")
+    options = parser.parse_args(argv)
+    if options.headless and options.threaded:
+        parser.error("--threaded splits simulation from drawing, there is nothing to draw with --headless")
+    return options
+
+# Load a level on the campaign's worker thread: parse, build and pre-render it
+def load_level(data, tiles=None, scheduled=False):
+    level = build_level(data, tiles, scheduled)
+    level.prerender()
+    return level
+
+# Open a level pack on the campaign's worker thread and pre-render it
+def load_pack(pack):
+    level = open_level(pack)
+    level.prerender()
+    return level
+
+# Start playing a level, carrying the player's health over from the previous one
+def start_level(level, previous=None, index=0):
+    tick_stats.note("level switch", level.name)
+    if telemetry:
+        telemetry.emit(LEVEL, value=index)
+    game = Game(level)
+    if previous:
+        game.player.health = previous.player.health
+    return game
+
+# The campaign's current game, moved along by key presses and ticks from level
+# to level. Played on the main thread, or on the sim thread with --threaded.
+class Session:
+    def __init__(self, campaign):
+        self.campaign = campaign
+        self.banner_ticks = 0
+        self.switch(campaign.start())
         
-    # Draw spikes
-    for spike in spikes:
-        spike.draw(screen, scroll)
+    def switch(self, level, previous=None):
+        self.game = start_level(level, previous, self.campaign.index)
+        self.game.has_next_level = not self.campaign.is_last()
         
-    # Draw health pickups
-    for pickup in health_pickups:
-        pickup.draw(screen, scroll)
-    
-    # Draw enemies
-    for enemy in enemies:
-        enemy.draw(screen, scroll)
+    def press(self, key):
+        game = self.game
+        if key == pygame.K_SPACE:
+            game.shoot()
+        if key == pygame.K_r and game.game_over:
+            game.reset()
+        elif key == pygame.K_r and game.level_complete and self.campaign.is_last():
+            # Play the campaign again from the first level
+            self.switch(self.campaign.advance())
+            
+    def tick(self, keys):
+        game = self.game
+        game.update(keys)
+        
+        # Move on to the preloaded next level once the banner has been shown
+        if game.level_complete and game.has_next_level:
+            self.banner_ticks += 1
+            if self.banner_ticks >= LEVEL_BANNER_TICKS:
+                self.banner_ticks = 0
+                self.switch(self.campaign.advance(), game)
+
+# One tick on the sim thread, returns the snapshot the main thread draws.
+# Telemetry frames and memory samples are per tick there.
+def simulate_tick(session, memory_profiler, keys, presses):
+    tick_stats.start_frame()
+    for key in presses:
+        session.press(key)
+    session.tick(NO_KEYS if keys is None else keys)
+    duration = tick_stats.end_frame()
+    if telemetry:
+        telemetry.end_frame(duration)
+    if memory_profiler:
+        memory_profiler.tick(session.game)
+    return GameSnapshot(session.game)
+
+# The sim thread's tick rate and times, and the hitches among its ticks
+def sim_lines(sim):
+    return sim.stats_lines() + ["sim hitches %d / %d" % (tick_stats.hitch_count, tick_stats.histogram.total)]
+
+# Write out what is left of the telemetry log
+def close_telemetry():
+    global telemetry
+    if telemetry:
+        telemetry.close()
+        if telemetry.dropped:
+            print("telemetry: %d of %d records dropped" % (telemetry.dropped, telemetry.emitted))
+        telemetry = None
+
+# Times each startup step since the previous one
+class StartupTimer:
+    def __init__(self, begin):
+        self.last = begin
+        self.steps = []
+        
+    def step(self, name):
+        now = time.perf_counter()
+        self.steps.append((name, now - self.last))
+        self.last = now
+        
+    def report(self):
+        lines = ["startup:"]
+        for name, seconds in self.steps:
+            lines.append("  %-20s %8.2f ms" % (name, seconds * 1000))
+        lines.append("  %-20s %8.2f ms" % ("total", sum(seconds for _, seconds in self.steps) * 1000))
+        return "\n".join(lines)
+
+def main(argv=None):
+    global telemetry
+    startup = StartupTimer(startup_begin)
+    startup.step("imports")
+    options = parse_options(argv)
+    surface_cache.set_budget(int(options.surface_budget_mb * 1024 * 1024))
+    if options.frame_stats:
+        frame_stats.install_gc_hook()
+    if options.telemetry:
+        telemetry = TelemetryWriter(options.telemetry)
+    memory_profiler = None
+    if options.memory_profile:
+        memory_profiler = MemoryProfiler(surface_cache, options.memory_interval)
+        memory_profiler.start()
+    try:
+        play(options, startup, memory_profiler)
+    finally:
+        if memory_profiler:
+            memory_profiler.stop()
+
+# Run the game headless or in a window until it's closed, then print the reports
+def play(options, startup, memory_profiler):
+    global tick_stats
     
-    # Draw player bullets
-    for bullet in player_bullets:
-        bullet.draw(screen, scroll)
+    # Headless runs only simulate, so no pygame subsystem is started at all
+    if options.headless:
+        if options.level_pack:
+            game = Game(open_level(LevelPack(options.level_pack[0])))
+        else:
+            game = Game(build_level(tiles=options.tilemap, scheduled=not options.spawn_all))
+        startup.step("build level")
+        if options.startup_report:
+            print(startup.report())
+        for _ in range(options.ticks):
+            frame_stats.start_frame()
+            game.update(NO_KEYS)
+            duration = frame_stats.end_frame()
+            if telemetry:
+                telemetry.end_frame(duration)
+            if memory_profiler:
+                memory_profiler.tick(game)
+        if options.frame_stats:
+            frame_stats.remove_gc_hook()
+            print(frame_stats.summary())
+        if memory_profiler:
+            print(memory_profiler.report())
+        close_telemetry()
+        return
         
-    # Draw enemy bullets
-    for bullet in enemy_bullets:
-        bullet.draw(screen, scroll)
+    # Only the display and font modules are used
+    pygame.display.init()
+    pygame.font.init()
+    startup.step("pygame init")
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Metroidvania Platformer")
+    startup.step("display")
+    
+    # The first level is built right away, the next one on a worker thread
+    if options.level_pack:
+        campaign = Campaign(options.level_pack, load_pack, LevelPack)
+    else:
+        campaign = Campaign(level_files(), functools.partial(load_level, tiles=options.tilemap,
+                                                               scheduled=not options.spawn_all))
+    session = Session(campaign)
+    startup.step("load level")
     
-    # Draw player
-    player.draw(screen, scroll)
+    clock = pygame.time.Clock()
+    stats_overlay = StatsOverlay()
     
-    # Draw game status
-    if game_over:
-        font = pygame.font.SysFont(None, 72)
-        text = font.render("GAME OVER", True, RED)
-        screen.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT//2 - text.get_height()//2))
-        
-        font = pygame.font.SysFont(None, 36)
-        text = font.render("Press R to restart", True, WHITE)
-        screen.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT//2 + 50))
-        
-    if level_complete:
-        font = pygame.font.SysFont(None, 72)
-        text = font.render("LEVEL COMPLETE!", True, GREEN)
-        screen.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT//2 - text.get_height()//2))
-        
-        font = pygame.font.SysFont(None, 36)
-        text = font.render("Press R to play again", True, WHITE)
-        screen.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT//2 + 50))
+    # Only push changed regions to the display when asked to
+    dirty_renderer = DirtyRectRenderer(screen) if options.dirty_rects else None
+    
+    # With --threaded the game runs on the sim thread and frames are drawn
+    # from the latest snapshot it published
+    sim = None
+    if options.threaded:
+        tick_stats = HitchDetector(budget_ms=1000 / FPS)
+        sim = SimulationThread(functools.partial(simulate_tick, session, memory_profiler), FPS)
+        sim.start(GameSnapshot(session.game))
+    
+    # Game loop
+    running = True
+    first_frame = True
+    drawn_level = session.game.level
+    while running:
+        clock.tick(FPS)
+        frame_stats.start_frame()
+        
+        # Handle events
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_F3:
+                    stats_overlay.toggle()
+                elif sim:
+                    sim.post(event.key)
+                else:
+                    session.press(event.key)
+        
+        if sim:
+            sim.check()
+            sim.keys = pygame.key.get_pressed()
+            view, _ = sim.snapshot.latest()
+        else:
+            session.tick(pygame.key.get_pressed())
+            view = session.game
+        
+        # A new level needs its static layer drawn
+        if view.level is not drawn_level:
+            drawn_level = view.level
+            if dirty_renderer:
+                dirty_renderer.invalidate()
+        
+        # Draw everything, reusing the static layer while the camera is still
+        if dirty_renderer:
+            dirty_renderer.begin(view.scroll, view.draw_static)
+        else:
+            view.draw_static(screen)
+        status_rects = view.draw(screen)
+        
+        # Draw frame statistics
+        status_rects += stats_overlay.draw(screen, detector_lines(frame_stats, clock.get_fps())
+                                          + surface_cache.stats_lines() + (sim_lines(sim) if sim else []))
+        
+        # Update display
+        if dirty_renderer:
+            dirty_renderer.mark_all(view.get_dirty_rects())
+            dirty_renderer.mark_all(status_rects)
+            dirty_renderer.end()
+        else:
+            pygame.display.flip()
+        duration = frame_stats.end_frame()
+        if telemetry and not sim:
+            telemetry.end_frame(duration)
+        if memory_profiler and not sim:
+            memory_profiler.tick(session.game)
+        
+        if first_frame:
+            first_frame = False
+            startup.step("first frame")
+            if options.startup_report:
+                print(startup.report())
     
-    # Draw controls help
-    font = pygame.font.SysFont(None, 24)
-    text = font.render("Arrow Keys: Move | W/Up: Jump | Space: Shoot (with direction) | S/Down: Move Down", True, WHITE)
-    screen.blit(text, (10, HEIGHT - 30))
+    if sim:
+        sim.stop()
+    campaign.close()
+    if options.frame_stats:
+        frame_stats.remove_gc_hook()
+        print(frame_stats.summary())
+        if sim:
+            print("simulation ticks:")
+            print(tick_stats.summary())
+    if memory_profiler:
+        print(memory_profiler.report())
+    close_telemetry()
     
-    # Update display
-    pygame.display.flip()
+    pygame.quit()
 
-pygame.quit()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Batched drawing of many identical small sprites (bullets, particles, ...).
+#
+# The sprite is rendered once with the same pygame.draw call the game would use
+# per object, then stamped at every position in a single Surface.blits() call.
+# For very large counts the stamp is written straight into the screen pixels
+# with NumPy through pygame.surfarray instead.
+import numpy as np
+import pygame
+
+# Above this many sprites per call the surfarray path is used
+SURFARRAY_THRESHOLD = 5000
+
+
+class CircleStamp:
+    def __init__(self, radius, color, colorkey=(255, 0, 255)):
+        self.radius = radius
+        self.color = color
+
+        # Render the circle exactly as pygame.draw.circle would at (radius * 2, radius * 2)
+        size = radius * 4
+        centre = radius * 2
+        scratch = pygame.Surface((size, size))
+        scratch.fill(colorkey)
+        bounds = pygame.draw.circle(scratch, color, (centre, centre), radius)
+        self.sprite = scratch.subsurface(bounds).copy()
+        if pygame.display.get_surface():
+            self.sprite = self.sprite.convert()
+        self.sprite.set_colorkey(colorkey, pygame.RLEACCEL)
+        self.offset = (bounds.x - centre, bounds.y - centre)
+
+        # Pixel offsets of the circle relative to its centre, for the surfarray stamp
+        mask = pygame.mask.from_surface(self.sprite)
+        cols, rows = np.nonzero(np.array([[mask.get_at((x, y)) for y in range(bounds.height)]
+                                          for x in range(bounds.width)]))
+        self.pixel_dx = cols + self.offset[0]
+        self.pixel_dy = rows + self.offset[1]
+
+    # Draw a sprite centred on every (x, y), shifted left by scroll
+    def draw(self, surface, x, y, scroll=0):
+        count = len(x)
+        if count == 0:
+            return
+        # Truncate like int() would for the per-object draw call
+        cx = (np.asarray(x) - scroll).astype(np.intp)
+        cy = np.asarray(y).astype(np.intp)
+        if count >= SURFARRAY_THRESHOLD and surface.get_bytesize() == 4:
+            self._stamp_pixels(surface, cx, cy)
+        else:
+            sprite = self.sprite
+            left = (cx + self.offset[0]).tolist()
+            top = (cy + self.offset[1]).tolist()
+            surface.blits([(sprite, (lx, ty)) for lx, ty in zip(left, top)], doreturn=False)
+
+    # Mark every centre in a coverage image, dilate it by the circle's pixel
+    # offsets and fill the covered pixels in one go. The cost depends on the
+    # screen size rather than the sprite count, so it wins for huge counts.
+    def _stamp_pixels(self, surface, cx, cy):
+        clip = surface.get_clip()
+        pad = self.radius * 2
+        width, height = clip.width + pad * 2, clip.height + pad * 2
+        gx = cx - clip.left + pad
+        gy = cy - clip.top + pad
+        keep = (gx >= 0) & (gx < width) & (gy >= 0) & (gy < height)
+        centres = np.zeros((width, height), dtype=bool)
+        centres[gx[keep], gy[keep]] = True
+
+        covered = np.zeros((clip.width, clip.height), dtype=bool)
+        for dx, dy in zip(self.pixel_dx.tolist(), self.pixel_dy.tolist()):
+            covered |= centres[pad - dx:pad - dx + clip.width, pad - dy:pad - dy + clip.height]
+
+        pixels = pygame.surfarray.pixels2d(surface)
+        pixels[clip.left:clip.right, clip.top:clip.bottom][covered] = surface.map_rgb(self.color)
+        del pixels  # Unlock the surface
@@ -0,0 +1,105 @@
+# Scripted bot behaviours, shared by every tool that plays without a person:
+# the load-test bots (bots.py), the network simulator (netsim.py), the
+# prediction benchmark (prediction_bench.py) and the playtest sessions
+# (playtest.py).
+#
+# A behaviour is called once per tick as behaviour(bot, tick, view) and returns
+# input bits (see coop.py). bot keeps the behaviour's state between ticks: rng,
+# a random.Random, and memory, a dict the behaviour may keep anything in.
+# view is what the bot sees, a decoded snapshot for a network client or the
+# Game itself when playing locally. BEHAVIOURS only look at the tick;
+# GAME_BEHAVIOURS adds the ones that read the Game.
+import random
+
+from coop import DOWN, LEFT, RIGHT, SHOOT, UP, load_game
+
+
+# Behaviour state for callers that have no bot object of their own
+class BotState:
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.memory = {}
+
+
+# Run right, jumping every 40 ticks and shooting every 10
+def run_and_gun(bot, tick, view):
+    return RIGHT | (UP if tick % 40 == 0 else 0) | (SHOOT if tick % 10 == 0 else 0)
+
+
+# A random direction every 15 ticks, shooting now and then
+def wander(bot, tick, view):
+    if tick % 15 == 0:
+        bot.memory["held"] = bot.rng.choice((0, LEFT, RIGHT, RIGHT | UP, LEFT | UP, DOWN))
+    return bot.memory.get("held", 0) | (SHOOT if bot.rng.random() < 0.1 else 0)
+
+
+def idle(bot, tick, view):
+    return 0
+
+
+# Random directions held for 10 to 40 ticks, shooting often
+def random_policy(bot, tick, view):
+    memory = bot.memory
+    if tick >= memory.get("until", 0):
+        memory["held"] = bot.rng.choice((0, LEFT, RIGHT, RIGHT, RIGHT | UP, LEFT | UP, UP, DOWN))
+        memory["until"] = tick + bot.rng.randint(10, 40)
+    return memory["held"] | (SHOOT if bot.rng.random() < 0.2 else 0)
+
+
+def run_and_shoot(bot, tick, view):
+    return RIGHT | SHOOT | (UP if tick % 40 == 0 else 0)
+
+
+# Spikes between the player and this far ahead, in the tiles when the level has them
+def spike_ahead(game, distance):
+    player = game.player
+    front = player.x + player.width
+    if game.tilemap is not None:
+        module = load_game()
+        return bool(game.tilemap.flags_in_rect((player.x, 0, front + distance - player.x, module.HEIGHT))
+                    & module.SPIKE)
+    return any(spike.x < front + distance and spike.x + spike.width > player.x for spike in game.spikes)
+
+
+# Whether an enemy bullet will reach the player within the given ticks
+def bullet_incoming(game, ticks):
+    player = game.player
+    pool = game.enemy_bullets
+    count = len(pool)
+    if not count:
+        return False
+    x = pool.x[:count] + pool.vel_x[:count] * ticks
+    y = pool.y[:count] + pool.vel_y[:count] * ticks
+    return bool(((x > player.x - 10) & (x < player.x + player.width + 10)
+                 & (y > player.y) & (y < player.y + player.height)).any())
+
+
+# Run right jumping over spikes and incoming bullets; at the boss keep it on
+# screen (off-screen bullets are dropped) at a distance that depends on its
+# attack pattern, dodge its shots and turn to face it whenever a shot is ready
+def boss_strategy(bot, tick, game):
+    player = game.player
+    boss = game.boss
+    if not player.is_jumping and spike_ahead(game, 40):
+        return RIGHT | UP | SHOOT
+    dodge = UP if not player.is_jumping and bullet_incoming(game, 8) else 0
+    distance = boss.x - player.x
+    if boss not in game.enemies or distance > 500:
+        return RIGHT | SHOOT | dodge
+
+    # Circle shots fill the screen, hang back from those
+    low = 300 if boss.attack_pattern == 2 else 160
+    in_view = boss.x + 40 < game.scroll + load_game().WIDTH
+    bits = SHOOT
+    if player.shoot_cooldown <= 1:
+        bits |= RIGHT
+    elif distance < low:
+        bits |= LEFT
+    elif not in_view or distance > low + 150:
+        bits |= RIGHT
+    return bits | dodge
+
+
+BEHAVIOURS = {"run-and-gun": run_and_gun, "wander": wander, "idle": idle, "random": random_policy,
+              "run-and-shoot": run_and_shoot}
+GAME_BEHAVIOURS = dict(BEHAVIOURS, boss=boss_strategy)
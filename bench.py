@@ -0,0 +1,304 @@
+# Benchmark suite comparing the game scripts.
+#
+# Every variant is run headless (see headless.py) on the same standard scenarios,
+# each in a fresh subprocess so memory numbers aren't shared between runs.
+# Results are written as JSON and summarised as a comparison table.
+#
+#   python bench.py                                   # all variants, all scenarios
+#   python bench.py --variants 2D_game_V4.py --scenarios boss-fight --ticks 2000
+#   python bench.py --rev HEAD~3 --output old.json    # variants from another commit
+#   python bench.py --trace my_trace.json             # replay a recorded input trace
+#   python bench.py compare old.json new.json         # table across result files
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+VARIANTS = [
+    "2D_platform_shooter.py",
+    "2D_platform_shooter_V2.py",
+    "2D_game_V3.py",
+    "2D_game_V4.py",
+]
+
+DEFAULT_TICKS = 1200
+
+
+# Helper function to add a bullet to a script's bullet list or BulletPool
+def add_bullet(ns, container, x, y, vel_x, vel_y):
+    bullets = ns[container]
+    if hasattr(bullets, "spawn"):
+        bullets.spawn(x, y, vel_x, vel_y)
+    else:
+        bullets.append(ns["Bullet"](x, y, vel_x, vel_y))
+
+
+# Keep the player alive so the simulation keeps running for every tick
+def keep_alive(ns):
+    ns["player"].health = ns["player"].max_health = 10 ** 9
+
+
+# Standard scenarios. Each one has an input pattern and optional setup/on_tick hooks
+class Scenario:
+    def __init__(self, name, held=lambda tick: (), pressed=lambda tick: (), setup=None, on_tick=None):
+        self.name = name
+        self.held = held
+        self.pressed = pressed
+        self.setup = setup
+        self.on_tick = on_tick
+
+    def trace(self, ticks):
+        import headless
+        import pygame
+        return [headless.TraceFrame([getattr(pygame, key) for key in self.held(tick)],
+                                    [getattr(pygame, key) for key in self.pressed(tick)])
+                for tick in range(ticks)]
+
+
+def _boss_setup(ns):
+    keep_alive(ns)
+    ns["player"].x = 4400
+    ns["player"].y = ns["HEIGHT"] - 90
+
+
+def _storm_on_tick(size):
+    rng = random.Random(1234)
+
+    def on_tick(ns, tick):
+        scroll = ns["scroll"]
+        # Top the storm back up to its size every tick
+        for _ in range(size - len(ns["enemy_bullets"])):
+            speed = rng.uniform(2, 8)
+            angle = rng.uniform(0, 2 * math.pi)
+            add_bullet(ns, "enemy_bullets",
+                       rng.uniform(scroll, scroll + ns["WIDTH"]), rng.uniform(0, ns["HEIGHT"] - 60),
+                       speed * math.cos(angle), speed * math.sin(angle))
+
+    return on_tick
+
+
+SCENARIOS = {
+    "idle": Scenario("idle", setup=keep_alive),
+    "run-through": Scenario(
+        "run-through",
+        held=lambda tick: ("K_RIGHT",) + (("K_UP",) if tick % 45 < 3 else ()),
+        pressed=lambda tick: ("K_SPACE",) if tick % 10 == 0 else (),
+        setup=keep_alive),
+    "boss-fight": Scenario(
+        "boss-fight",
+        held=lambda tick: ("K_UP",) if tick % 60 < 3 else (),
+        pressed=lambda tick: ("K_SPACE",) if tick % 8 == 0 else (),
+        setup=_boss_setup),
+    "bullet-storm": Scenario("bullet-storm", setup=keep_alive, on_tick=_storm_on_tick(500)),
+}
+
+
+# Percentile of a sorted list
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    index = min(int(round(fraction * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+# Run one variant/scenario in this process and summarise it
+def run_one(path, scenario_name, ticks, trace_file=None, use_tracemalloc=False):
+    import headless
+    scenario = SCENARIOS[scenario_name]
+    if trace_file:
+        with open(trace_file) as f:
+            trace = headless.trace_from_json(json.load(f)["frames"])
+    else:
+        trace = scenario.trace(ticks)
+
+    if use_tracemalloc:
+        tracemalloc.start()
+    result = headless.run_script(path, ticks, trace, scenario.setup, scenario.on_tick)
+    memory = {"peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    if use_tracemalloc:
+        memory["tracemalloc_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    memory["live_blocks_delta"] = result["live_blocks_delta"]
+    memory["gc_collections"] = result["gc_collections"]
+
+    frames = sorted(result["frame_times"])
+    total = sum(frames)
+    count = max(len(frames), 1)
+    return {
+        "variant": os.path.basename(path),
+        "scenario": scenario_name,
+        "ticks": len(frames),
+        "ticks_per_sec": len(frames) / total if total else 0.0,
+        "frame_ms": {
+            "mean": total / count * 1000,
+            "p50": percentile(frames, 0.50) * 1000,
+            "p95": percentile(frames, 0.95) * 1000,
+            "p99": percentile(frames, 0.99) * 1000,
+            "max": (frames[-1] if frames else 0.0) * 1000,
+        },
+        "phases_ms_per_tick": {phase: seconds / count * 1000
+                               for phase, seconds in result["phases_s"].items()},
+        "memory": memory,
+    }
+
+
+# Run one variant/scenario in a fresh interpreter and return its result dict
+def run_isolated(path, scenario_name, ticks, trace_file=None, use_tracemalloc=False):
+    command = [sys.executable, os.path.abspath(__file__), "_run", path, scenario_name, str(ticks)]
+    if trace_file:
+        command += ["--trace", trace_file]
+    if use_tracemalloc:
+        command.append("--tracemalloc")
+    output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=os.path.dirname(path))
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def git_revision(root, rev="HEAD"):
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", rev], cwd=root, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# Export a commit's tree to a temporary directory so its variants can be run
+def checkout_revision(rev):
+    directory = tempfile.mkdtemp(prefix="bench-")
+    archive = subprocess.run(["git", "archive", rev], cwd=ROOT, check=True, capture_output=True).stdout
+    subprocess.run(["tar", "-x", "-C", directory], input=archive, check=True)
+    return directory
+
+
+def format_table(results, label_key="variant"):
+    scenarios = sorted({r["scenario"] for r in results}, key=list(SCENARIOS).index)
+    labels = []
+    for r in results:
+        if r[label_key] not in labels:
+            labels.append(r[label_key])
+    width = max([len(label) for label in labels] + [10])
+    lines = ["ticks/sec".ljust(width) + "".join(s.rjust(14) for s in scenarios)]
+    for label in labels:
+        row = label.ljust(width)
+        for scenario in scenarios:
+            match = [r for r in results if r[label_key] == label and r["scenario"] == scenario]
+            row += ("%.1f" % match[0]["ticks_per_sec"]).rjust(14) if match else "-".rjust(14)
+        lines.append(row)
+    return "\n".join(lines)
+
+
+def format_phases(results):
+    from headless import PHASE_ORDER
+    lines = ["ms/tick".ljust(36) + "".join(p.rjust(9) for p in PHASE_ORDER)]
+    for r in results:
+        label = "%s %s" % (r["variant"], r["scenario"])
+        lines.append(label.ljust(36) + "".join(("%.3f" % r["phases_ms_per_tick"][p]).rjust(9)
+                                               for p in PHASE_ORDER))
+    return "\n".join(lines)
+
+
+def run_suite(variants, scenarios, ticks, rev=None, trace_file=None, use_tracemalloc=False):
+    root = ROOT
+    if rev:
+        root = checkout_revision(rev)
+    try:
+        results = []
+        for variant in variants:
+            path = os.path.join(root, variant)
+            if not os.path.exists(path):
+                print("skipping %s (not in this tree)" % variant, file=sys.stderr)
+                continue
+            for scenario in scenarios:
+                result = run_isolated(path, scenario, ticks, trace_file, use_tracemalloc)
+                print("%-28s %-14s %8.1f ticks/sec" % (variant, scenario, result["ticks_per_sec"]),
+                      file=sys.stderr)
+                results.append(result)
+    finally:
+        if rev:
+            shutil.rmtree(root, ignore_errors=True)
+
+    import pygame
+    return {
+        "meta": {
+            "commit": git_revision(ROOT, rev or "HEAD"),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "ticks": ticks,
+        },
+        "results": results,
+    }
+
+
+def compare(files):
+    results = []
+    seen = set()
+    for name in files:
+        with open(name) as f:
+            data = json.load(f)
+        # Label rows by commit, or by file when two runs come from the same commit
+        source = data["meta"]["commit"]
+        if source in seen:
+            source = os.path.basename(name)
+        seen.add(source)
+        for r in data["results"]:
+            r = dict(r)
+            r["label"] = "%s@%s" % (r["variant"], source)
+            results.append(r)
+    print(format_table(results, "label"))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "compare":
+        compare(argv[1:])
+        return 0
+
+    if argv and argv[0] == "_run":
+        parser = argparse.ArgumentParser()
+        parser.add_argument("path")
+        parser.add_argument("scenario")
+        parser.add_argument("ticks", type=int)
+        parser.add_argument("--trace")
+        parser.add_argument("--tracemalloc", action="store_true")
+        args = parser.parse_args(argv[1:])
+        result = run_one(args.path, args.scenario, args.ticks, args.trace, args.tracemalloc)
+        print(json.dumps(result))
+        return 0
+
+    parser = argparse.ArgumentParser(description="Benchmark the game variants headless")
+    parser.add_argument("--variants", nargs="+", default=VARIANTS)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--ticks", type=int, default=DEFAULT_TICKS)
+    parser.add_argument("--rev", help="benchmark the variants as of this git revision")
+    parser.add_argument("--trace", help="JSON input trace to replay instead of the scenario input")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="also report the tracemalloc peak (slows the run down)")
+    parser.add_argument("--output", help="write the JSON results here")
+    parser.add_argument("--phases", action="store_true", help="print the per-phase breakdown")
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.variants, args.scenarios, args.ticks, args.rev, args.trace, args.tracemalloc)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(format_table(report["results"]))
+    if args.phases:
+        print()
+        print(format_phases(report["results"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+# Headless bot clients for load-testing the co-op server.
+#
+# Starts the server in a subprocess (or uses one that is already running),
+# connects N bots over UDP or TCP and lets them play: each bot answers every
+# snapshot with its next input, like a real client running at the server's tick
+# rate. At the end the server's tick statistics are printed together with what
+# the bots saw: snapshot rate and gaps, bandwidth and the input round trip (from
+# sending an input until a snapshot says the server applied it). With
+# --predict every bot also predicts its own player (prediction.py) and reports
+# how often the server corrected it. Decoding snapshots takes real CPU, so with
+# many bots spread them over a few processes.
+#
+#   python bots.py --players 32                       # 32 UDP bots for 10 s
+#   python bots.py --players 64 --transport tcp --seconds 20 --processes 4
+#   python bots.py --players 16 --connect             # server already running
+#   python bots.py --players 8 --behaviour wander --predict
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import random
+import sys
+import time
+
+import protocol
+from behaviours import BEHAVIOURS
+from bench import percentile
+from coop import load_game
+from prediction import Predictor
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+HELLO_RETRY_S = 0.5
+
+
+class Bot:
+    def __init__(self, behaviour, seed=0, predictor=None):
+        self.behaviour = behaviour
+        self.predictor = predictor
+        self.rng = random.Random(seed)
+        self.memory = {}  # The behaviour's state
+        self.send = None
+        self.player_id = None
+        self.sequence = 0
+        self.receiver = protocol.SnapshotReceiver()
+        self.snapshot = None
+        self.sent_at = {}  # Input sequence -> send time, until the server applies it
+        self.round_trips = []
+        self.gaps = []
+        self.snapshots = 0
+        self.bytes = 0
+        self.last_arrival = None
+
+    def on_message(self, data):
+        kind = protocol.message_type(data)
+        if kind == protocol.WELCOME:
+            if self.player_id is None:
+                self.player_id, _ = protocol.decode_welcome(data)
+        elif kind == protocol.SNAPSHOT:
+            self.on_snapshot(data)
+
+    def on_snapshot(self, data):
+        now = time.perf_counter()
+        if self.last_arrival is not None:
+            self.gaps.append(now - self.last_arrival)
+        self.last_arrival = now
+        self.snapshots += 1
+        self.bytes += len(data)
+        snapshot = self.receiver.decode(data)
+        if snapshot is None:
+            return  # Late, duplicate or its baseline is gone
+        self.snapshot = snapshot
+        sent = self.sent_at.pop(snapshot.input_sequence, None)
+        if sent is not None:
+            self.round_trips.append(now - sent)
+        for sequence in [s for s in self.sent_at if s < snapshot.input_sequence]:
+            del self.sent_at[sequence]
+        if self.predictor:
+            self.predictor.reconcile(snapshot)
+
+        self.sequence += 1
+        self.sent_at[self.sequence] = now
+        bits = self.behaviour(self, snapshot.tick, snapshot)
+        self.send(protocol.encode_input(self.sequence, snapshot.tick, bits))
+        if self.predictor:
+            self.predictor.apply(self.sequence, bits)
+
+    # Say hello until the server welcomes us
+    async def join(self):
+        while self.player_id is None:
+            self.send(protocol.encode_hello())
+            await asyncio.sleep(HELLO_RETRY_S)
+
+    def leave(self):
+        self.send(protocol.encode_bye())
+
+    # What the report needs, small enough to send back from a worker process
+    def result(self):
+        predictor = self.predictor
+        return {
+            "joined": self.player_id is not None,
+            "snapshots": self.snapshots,
+            "bytes": self.bytes,
+            "gaps": self.gaps,
+            "round_trips": self.round_trips,
+            "missing_baseline": self.receiver.missing_baseline,
+            "reconciled": predictor.reconciled if predictor else 0,
+            "corrections": predictor.corrections if predictor else 0,
+            "replay_times": predictor.replay_times if predictor else [],
+        }
+
+
+class _BotDatagram(asyncio.DatagramProtocol):
+    def __init__(self, bot):
+        self.bot = bot
+
+    def datagram_received(self, data, addr):
+        self.bot.on_message(data)
+
+    def error_received(self, exc):
+        pass  # The server went away, the harness is about to stop
+
+
+# Connect a bot over UDP, returns a function that closes the socket
+async def connect_udp(bot, host, port):
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(lambda: _BotDatagram(bot), remote_addr=(host, port))
+    bot.send = transport.sendto
+    return transport.close
+
+
+async def _read_frames(bot, reader):
+    try:
+        while True:
+            header = await reader.readexactly(protocol.FRAME_HEADER.size)
+            bot.on_message(await reader.readexactly(protocol.FRAME_HEADER.unpack(header)[0]))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+
+
+async def connect_tcp(bot, host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    bot.send = lambda payload: writer.write(protocol.frame(payload))
+    task = asyncio.ensure_future(_read_frames(bot, reader))
+
+    def close():
+        task.cancel()
+        writer.close()
+    return close
+
+
+async def start_server(args):
+    command = [sys.executable, os.path.join(ROOT, "server.py"), "--host", args.host,
+               "--udp-port", str(args.udp_port), "--tcp-port", str(args.tcp_port),
+               "--tick-rate", str(args.tick_rate), "--ticks", str(int(args.seconds * args.tick_rate)), "--stats"]
+    process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE)
+    line = await process.stdout.readline()
+    if not line.startswith(b"listening"):
+        raise RuntimeError("server failed to start")
+    return process
+
+
+# Connect count bots, play for the given time and return their results
+async def play(args, first, count):
+    behaviour = BEHAVIOURS[args.behaviour]
+    # The server plays the default level, predictors only read its platforms
+    level = load_game().build_level() if args.predict else None
+    bots = [Bot(behaviour, args.seed + first + i, Predictor(level) if level else None) for i in range(count)]
+    port = args.udp_port if args.transport == "udp" else args.tcp_port
+    connect = connect_udp if args.transport == "udp" else connect_tcp
+    closers = [await connect(bot, args.host, port) for bot in bots]
+    joins = [asyncio.ensure_future(bot.join()) for bot in bots]
+    await asyncio.sleep(args.seconds)
+    for bot in bots:
+        bot.leave()
+    for task in joins:
+        task.cancel()
+    await asyncio.sleep(0.05)
+    for close in closers:
+        close()
+    return [bot.result() for bot in bots]
+
+
+# Entry point of a worker process
+def play_share(args, first, count):
+    return asyncio.run(play(args, first, count))
+
+
+async def run(args):
+    process = None if args.connect else await start_server(args)
+    if args.processes > 1:
+        loop = asyncio.get_running_loop()
+        shares = [(args.players * i // args.processes, args.players * (i + 1) // args.processes)
+                  for i in range(args.processes)]
+        with concurrent.futures.ProcessPoolExecutor(args.processes) as pool:
+            futures = [loop.run_in_executor(pool, play_share, args, first, last - first)
+                       for first, last in shares]
+            results = [result for share in await asyncio.gather(*futures) for result in share]
+    else:
+        results = await play(args, 0, args.players)
+
+    stats = None
+    if process:
+        line = await process.stdout.readline()
+        stats = json.loads(line) if line else None
+        await process.wait()
+    return results, stats
+
+
+def report(args, bots, stats):
+    lines = ["%d %s bots (%s), %.1f s" % (args.players, args.transport, args.behaviour, args.seconds)]
+    if stats:
+        lines.append("server: %d ticks, %d players, tick ms mean %.3f  p99 %.3f  max %.3f, late ticks %d, "
+                     "%.1f kB/s sent" % (stats["ticks"], stats["players"], stats["tick_ms_mean"],
+                                         stats["tick_ms_p99"], stats["tick_ms_max"], stats["late_ticks"],
+                                         stats["bytes_sent"] / args.seconds / 1024))
+        lines.append("snapshots: %d sent, %d full, encode ms per tick %.3f" % (
+            stats["snapshots_sent"], stats["full_snapshots"], stats["encode_ms_mean"]))
+    joined = [bot for bot in bots if bot["joined"]]
+    lines.append("joined %d / %d" % (len(joined), len(bots)))
+    if joined:
+        rates = [bot["snapshots"] / args.seconds for bot in joined]
+        gaps = sorted(gap for bot in joined for gap in bot["gaps"])
+        trips = sorted(trip for bot in joined for trip in bot["round_trips"])
+        lines.append("per bot: snapshots/s mean %.1f  min %.1f, %.1f kB/s, %d undecodable" % (
+            sum(rates) / len(rates), min(rates), sum(bot["bytes"] for bot in joined) / len(joined) / args.seconds / 1024,
+            sum(bot["missing_baseline"] for bot in joined)))
+        if gaps:
+            lines.append("snapshot gap ms: p50 %.2f  p99 %.2f  max %.2f" % (
+                percentile(gaps, 0.5) * 1000, percentile(gaps, 0.99) * 1000, gaps[-1] * 1000))
+        if trips:
+            lines.append("input round trip ms: p50 %.2f  p99 %.2f  max %.2f" % (
+                percentile(trips, 0.5) * 1000, percentile(trips, 0.99) * 1000, trips[-1] * 1000))
+        reconciled = sum(bot["reconciled"] for bot in joined)
+        if reconciled:
+            replays = sorted(time_ for bot in joined for time_ in bot["replay_times"])
+            lines.append("prediction: %d of %d snapshots corrected (%.1f%%), replay ms p50 %.3f  max %.3f" % (
+                len(replays), reconciled, len(replays) / reconciled * 100,
+                percentile(replays, 0.5) * 1000, replays[-1] * 1000 if replays else 0.0))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the co-op server with headless bots")
+    parser.add_argument("--players", type=int, default=16)
+    parser.add_argument("--transport", choices=("udp", "tcp"), default="udp")
+    parser.add_argument("--behaviour", choices=list(BEHAVIOURS), default="run-and-gun")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--connect", action="store_true", help="use a running server instead of starting one")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--udp-port", type=int, default=47800)
+    parser.add_argument("--tcp-port", type=int, default=47801)
+    parser.add_argument("--tick-rate", type=int, default=60)
+    parser.add_argument("--processes", type=int, default=1, help="spread the bots over this many processes")
+    parser.add_argument("--predict", action="store_true", help="predict each bot's own player and count corrections")
+    args = parser.parse_args(argv)
+    bots, stats = asyncio.run(run(args))
+    print(report(args, bots, stats))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# Structure-of-arrays bullet storage.
+#
+# All bullets of one kind (player or enemy) live in flat NumPy arrays so that
+# movement, culling and collision run as a handful of vectorized operations per
+# tick instead of a Python loop per bullet.
+import numpy as np
+
+from batch_draw import CircleStamp
+from collision import sweep_points_vs_rects
+
+
+class BulletPool:
+    def __init__(self, radius=5, color=(255, 255, 0), capacity=64):
+        self.radius = radius
+        self.color = color
+        self.count = 0
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.vel_x = np.zeros(capacity)
+        self.vel_y = np.zeros(capacity)
+        self.ids = np.zeros(capacity, dtype=np.int64)  # Stable per-bullet ids, for network snapshots
+        self.next_id = 0
+        self.stamp = None  # Pre-rendered sprite, created on first draw
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self, needed):
+        capacity = self.x.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ("x", "y", "vel_x", "vel_y", "ids"):
+            old = getattr(self, name)
+            array = np.zeros(capacity, dtype=old.dtype)
+            array[:self.count] = old[:self.count]
+            setattr(self, name, array)
+
+    def spawn(self, x, y, vel_x, vel_y):
+        self._grow(self.count + 1)
+        i = self.count
+        self.x[i] = x
+        self.y[i] = y
+        self.vel_x[i] = vel_x
+        self.vel_y[i] = vel_y
+        self.ids[i] = self.next_id
+        self.next_id += 1
+        self.count += 1
+
+    # Add a bullet object (anything with x, y, vel_x and vel_y)
+    def add(self, bullet):
+        self.spawn(bullet.x, bullet.y, bullet.vel_x, bullet.vel_y)
+
+    def extend(self, bullets):
+        for bullet in bullets:
+            self.add(bullet)
+
+    def clear(self):
+        self.count = 0
+
+    # Views of the live part of each array
+    def positions(self):
+        n = self.count
+        return self.x[:n], self.y[:n]
+
+    def velocities(self):
+        n = self.count
+        return self.vel_x[:n], self.vel_y[:n]
+
+    def update(self):
+        n = self.count
+        self.x[:n] += self.vel_x[:n]
+        self.y[:n] += self.vel_y[:n]
+
+    # Sweep this tick's movement against a list of rects before calling update().
+    # Returns (t, index) per bullet, see collision.sweep_points_vs_rects.
+    def sweep(self, rects):
+        x, y = self.positions()
+        vel_x, vel_y = self.velocities()
+        return sweep_points_vs_rects(x, y, vel_x, vel_y, self.radius, rects)
+
+    # Same as sweep() but against a static PlatformGrid index
+    def sweep_grid(self, grid):
+        x, y = self.positions()
+        vel_x, vel_y = self.velocities()
+        return grid.sweep_points(x, y, vel_x, vel_y, self.radius)
+
+    def off_screen(self, scroll, width, height):
+        x, y = self.positions()
+        return (x < scroll) | (x > scroll + width) | (y < 0) | (y > height)
+
+    # Drop every bullet where mask is True, keeping the order of the rest
+    def remove(self, mask):
+        n = self.count
+        keep = ~np.asarray(mask, dtype=bool)
+        kept = int(keep.sum())
+        if kept == n:
+            return
+        for name in ("x", "y", "vel_x", "vel_y", "ids"):
+            array = getattr(self, name)
+            array[:kept] = array[:n][keep]
+        self.count = kept
+
+    # A pool holding copies of the live bullets, sharing the sprite, so they
+    # can be drawn while this one keeps changing
+    def copy(self):
+        pool = BulletPool(self.radius, self.color, max(self.count, 1))
+        for name in ("x", "y", "vel_x", "vel_y", "ids"):
+            getattr(pool, name)[:self.count] = getattr(self, name)[:self.count]
+        pool.count = self.count
+        pool.next_id = self.next_id
+        pool.stamp = self.stamp
+        return pool
+
+    # Screen rects covered by the bullets, for dirty-rect rendering
+    def get_dirty_rects(self, scroll):
+        x, y = self.positions()
+        size = self.radius * 2 + 2
+        return [(bx - scroll - self.radius - 1, by - self.radius - 1, size, size)
+                for bx, by in zip(x.tolist(), y.tolist())]
+
+    # Stamp every bullet in one batched call
+    def draw(self, screen, scroll):
+        if self.stamp is None:
+            self.stamp = CircleStamp(self.radius, self.color)
+        x, y = self.positions()
+        self.stamp.draw(screen, x, y, scroll)
@@ -0,0 +1,81 @@
+# Level sequence with background preloading.
+#
+# While one level is played, the next one is read, parsed and built (geometry,
+# spatial index, pre-rendered layers, sprite caches) on a worker thread, so
+# switching to it only has to pick up the finished Level object.
+import concurrent.futures
+import glob
+import json
+import os
+
+LEVEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "levels")
+
+
+# The level files shipped with the game, in play order
+def level_files(directory=LEVEL_DIR):
+    return sorted(glob.glob(os.path.join(directory, "level*.json")),
+                  key=lambda path: int("".join(c for c in os.path.basename(path) if c.isdigit()) or 0))
+
+
+def read_level(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+class Campaign:
+    # read(path) loads a level file, build(data) turns what it returns into a
+    # ready-to-play level
+    def __init__(self, paths, build, read=read_level):
+        self.paths = list(paths)
+        self.build = build
+        self.read = read
+        self.index = 0
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="level-loader")
+        self._pending = {}
+
+    def __len__(self):
+        return len(self.paths)
+
+    def _load(self, index):
+        return self.build(self.read(self.paths[index]))
+
+    # Start building a level on the worker thread
+    def preload(self, index):
+        if index not in self._pending:
+            self._pending[index] = self._executor.submit(self._load, index)
+
+    # Whether a preloaded level is ready to switch to without waiting
+    def is_ready(self, index):
+        future = self._pending.get(index)
+        return future is not None and future.done()
+
+    # Get a level, waiting for the worker only if it hasn't finished yet
+    def load(self, index):
+        future = self._pending.pop(index, None)
+        if future is None:
+            return self._load(index)
+        return future.result()
+
+    def next_index(self):
+        return (self.index + 1) % len(self.paths)
+
+    def is_last(self):
+        return self.index == len(self.paths) - 1
+
+    # Load the first level and start preloading the second
+    def start(self, index=0):
+        self.index = index
+        level = self.load(index)
+        self.preload(self.next_index())
+        return level
+
+    # Switch to the next level (wrapping to the first) and preload the one after
+    def advance(self):
+        self.index = self.next_index()
+        level = self.load(self.index)
+        self.preload(self.next_index())
+        return level
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
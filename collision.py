@@ -0,0 +1,121 @@
+# Continuous (swept) collision detection shared by the game scripts.
+#
+# Rects are (x, y, width, height) tuples like the ones returned by get_rect().
+# Movement is given as a displacement for one tick, and hits are reported as a
+# time of impact t in [0, 1] along that displacement, so nothing can tunnel
+# through thin geometry no matter how fast it moves.
+import math
+
+import numpy as np
+
+# Tolerance for contacts that start exactly on a surface (e.g. standing on a platform)
+EPSILON = 1e-9
+
+
+# Helper function for the entry/exit times of a moving interval against a static one
+def _axis_times(pos, size, delta, target_pos, target_size):
+    if delta > 0:
+        return ((target_pos - (pos + size)) / delta,
+                (target_pos + target_size - pos) / delta)
+    if delta < 0:
+        return ((target_pos + target_size - pos) / delta,
+                (target_pos - (pos + size)) / delta)
+    # Not moving on this axis: either always overlapping or never
+    if pos + size <= target_pos or pos >= target_pos + target_size:
+        return math.inf, -math.inf
+    return -math.inf, math.inf
+
+
+# Sweep a moving rect by (dx, dy) against a static rect.
+# Returns (t, normal_x, normal_y) for the first contact, or None if there is none
+# this tick. Rects that already overlap at the start are ignored.
+def sweep_aabb(rect, dx, dy, target):
+    entry_x, exit_x = _axis_times(rect[0], rect[2], dx, target[0], target[2])
+    entry_y, exit_y = _axis_times(rect[1], rect[3], dy, target[1], target[3])
+
+    entry = max(entry_x, entry_y)
+    leave = min(exit_x, exit_y)
+    if entry >= leave or entry < -EPSILON or entry > 1:
+        return None
+
+    if entry_x > entry_y:
+        return max(entry, 0.0), (-1 if dx > 0 else 1), 0
+    return max(entry, 0.0), 0, (-1 if dy > 0 else 1)
+
+
+# Sweep a moving rect against a list of static rects and return the earliest hit
+# as (t, normal_x, normal_y, index), or None.
+def sweep_aabb_first(rect, dx, dy, targets):
+    best = None
+    for index, target in enumerate(targets):
+        hit = sweep_aabb(rect, dx, dy, target)
+        if hit and (best is None or hit[0] < best[0]):
+            best = (hit[0], hit[1], hit[2], index)
+    return best
+
+
+# Helper function for the vectorized slab test on one axis.
+# pos/delta broadcast against lo/hi; returns (near, far) entry and exit times.
+def _slab(pos, delta, lo, hi):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t1 = (lo - pos) / delta
+        t2 = (hi - pos) / delta
+    near = np.minimum(t1, t2)
+    far = np.maximum(t1, t2)
+
+    # Not moving on this axis: the ray is either inside the slab forever or never
+    still = delta == 0
+    inside = (pos > lo) & (pos < hi)
+    near = np.where(still, np.where(inside, -np.inf, np.inf), near)
+    far = np.where(still, np.where(inside, np.inf, -np.inf), far)
+    return near, far
+
+
+# Vectorized time of impact of rays (bullet centres) against boxes that have
+# already been grown by the bullet radius. All arguments broadcast together;
+# returns the time of impact for every ray/box pair (inf where there is no hit).
+# Rays that start inside a box hit it at t = 0.
+def sweep_points_vs_boxes(px, py, vx, vy, left, top, right, bottom):
+    near_x, far_x = _slab(px, vx, left, right)
+    near_y, far_y = _slab(py, vy, top, bottom)
+    entry = np.maximum(near_x, near_y)
+    leave = np.minimum(far_x, far_y)
+
+    hit = (entry < leave) & (entry <= 1) & (leave >= 0)
+    return np.where(hit, np.maximum(entry, 0.0), np.inf)
+
+
+# Helper function to reduce a (N, M) time of impact matrix to the first hit per row
+def first_hits(toi):
+    count = toi.shape[0]
+    index = np.argmin(toi, axis=1)
+    t = toi[np.arange(count), index]
+    index = np.where(np.isfinite(t), index, -1)
+    return t, index
+
+
+# Vectorized sweep of many small boxes (bullets) against many static rects.
+#
+# x, y are the box centres at the start of the tick, dx, dy the displacement this
+# tick and radius the half-size of each box. rects is a sequence or (M, 4) array.
+# Each rect is grown by the radius so the bullet can be treated as a ray.
+# Returns (t, index): the time of impact per bullet (inf for no hit) and the index
+# of the rect it hits first (-1 for no hit).
+def sweep_points_vs_rects(x, y, dx, dy, radius, rects):
+    x = np.asarray(x, dtype=float)
+    count = x.shape[0]
+    rects = np.asarray(rects, dtype=float).reshape(-1, 4)
+    if count == 0 or rects.shape[0] == 0:
+        return np.full(count, np.inf), np.full(count, -1, dtype=np.intp)
+
+    toi = sweep_points_vs_boxes(
+        x[:, None],
+        np.asarray(y, dtype=float)[:, None],
+        np.asarray(dx, dtype=float)[:, None],
+        np.asarray(dy, dtype=float)[:, None],
+        rects[:, 0] - radius,
+        rects[:, 1] - radius,
+        rects[:, 0] + rects[:, 2] + radius,
+        rects[:, 1] + rects[:, 3] + radius,
+    )
+    return first_hits(toi)
@@ -0,0 +1,168 @@
+# Co-op simulation of a V4 level for the multiplayer server.
+#
+# Reuses the V4 game classes (Player, Enemy, BulletPool, the level files) and
+# plays the same tick rules as Game.update for any number of players: every
+# player moves with its own input and camera, enemies chase the nearest player,
+# both bullet pools are shared, and the level is complete once the boss is
+# down. Tile maps, level packs and scheduled spawns follow all of the cameras
+# at once. Players that die respawn inside their own camera window after a
+# short delay.
+import importlib.util
+import os
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+GAME_SCRIPT = os.path.join(ROOT, "2D_game_V4.py")
+
+# Input bits sent by clients, one byte per tick
+LEFT, RIGHT, UP, DOWN, SHOOT = 1, 2, 4, 8, 16
+
+RESPAWN_TICKS = 180
+
+_modules = {}
+
+
+# Import a game script as a module, its main() only runs as __main__
+def load_game(path=GAME_SCRIPT):
+    if path not in _modules:
+        spec = importlib.util.spec_from_file_location("game_v4", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[path] = module
+    return _modules[path]
+
+
+# Key state seen by Player.move for an input bit mask
+class InputKeys:
+    KEY_BITS = {
+        pygame.K_LEFT: LEFT,
+        pygame.K_RIGHT: RIGHT,
+        pygame.K_UP: UP,
+        pygame.K_w: UP,
+        pygame.K_DOWN: DOWN,
+        pygame.K_s: DOWN,
+    }
+
+    def __init__(self, bits=0):
+        self.bits = bits
+
+    def __getitem__(self, key):
+        return bool(self.bits & self.KEY_BITS.get(key, 0))
+
+
+INPUTS = [InputKeys(bits) for bits in range(32)]
+
+
+# Input bits for a pygame key state, shooting is passed in separately
+def keys_to_bits(keys, shoot=False):
+    bits = SHOOT if shoot else 0
+    for key, bit in InputKeys.KEY_BITS.items():
+        if keys[key]:
+            bits |= bit
+    return bits
+
+
+class CoopGame:
+    def __init__(self, level=None, module=None):
+        self.module = module or load_game()
+        game = self.module
+        self.level = level or game.build_level()
+        self.platforms = self.level.platforms
+        self.platform_grid = self.level.platform_grid
+        self.tilemap = self.level.tilemap
+        self.streamer = self.level.streamer
+        self.spawner = self.level.spawner
+        self.spikes = self.level.spikes
+        self.health_pickups = self.level.health_pickups
+        self.enemies = self.level.enemies
+        self.boss = self.level.boss
+        self.next_enemy_id = 0
+        self._number_enemies()
+        self.player_bullets = game.BulletPool(radius=5, color=game.YELLOW)
+        self.enemy_bullets = game.BulletPool(radius=5, color=game.YELLOW)
+        self.players = {}  # Player id -> Player
+        self.scrolls = {}  # Player id -> camera scroll
+        self.respawn = {}  # Player id -> ticks until a dead player comes back
+        self.next_player_id = 0
+        self.tick = 0
+        self.level_complete = False
+
+    # Give the enemies spawned since the last call their network ids
+    def _number_enemies(self):
+        for enemy in self.enemies:
+            if getattr(enemy, "net_id", None) is None:
+                enemy.net_id = self.next_enemy_id
+                self.next_enemy_id += 1
+
+    def _new_player(self, player_id, x):
+        player = self.module.Player(x, 100)
+        player.player_id = player_id
+        self.players[player_id] = player
+        return player
+
+    def add_player(self):
+        player_id = self.next_player_id
+        self.next_player_id += 1
+        self._new_player(player_id, 100 + 40 * (player_id % 8))
+        self.scrolls[player_id] = 0
+        return player_id
+
+    def remove_player(self, player_id):
+        self.players.pop(player_id, None)
+        self.scrolls.pop(player_id, None)
+        self.respawn.pop(player_id, None)
+
+    def alive(self):
+        return [(player_id, player) for player_id, player in self.players.items()
+                if player_id not in self.respawn]
+
+    # Damage a player as Game does, a fatal hit starts the respawn countdown
+    def hurt(self, player, damage, cause):
+        if self.module.damage_player(player, damage, cause):
+            self.respawn[player.player_id] = RESPAWN_TICKS
+
+    def _respawn(self):
+        for player_id in list(self.respawn):
+            self.respawn[player_id] -= 1
+            if self.respawn[player_id] <= 0:
+                del self.respawn[player_id]
+                self._new_player(player_id, self.scrolls[player_id] + 100)
+
+    # Advance the simulation by one tick, inputs maps player id -> input bits
+    def update(self, inputs):
+        self.tick += 1
+        self._respawn()
+        if self.level_complete:
+            return
+        game = self.module
+        alive = self.alive()
+
+        # Bring in the level around every camera
+        if self.scrolls:
+            first = min(self.scrolls.values())
+            game.follow_cameras(self, first, max(self.scrolls.values()) - first)
+            self._number_enemies()
+
+        # Update players
+        for player_id, player in alive:
+            bits = inputs.get(player_id, 0)
+            game.move_player(self, player, INPUTS[bits & 31])
+            self.scrolls[player_id] = game.follow_scroll(self.scrolls[player_id], player.x, self.level.length)
+            if bits & SHOOT:
+                bullet = player.shoot()
+                if bullet:
+                    self.player_bullets.add(bullet)
+
+        # The rest of the tick is Game.update's, for every living player
+        players = [player for _, player in alive]
+        scrolls = list(set(self.scrolls.values()))
+        game.update_player_bullets(self, scrolls)
+        game.update_enemy_bullets(self, players, scrolls)
+        game.update_enemies(self, players)
+        game.touch_level(self, players)
+
+        if self.boss.health <= 0:
+            self.level_complete = True
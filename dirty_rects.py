@@ -0,0 +1,62 @@
+# Dirty-rectangle renderer.
+#
+# The static part of a frame (background, platforms, spikes, help text) is drawn
+# once into a cached surface. While the camera holds still, each frame only
+# erases last frame's sprites from that cache, redraws the moving sprites and
+# pushes the changed regions with pygame.display.update(rects). Whenever the
+# static key changes (the camera scrolled, the game was reset, ...) the cache is
+# rebuilt and the frame falls back to a full pygame.display.flip().
+import pygame
+
+
+class DirtyRectRenderer:
+    def __init__(self, screen):
+        self.screen = screen
+        self.bounds = screen.get_rect()
+        self.background = pygame.Surface(screen.get_size()).convert()
+        self.static_key = None
+        self.full_redraw = True
+        self.previous = []
+        self.current = []
+
+        # Counters for profiling
+        self.full_frames = 0
+        self.partial_frames = 0
+
+    # Start a frame. draw_static(surface) is only called when static_key changed.
+    def begin(self, static_key, draw_static):
+        self.current = []
+        if static_key != self.static_key:
+            self.static_key = static_key
+            draw_static(self.background)
+            self.screen.blit(self.background, (0, 0))
+            self.full_redraw = True
+        else:
+            # Erase last frame's sprites by restoring the cached static layer
+            for rect in self.previous:
+                self.screen.blit(self.background, rect, rect)
+            self.full_redraw = False
+
+    # Force the next frame to rebuild the static layer
+    def invalidate(self):
+        self.static_key = None
+
+    # Record a screen-space rect that this frame draws into
+    def mark(self, rect):
+        rect = pygame.Rect(rect).clip(self.bounds)
+        if rect.width and rect.height:
+            self.current.append(rect)
+
+    def mark_all(self, rects):
+        for rect in rects:
+            self.mark(rect)
+
+    # Push the frame to the display
+    def end(self):
+        if self.full_redraw:
+            pygame.display.flip()
+            self.full_frames += 1
+        else:
+            pygame.display.update(self.previous + self.current)
+            self.partial_frames += 1
+        self.previous = self.current
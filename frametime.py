@@ -0,0 +1,173 @@
+# Frame-time histogram and hitch detector.
+#
+# Every frame's duration goes into an HDR-style histogram (log-linear buckets,
+# so percentiles stay accurate from microseconds to seconds in fixed memory).
+# The game tags what happened during a frame with note(); frames over budget are
+# logged as hitches together with those tags, and the summary shows which kinds
+# of event make a hitch more likely.
+import gc
+import time
+
+import pygame
+
+BUDGET_MS = 1000 / 60
+
+
+class FrameHistogram:
+    # Each power-of-two range of microseconds is split into 2 ** sub_bucket_bits
+    # linear buckets, giving about 1 / 2 ** (sub_bucket_bits - 1) relative precision
+    def __init__(self, sub_bucket_bits=6, max_value_us=10_000_000):
+        self.bits = sub_bucket_bits
+        self.sub_buckets = 1 << sub_bucket_bits
+        self.max_value_us = max_value_us
+        self.counts = [0] * (self._index(max_value_us) + 1)
+        self.total = 0
+        self.sum_us = 0
+        self.max_us = 0
+
+    def _index(self, value):
+        magnitude = max(value.bit_length() - self.bits, 0)
+        return magnitude * self.sub_buckets + (value >> magnitude)
+
+    # Midpoint of the range of values stored in a bucket
+    def _value(self, index):
+        magnitude, slot = divmod(index, self.sub_buckets)
+        low = slot << magnitude
+        return low + ((1 << magnitude) - 1) / 2
+
+    def record(self, seconds):
+        value = min(int(seconds * 1_000_000), self.max_value_us)
+        self.counts[self._index(value)] += 1
+        self.total += 1
+        self.sum_us += value
+        self.max_us = max(self.max_us, value)
+
+    def mean_ms(self):
+        return self.sum_us / self.total / 1000 if self.total else 0.0
+
+    def percentile_ms(self, percent):
+        if not self.total:
+            return 0.0
+        target = max(1, int(round(percent / 100 * self.total)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._value(index), self.max_us) / 1000
+        return self.max_us / 1000
+
+
+class HitchDetector:
+    def __init__(self, budget_ms=BUDGET_MS, keep=200):
+        self.budget_ms = budget_ms
+        self.keep = keep  # Most hitches kept in the log
+        self.histogram = FrameHistogram()
+        self.frame = 0
+        self.events = []
+        self.hitches = []
+        self.hitch_count = 0
+        self.frames_with = {}  # Event kind -> frames it happened in
+        self.hitches_with = {}  # Event kind -> hitches it happened in
+        self._gc_start = None
+        self._frame_start = None
+
+    # Record GC passes as events of the frame they happen in
+    def install_gc_hook(self):
+        gc.callbacks.append(self._on_gc)
+
+    def remove_gc_hook(self):
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+
+    def _on_gc(self, phase, info):
+        if phase == "start":
+            self._gc_start = time.perf_counter()
+        elif self._gc_start is not None:
+            elapsed = (time.perf_counter() - self._gc_start) * 1000
+            self.note("gc", "gen %d, %.2f ms" % (info["generation"], elapsed))
+            self._gc_start = None
+
+    # Tag the current frame with something that happened in it
+    def note(self, kind, detail=""):
+        self.events.append((kind, detail))
+
+    def start_frame(self):
+        self._frame_start = time.perf_counter()
+
+    # Close the frame, returns its duration in seconds
+    def end_frame(self):
+        if self._frame_start is None:
+            return
+        duration = time.perf_counter() - self._frame_start
+        self._frame_start = None
+        self.histogram.record(duration)
+
+        # Take the events before reading them, so one noted meanwhile (a GC
+        # pass, another thread) goes to this frame or the next, not nowhere
+        events, self.events = self.events, []
+        kinds = {kind for kind, _ in events}
+        for kind in kinds:
+            self.frames_with[kind] = self.frames_with.get(kind, 0) + 1
+        if duration * 1000 > self.budget_ms:
+            self.hitch_count += 1
+            for kind in kinds:
+                self.hitches_with[kind] = self.hitches_with.get(kind, 0) + 1
+            if len(self.hitches) < self.keep:
+                self.hitches.append((self.frame, duration * 1000, events))
+        self.frame += 1
+        return duration
+
+    def summary(self):
+        h = self.histogram
+        lines = [
+            "frames %d, budget %.1f ms, hitches %d (%.2f%%)" % (
+                h.total, self.budget_ms, self.hitch_count, 100 * self.hitch_count / max(h.total, 1)),
+            "frame ms: mean %.2f  p50 %.2f  p90 %.2f  p99 %.2f  p99.9 %.2f  max %.2f" % (
+                h.mean_ms(), h.percentile_ms(50), h.percentile_ms(90), h.percentile_ms(99),
+                h.percentile_ms(99.9), h.max_us / 1000),
+        ]
+        if self.frames_with:
+            lines.append("event           frames  hitches  hitch rate")
+            for kind in sorted(self.frames_with, key=lambda k: -self.hitches_with.get(k, 0)):
+                frames = self.frames_with[kind]
+                hitches = self.hitches_with.get(kind, 0)
+                lines.append("%-14s %7d  %7d  %9.1f%%" % (kind, frames, hitches, 100 * hitches / frames))
+        worst = sorted(self.hitches, key=lambda hitch: -hitch[1])[:10]
+        if worst:
+            lines.append("worst hitches:")
+            for frame, ms, events in worst:
+                tags = ", ".join(kind + (" (%s)" % detail if detail else "") for kind, detail in events)
+                lines.append("  frame %6d  %7.2f ms  %s" % (frame, ms, tags or "-"))
+        return "\n".join(lines)
+
+
+# Small text overlay with live frame statistics, toggled in game with F3
+class StatsOverlay:
+    def __init__(self, size=20, color=(255, 255, 255)):
+        self.font = pygame.font.SysFont(None, size)
+        self.color = color
+        self.visible = False
+
+    def toggle(self):
+        self.visible = not self.visible
+
+    def draw(self, surface, lines, pos=(10, 40)):
+        rects = []
+        if not self.visible:
+            return rects
+        x, y = pos
+        for line in lines:
+            text = self.font.render(line, True, self.color)
+            rects.append(surface.blit(text, (x, y)))
+            y += text.get_height()
+        return rects
+
+
+# Overlay lines for a HitchDetector
+def detector_lines(detector, fps):
+    h = detector.histogram
+    return [
+        "FPS %.0f" % fps,
+        "frame ms p50 %.2f  p99 %.2f  max %.2f" % (h.percentile_ms(50), h.percentile_ms(99), h.max_us / 1000),
+        "hitches %d / %d" % (detector.hitch_count, h.total),
+    ]
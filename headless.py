@@ -0,0 +1,273 @@
+# Headless driver for running any of the game scripts without a window or a player.
+#
+# The scripts build their level and enter their game loop at import, so the driver
+# runs them unmodified with runpy and steers them from the outside:
+#  - SDL uses its dummy video/audio drivers, so nothing is shown
+#  - pygame.key.get_pressed and pygame.event.get replay a scripted input trace and
+#    post QUIT once the requested number of ticks has run
+#  - pygame.time.Clock is replaced by an uncapped clock that times every frame.
+#    Its first tick() also hands the script's namespace to the scenario setup and
+#    wraps the hot methods (Player.move, Enemy.update, ...) with per-phase timers
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import gc
+import runpy
+import sys
+import time
+
+import pygame
+
+# Which phase each method or function is charged to, by qualified name
+PHASES = {
+    "Player.move": "player",
+    "Player.shoot": "player",
+    "Bullet.update": "bullets",
+    "Bullet.is_off_screen": "bullets",
+    "BulletPool.update": "bullets",
+    "BulletPool.sweep": "bullets",
+    "BulletPool.sweep_grid": "bullets",
+    "BulletPool.off_screen": "bullets",
+    "BulletPool.remove": "bullets",
+    "BulletPool.add": "bullets",
+    "BulletPool.extend": "bullets",
+    "Enemy.update": "enemies",
+    "Enemy.shoot": "enemies",
+    "HealthPickup.check_collision": "pickups",
+    "Player.draw": "draw",
+    "Bullet.draw": "draw",
+    "BulletPool.draw": "draw",
+    "Enemy.draw": "draw",
+    "Platform.draw": "draw",
+    "Spike.draw": "draw",
+    "HealthPickup.draw": "draw",
+    "GameView.draw_static": "draw",
+    "GameView.draw": "draw",
+}
+
+PHASE_ORDER = ["input", "player", "bullets", "enemies", "pickups", "draw", "text", "present", "other"]
+
+
+# Input for one tick: keys held down and keys that went down this tick
+class TraceFrame:
+    def __init__(self, held=(), pressed=()):
+        self.held = frozenset(held)
+        self.pressed = tuple(pressed)
+
+
+# Load a trace from a list of {"held": [...], "pressed": [...]} dicts using pygame
+# key constant names such as "K_RIGHT"
+def trace_from_json(frames):
+    return [TraceFrame([getattr(pygame, name) for name in frame.get("held", ())],
+                       [getattr(pygame, name) for name in frame.get("pressed", ())])
+            for frame in frames]
+
+
+class _HeldKeys:
+    def __init__(self, held):
+        self.held = held
+
+    def __getitem__(self, key):
+        return key in self.held
+
+
+# Adds up time per phase. Nested timed calls are charged to the outermost phase only.
+class PhaseTimer:
+    def __init__(self):
+        self.totals = dict.fromkeys(PHASE_ORDER, 0.0)
+        self.calls = dict.fromkeys(PHASE_ORDER, 0)
+        self.depth = 0
+        self.wrapped = []  # (owner, attribute, original) for every class method wrapped
+
+    def wrap(self, phase, function):
+        timer = self
+
+        def timed(*args, **kwargs):
+            if timer.depth:
+                return function(*args, **kwargs)
+            timer.depth += 1
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timer.totals[phase] += time.perf_counter() - start
+                timer.calls[phase] += 1
+                timer.depth -= 1
+
+        timed.__wrapped__ = function
+        timed.phase = phase
+        return timed
+
+    # Wrap every known method and function found in a script namespace. Classes
+    # imported from other modules outlive the run, so restore() puts their
+    # methods back, and a method some other timer still has wrapped is left alone.
+    def instrument(self, namespace):
+        for name, phase in PHASES.items():
+            owner_name, _, attribute = name.rpartition(".")
+            if owner_name:
+                owner = namespace.get(owner_name)
+                if isinstance(owner, type) and attribute in vars(owner):
+                    original = vars(owner)[attribute]
+                    if hasattr(original, "phase"):
+                        continue
+                    setattr(owner, attribute, self.wrap(phase, original))
+                    self.wrapped.append((owner, attribute, original))
+            elif callable(namespace.get(name)):
+                namespace[name] = self.wrap(phase, namespace[name])
+
+    def restore(self):
+        for owner, attribute, original in reversed(self.wrapped):
+            setattr(owner, attribute, original)
+        self.wrapped = []
+
+
+# Live view of a running script: attributes of its game object if it has one
+# (session.game, which changes with the level, or else `game`), then the locals
+# of the frame running the game loop, then the script's globals
+class GameNamespace:
+    def __init__(self, frame):
+        self.globals = frame.f_globals
+        self.locals = frame.f_locals
+        self.session = self.locals.get("session", self.globals.get("session"))
+        self._game = self.locals.get("game", self.globals.get("game"))
+
+    @property
+    def game(self):
+        if self.session is not None:
+            return self.session.game
+        return self._game
+
+    def __getitem__(self, name):
+        if self.game is not None and hasattr(self.game, name):
+            return getattr(self.game, name)
+        if name in self.locals:
+            return self.locals[name]
+        return self.globals[name]
+
+    def __setitem__(self, name, value):
+        if self.game is not None and hasattr(self.game, name):
+            setattr(self.game, name, value)
+        else:
+            self.globals[name] = value
+
+    def __contains__(self, name):
+        try:
+            self[name]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+
+# Run a game script headless for a number of ticks.
+#
+# trace is a list of TraceFrame (it repeats if shorter than ticks). setup(ns) is
+# called on the first tick with the script's namespace, on_tick(ns, tick) at the
+# start of every tick (neither is counted in the frame times). Returns a dict of timings.
+def run_script(path, ticks, trace=None, setup=None, on_tick=None, argv=()):
+    trace = trace or [TraceFrame()]
+    path = os.path.abspath(path)
+    timer = PhaseTimer()
+    frame_times = []
+    state = {"tick": 0, "namespace": None, "last": None}
+
+    saved = {
+        "get_pressed": pygame.key.get_pressed,
+        "event_get": pygame.event.get,
+        "Clock": pygame.time.Clock,
+        "flip": pygame.display.flip,
+        "update": pygame.display.update,
+        "SysFont": pygame.font.SysFont,
+        "argv": sys.argv,
+        "path": list(sys.path),
+    }
+
+    def current():
+        return trace[(state["tick"] - 1) % len(trace)]
+
+    def get_pressed():
+        return _HeldKeys(current().held)
+
+    def event_get(*args, **kwargs):
+        saved["event_get"](*args, **kwargs)  # Keep SDL's queue drained
+        events = [pygame.event.Event(pygame.KEYDOWN, key=key) for key in current().pressed]
+        if state["tick"] >= ticks:
+            events.append(pygame.event.Event(pygame.QUIT))
+        return events
+
+    class FrameClock:
+        def __init__(self):
+            pass
+
+        def tick(self, framerate=0):
+            now = time.perf_counter()
+            if state["last"] is not None:
+                frame_times.append(now - state["last"])
+            else:
+                namespace = GameNamespace(sys._getframe(1))
+                state["namespace"] = namespace
+                timer.instrument(namespace)
+                if setup:
+                    setup(namespace)
+            state["tick"] += 1
+            # Scenario work happens off the clock
+            if on_tick:
+                on_tick(state["namespace"], state["tick"])
+            now = time.perf_counter()
+            state["last"] = now
+            return 0
+
+        def get_fps(self):
+            return 0.0
+
+        def get_time(self):
+            return 0
+
+    pygame.key.get_pressed = get_pressed
+    pygame.event.get = timer.wrap("input", event_get)
+    pygame.time.Clock = FrameClock
+    pygame.display.flip = timer.wrap("present", saved["flip"])
+    pygame.display.update = timer.wrap("present", saved["update"])
+    pygame.font.SysFont = timer.wrap("text", saved["SysFont"])
+    sys.argv = [path] + list(argv)
+    sys.path.insert(0, os.path.dirname(path))
+
+    gc_before = [stats["collections"] for stats in gc.get_stats()]
+    blocks_before = sys.getallocatedblocks()
+    start = time.perf_counter()
+    try:
+        runpy.run_path(path, run_name="__main__")
+    finally:
+        # The last frame ends when the script leaves its loop
+        if state["last"] is not None:
+            frame_times.append(time.perf_counter() - state["last"])
+        wall = time.perf_counter() - start
+        pygame.key.get_pressed = saved["get_pressed"]
+        pygame.event.get = saved["event_get"]
+        pygame.time.Clock = saved["Clock"]
+        pygame.display.flip = saved["flip"]
+        pygame.display.update = saved["update"]
+        pygame.font.SysFont = saved["SysFont"]
+        timer.restore()
+        sys.argv = saved["argv"]
+        sys.path[:] = saved["path"]
+
+    frame_total = sum(frame_times)
+    timer.totals["other"] = max(frame_total - sum(timer.totals.values()), 0.0)
+    return {
+        "ticks": len(frame_times),
+        "wall_s": wall,
+        "frame_times": frame_times,
+        "phases_s": dict(timer.totals),
+        "gc_collections": [stats["collections"] - before
+                           for stats, before in zip(gc.get_stats(), gc_before)],
+        "live_blocks_delta": sys.getallocatedblocks() - blocks_before,
+    }
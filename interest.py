@@ -0,0 +1,67 @@
+# Interest management: which entities each client is told about.
+#
+# A client only needs the enemies and bullets near its own camera, so every
+# tick the server indexes those tables by x (spatial.ColumnIndex) and cuts a
+# per-client state out of the full one: the player's scroll window widened by a
+# margin on both sides, so things just off screen are already known when they
+# scroll in. Windows are snapped to index cells, which lets clients standing
+# near each other share one cut (and one encoded delta). Players are always
+# sent in full; there are few of them and the HUD shows everyone.
+#
+# The cost per client is then a binary search and the entities in its window,
+# so bandwidth and encode time follow the local density instead of the size of
+# the level.
+from snapshot_codec import State
+from spatial import ColumnIndex
+
+INTEREST_MARGIN = 200
+CELL_SIZE = 200
+
+# Tables cut down to the window, by schema name
+LOCAL_TABLES = ("enemies", "player_bullets", "enemy_bullets")
+
+
+class InterestManager:
+    def __init__(self, codec, view_width, margin=INTEREST_MARGIN, cell_size=CELL_SIZE):
+        self.codec = codec
+        self.view_width = view_width
+        self.margin = margin
+        self.cell_size = cell_size
+        self.state = None
+        self.indexes = []  # ColumnIndex per table, None for tables sent in full
+        self.cuts = {}  # (first cell, last cell) -> State, for this tick
+
+    # Index the full state of this tick
+    def prepare(self, state):
+        self.state = state
+        self.indexes = []
+        for schema, (ids, q) in zip(self.codec.schemas, state.tables):
+            if schema.name in LOCAL_TABLES:
+                column = [field.name for field in schema.fields].index("x")
+                self.indexes.append(ColumnIndex(q[:, column] / schema.fields[column].scale, self.cell_size))
+            else:
+                self.indexes.append(None)
+        self.cuts = {}
+
+    # Cells covered by a camera at scroll plus the margin
+    def window(self, scroll):
+        first = int((scroll - self.margin) // self.cell_size)
+        last = int((scroll + self.view_width + self.margin) // self.cell_size)
+        return first, last
+
+    # The part of this tick's state a camera at scroll is interested in
+    def state_for(self, scroll):
+        key = self.window(scroll)
+        cut = self.cuts.get(key)
+        if cut is None:
+            left = key[0] * self.cell_size
+            right = (key[1] + 1) * self.cell_size
+            tables = []
+            for (ids, q), index in zip(self.state.tables, self.indexes):
+                if index is None:
+                    tables.append((ids, q))
+                else:
+                    rows = index.query_range(left, right)
+                    tables.append((ids[rows], q[rows]))
+            cut = self.cuts[key] = State(self.state.tick, tables)
+        return cut
@@ -0,0 +1,7 @@
+# Names of the game's enemy types and causes of damage.
+#
+# Telemetry logs, level packs, spawn tables and network snapshots store these
+# as indexes into the tuples below, so there is one list of them for every
+# module, in that order. New names go at the end to keep existing files valid.
+ENEMY_TYPES = ("ground", "flying", "boss")
+CAUSES = ("spike", "enemy contact", "enemy bullet")
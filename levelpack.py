@@ -0,0 +1,238 @@
+# Compiled level files, memory-mapped and paged in around the camera.
+#
+# A JSON level is parsed and every object built up front, and a tile map of it
+# is rasterized at load time, so startup time and memory grow with the level.
+# A level pack is the same level compiled once into flat arrays in one file:
+#  - platforms, spikes, pickups and enemies as structured arrays sorted by x
+#  - the boss
+#  - the tile grid, stored column by column so a stretch of the world is one
+#    contiguous range of the file
+#  - the distinct tile values, for the renderer's atlas
+# Every section starts on a page boundary. LevelPack maps the file read-only
+# and only wraps views around it, so opening a pack reads the header and
+# nothing else: the OS pages in the parts the game touches, the tile columns
+# and spawn records around the camera, and every process playing the same
+# pack shares those pages through the page cache.
+#
+# ChunkStreamer creates the pickups near the camera as it moves, the first
+# time their chunk of the world comes within a margin of the view. The enemy
+# section is a spawn table that a SpawnScheduler (spawning.py) reads straight
+# from the mapping.
+#
+#   python levelpack.py levels/level1.json level1.lvl
+#   python levelpack.py levels/level3.json wide.lvl --copies 1000
+import argparse
+import bisect
+import math
+import struct
+import sys
+
+import numpy as np
+
+from kinds import ENEMY_TYPES
+from spawning import SPAWN_DTYPE
+from tilemap import TILE_SIZE, TileMap, level_pieces
+
+MAGIC = b"LVL1"
+VERSION = 1
+PAGE = 4096
+
+# magic, version, tile size, rows, columns, level length, exact, name
+HEADER = struct.Struct("<4sHHIIQB64s")
+SECTION = struct.Struct("<QQ")  # offset, record count
+
+SECTIONS = ("platforms", "spikes", "pickups", "enemies", "boss", "tiles", "values")
+DTYPES = {
+    "platforms": np.dtype([("x", "<f8"), ("y", "<f8"), ("width", "<f8"), ("height", "<f8")]),
+    "spikes": np.dtype([("x", "<f8"), ("y", "<f8"), ("width", "<f8")]),
+    "pickups": np.dtype([("x", "<f8"), ("y", "<f8")]),
+    "enemies": SPAWN_DTYPE,
+    "boss": np.dtype([("x", "<f8"), ("y", "<f8")]),
+    "tiles": np.dtype(np.uint8),
+    "values": np.dtype(np.uint8),
+}
+
+# World width of the chunks ChunkStreamer creates pickups for at a time
+CHUNK_WIDTH = 1024
+
+
+def records(name, rows):
+    array = np.array([tuple(row) for row in rows], dtype=DTYPES[name])
+    return array[np.argsort(array["x"], kind="stable")] if len(array) else array
+
+
+def pad_to_page(f):
+    f.write(b"\0" * (-f.tell() % PAGE))
+
+
+# Compile a built level (see build_level in the game) into a pack at path.
+# The tiles are rasterized a chunk at a time, so the whole grid is never in memory.
+def compile_level(level, path, height, tile_size=TILE_SIZE):
+    arrays = {
+        "platforms": records("platforms", (platform.get_rect() for platform in level.platforms)),
+        "spikes": records("spikes", ((spike.x, spike.y, spike.width) for spike in level.spikes)),
+        "pickups": records("pickups", ((pickup.x, pickup.y) for pickup in level.health_pickups)),
+        "boss": records("boss", [(level.boss.x, level.boss.y)]),
+    }
+    if level.spawner is not None:
+        arrays["enemies"] = level.spawner.table  # Already a sorted spawn table
+    else:
+        enemies = [enemy for enemy in level.enemies if enemy is not level.boss]
+        arrays["enemies"] = records("enemies", ((enemy.x, enemy.y, ENEMY_TYPES.index(enemy.type))
+                                                for enemy in enemies))
+    rows = math.ceil(height / tile_size)
+    columns = math.ceil(level.length / tile_size)
+    table = {}
+    with open(path, "wb") as f:
+        f.write(b"\0" * (HEADER.size + SECTION.size * len(SECTIONS)))
+        for name in SECTIONS[:5]:
+            pad_to_page(f)
+            table[name] = (f.tell(), len(arrays[name]))
+            f.write(arrays[name].tobytes())
+
+        pad_to_page(f)
+        table["tiles"] = (f.tell(), rows * columns)
+        values = set()
+        exact = True
+        for piece in level_pieces(level, height, tile_size):
+            f.write(np.ascontiguousarray(piece.tiles.T).tobytes())
+            values.update(np.unique(piece.tiles).tolist())
+            exact = exact and piece.exact
+
+        pad_to_page(f)
+        table["values"] = (f.tell(), len(values))
+        f.write(bytes(sorted(values)))
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, tile_size, rows, columns, int(level.length), exact,
+                            level.name.encode("utf-8")[:64]))
+        for name in SECTIONS:
+            f.write(SECTION.pack(*table[name]))
+
+
+class LevelPack:
+    def __init__(self, path):
+        self.path = path
+        self.file = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, self.tile_size, self.rows, self.columns, self.length, exact, name = HEADER.unpack_from(
+            self.file)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a version %d level pack" % (path, VERSION))
+        self.exact = bool(exact)
+        self.name = name.rstrip(b"\0").decode("utf-8")
+
+        # Plain array views of the mapping, nothing is read until it's indexed
+        self.sections = {}
+        for index, name in enumerate(SECTIONS):
+            offset, count = SECTION.unpack_from(self.file, HEADER.size + index * SECTION.size)
+            dtype = DTYPES[name]
+            self.sections[name] = np.asarray(self.file[offset:offset + count * dtype.itemsize]).view(dtype)
+        self.sections["tiles"] = self.sections["tiles"].reshape(self.columns, self.rows)
+
+    # Records of a section with left <= x < right. A binary search on the
+    # mapped x values, so only the pages it probes are read.
+    def in_range(self, name, left, right):
+        section = self.sections[name]
+        x = section["x"]
+        return section[bisect.bisect_left(x, left):bisect.bisect_left(x, right)]
+
+    # The tile grid as a TileMap backed by the file
+    def tilemap(self):
+        return MappedTileMap(self)
+
+    # The level as parsed level file data, reads the whole pack
+    def level_data(self):
+        section = self.sections
+        return {
+            "name": self.name,
+            "length": self.length,
+            "platforms": section["platforms"].tolist(),
+            "spikes": section["spikes"].tolist(),
+            "pickups": section["pickups"].tolist(),
+            "enemies": [(x, y, ENEMY_TYPES[kind]) for x, y, kind in section["enemies"].tolist()],
+            "boss": list(section["boss"][0].tolist()),
+        }
+
+
+# A TileMap whose tiles are the pack's read-only column-major grid. Pickups are
+# added to it as ChunkStreamer creates them.
+class MappedTileMap(TileMap):
+    def __init__(self, pack):
+        self.pack = pack
+        self.tile_size = pack.tile_size
+        self.tiles = pack.sections["tiles"].T
+        self.origin = 0
+        self.pickups = {}
+        self.exact = pack.exact
+
+    @property
+    def nbytes(self):
+        return self.tiles.nbytes
+
+    # Stored in the pack, rather than scanning every tile of the file
+    def values(self):
+        return self.pack.sections["values"]
+
+
+# Creates the pack's pickups near the camera. Chunks stay loaded: pickups
+# collected in them stay that way, as in a level built all at once.
+class ChunkStreamer:
+    def __init__(self, pack, level, make_pickup, view_width, chunk_width=CHUNK_WIDTH, margin=None):
+        self.pack = pack
+        self.level = level
+        self.make_pickup = make_pickup
+        self.view_width = view_width
+        self.chunk_width = chunk_width
+        self.margin = view_width if margin is None else margin
+        self.loaded = np.zeros(max(math.ceil(pack.length / chunk_width), 1), dtype=bool)
+        self.loads = 0
+
+    # Load the chunks within the margin of a view starting at scroll, span
+    # wider for several cameras
+    def follow(self, scroll, span=0):
+        first = max(int((scroll - self.margin) // self.chunk_width), 0)
+        last = min(int((scroll + span + self.view_width + self.margin) // self.chunk_width), len(self.loaded) - 1)
+        for chunk in range(first, last + 1):
+            if not self.loaded[chunk]:
+                self.load(chunk)
+
+    def load(self, chunk):
+        left = chunk * self.chunk_width
+        right = left + self.chunk_width
+        level = self.level
+        for x, y in self.pack.in_range("pickups", left, right).tolist():
+            pickup = self.make_pickup(x, y)
+            level.health_pickups.append(pickup)
+            level.tilemap.add_pickup(pickup)
+        self.loaded[chunk] = True
+        self.loads += 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile a level file into a memory-mapped level pack")
+    parser.add_argument("level", help="level file (JSON)")
+    parser.add_argument("output", help="level pack to write")
+    parser.add_argument("--copies", type=int, default=1,
+                        help="compile this many copies of the level side by side, for testing wide worlds")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE)
+    args = parser.parse_args(argv)
+
+    # The game script and the world stretcher are only needed to compile
+    from campaign import read_level
+    from coop import load_game
+    from tilemap_bench import stretch_level
+
+    module = load_game()
+    data = read_level(args.level)
+    if args.copies > 1:
+        data = stretch_level(data, args.copies)
+    compile_level(module.build_level(data), args.output, module.HEIGHT, args.tile_size)
+    pack = LevelPack(args.output)
+    print("%s: %s, %d px, %d x %d tiles, %d platforms, %d enemies, %d pickups, %.1f MB" % (
+        args.output, pack.name, pack.length, pack.columns, pack.rows, len(pack.sections["platforms"]),
+        len(pack.sections["enemies"]), len(pack.sections["pickups"]), len(pack.file) / 1e6))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+# Level pack benchmark: startup time and memory against JSON level files.
+#
+# Compiles worlds made of copies of a level into both formats (a stretched
+# JSON file and a level pack) and starts each one in a fresh process, so
+# nothing is cached or already imported. A process measures the time to get
+# a playable Game (read and build the JSON level, or map the pack), the first
+# tick, the mean tick over a short run-and-shoot session, and how much its
+# RSS grew over the same steps, split into anonymous memory (objects, arrays)
+# and file pages (the mapped pack). A JSON level costs time and memory in
+# proportion to its size, a pack should cost about the same at any size.
+#
+# --share N then starts N processes on the biggest pack at once, each reading
+# every tile of it, and reports the pack mapping's RSS and PSS per process
+# from /proc/self/smaps: the pages are in every process's RSS but only
+# counted once between them.
+#
+#   python levelpack_bench.py                          # 1, 10, 100 and 1000 copies
+#   python levelpack_bench.py --copies 1 100 --ticks 300 --share 4
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from campaign import level_files, read_level
+from coop import INPUTS, RIGHT, UP, load_game
+from levelpack import LevelPack, compile_level
+from tilemap_bench import stretch_level
+
+FORMATS = ("json", "pack")
+
+
+# RSS and its anonymous and file-backed parts in kB
+def memory_status():
+    status = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("VmRSS", "RssAnon", "RssFile"):
+                status[name] = int(value.split()[0])
+    return status
+
+
+# RSS and PSS in kB of the mappings of one file
+def mapping_usage(path):
+    path = os.path.realpath(path)
+    usage = {"Rss": 0, "Pss": 0}
+    inside = False
+    with open("/proc/self/smaps") as f:
+        for line in f:
+            fields = line.split()
+            if "-" in fields[0] and not fields[0].endswith(":"):
+                inside = len(fields) >= 6 and fields[5] == path
+            elif inside and fields[0][:-1] in usage:
+                usage[fields[0][:-1]] += int(fields[1])
+    return usage
+
+
+# One measurement, run in its own process
+def measure_startup(kind, path, ticks):
+    module = load_game()
+    before = memory_status()
+    start = time.perf_counter()
+    if kind == "json":
+        level = module.build_level(read_level(path), scheduled=True)
+    else:
+        level = module.open_level(LevelPack(path))
+    game = module.Game(level)
+    opened = time.perf_counter()
+    game.update(INPUTS[RIGHT])
+    first_tick = time.perf_counter()
+    loaded = memory_status()
+    for tick in range(ticks):
+        if tick % 10 == 0:
+            game.shoot()
+        game.update(INPUTS[RIGHT | (UP if tick % 40 == 0 else 0)])
+    end = time.perf_counter()
+    after = memory_status()
+    result = {"format": kind, "open_ms": (opened - start) * 1000, "first_tick_ms": (first_tick - opened) * 1000,
+              "tick_ms": (end - first_tick) / max(ticks, 1) * 1000}
+    for name in before:
+        result[name + "_kb"] = loaded[name] - before[name]
+        result[name + "_end_kb"] = after[name] - before[name]
+    return result
+
+
+# Map a pack, read every tile and report the mapping's usage once the parent
+# says every process has done the same
+def share_child(path):
+    pack = LevelPack(path)
+    int(np.bitwise_or.reduce(pack.sections["tiles"], axis=None))
+    print("ready", flush=True)
+    sys.stdin.readline()
+    print(json.dumps(mapping_usage(path)), flush=True)
+    sys.stdin.readline()
+
+
+def run_child(args):
+    command = [sys.executable, os.path.abspath(__file__), "--child"] + [str(arg) for arg in args]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def measure_share(path, processes):
+    command = [sys.executable, os.path.abspath(__file__), "--child", "share", path]
+    children = [subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                for _ in range(processes)]
+    for child in children:
+        while child.stdout.readline().strip() != "ready":
+            pass
+    usage = []
+    for child in children:
+        child.stdin.write("\n")
+        child.stdin.flush()
+    for child in children:
+        usage.append(json.loads(child.stdout.readline()))
+    for child in children:
+        child.stdin.write("\n")
+        child.stdin.flush()
+        child.wait()
+    return usage
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare startup time and memory of JSON levels and level packs")
+    parser.add_argument("--copies", type=int, nargs="+", default=[1, 10, 100, 1000],
+                        help="world sizes, in copies of the level")
+    parser.add_argument("--level", help="level file to stretch, the first shipped level by default")
+    parser.add_argument("--ticks", type=int, default=120, help="ticks to play after the first")
+    parser.add_argument("--share", type=int, default=0, metavar="N",
+                        help="also map the biggest pack from N processes at once")
+    parser.add_argument("--dir", help="keep the compiled worlds here instead of a temporary directory")
+    parser.add_argument("--output", help="write the results as JSON here")
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        if args.child[0] == "share":
+            share_child(args.child[1])
+        else:
+            print(json.dumps(measure_startup(args.child[0], args.child[1], int(args.child[2]))))
+        return 0
+
+    module = load_game()
+    data = read_level(args.level or level_files()[0])
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        directory = args.dir or scratch
+        print("%7s %6s %9s | %9s %9s %9s | %-13s %-13s %-13s  (kB after the first tick/end)" % (
+            "copies", "format", "file MB", "open ms", "1st tick", "tick ms", "RSS", "anon", "file"))
+        for copies in args.copies:
+            paths = {"json": os.path.join(directory, "world%d.json" % copies),
+                     "pack": os.path.join(directory, "world%d.lvl" % copies)}
+            world = stretch_level(data, copies)
+            with open(paths["json"], "w") as f:
+                json.dump(world, f)
+            compile_level(module.build_level(world), paths["pack"], module.HEIGHT)
+            for kind in FORMATS:
+                row = run_child([kind, paths[kind], args.ticks])
+                row["copies"] = copies
+                row["file_mb"] = os.path.getsize(paths[kind]) / 1e6
+                results.append(row)
+                print("%7d %6s %9.1f | %9.2f %9.2f %9.2f | %6d/%-6d %6d/%-6d %6d/%-6d" % (
+                    copies, kind, row["file_mb"], row["open_ms"], row["first_tick_ms"], row["tick_ms"],
+                    row["VmRSS_kb"], row["VmRSS_end_kb"], row["RssAnon_kb"], row["RssAnon_end_kb"],
+                    row["RssFile_kb"], row["RssFile_end_kb"]))
+
+        if args.share:
+            path = os.path.join(directory, "world%d.lvl" % args.copies[-1])
+            usage = measure_share(path, args.share)
+            print("%d processes reading all of %s (%.1f MB): pack RSS %s kB, PSS %s kB" % (
+                args.share, os.path.basename(path), os.path.getsize(path) / 1e6,
+                "/".join(str(entry["Rss"]) for entry in usage), "/".join(str(entry["Pss"]) for entry in usage)))
+            results.append({"share": args.share, "usage": usage})
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# Memory profiling mode.
+#
+# Off unless the game is started with --memory-profile: a normal run holds no
+# profiler and pays one None check per frame. When on, tracemalloc traces every
+# allocation (the game runs noticeably slower, this is a diagnostic mode) and
+# every interval frames the profiler takes a sample of:
+#  - the traced Python heap, as a tracemalloc snapshot diffed against the last
+#  - live instances and shallow bytes of the game classes, found through gc
+#  - bullet pool counts, capacity and array bytes
+#  - surface cache bytes and entries
+#  - the platform grid arrays, the spatial index overhead
+# The report lists the series, the allocation sites that grew the most from
+# the first snapshot to the last, and anything that grew at every one of the
+# last few samples, the usual sign of a leak such as bullets never culled.
+import collections
+import gc
+import sys
+import tracemalloc
+
+TRACKED_CLASSES = ("Player", "Bullet", "Enemy", "Platform", "Spike", "HealthPickup")
+
+# A series that grew at this many samples in a row is reported as a suspect
+LEAK_SAMPLES = 4
+
+TRACE_FRAMES = 8
+TOP_SITES = 10
+
+
+def pool_bytes(pool):
+    return pool.x.nbytes + pool.y.nbytes + pool.vel_x.nbytes + pool.vel_y.nbytes + pool.ids.nbytes
+
+
+# Live instances and shallow bytes (object plus attribute dict) per tracked class
+def class_usage(names=TRACKED_CLASSES):
+    counts = collections.Counter()
+    sizes = collections.Counter()
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        if name in names:
+            counts[name] += 1
+            sizes[name] += sys.getsizeof(obj) + sys.getsizeof(getattr(obj, "__dict__", None))
+    return counts, sizes
+
+
+class MemoryProfiler:
+    def __init__(self, surface_cache=None, interval=600, trace_frames=TRACE_FRAMES):
+        self.surface_cache = surface_cache
+        self.interval = interval
+        self.trace_frames = trace_frames
+        self.frame = 0
+        self.samples = []  # (frame, {metric: value})
+        self.first = None  # First tracemalloc snapshot
+        self.last = None
+        self.started = False  # Whether start() turned tracing on
+
+    # Traces allocations unless someone else already is, and then leaves their
+    # session running at stop()
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            self.started = True
+
+    def stop(self):
+        if self.started:
+            tracemalloc.stop()
+            self.started = False
+
+    # Call once per frame, samples every interval frames
+    def tick(self, game):
+        self.frame += 1
+        if self.frame % self.interval == 0:
+            self.sample(game)
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),  # The samples themselves
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ])
+
+    def sample(self, game):
+        self.last = self._snapshot()
+        if self.first is None:
+            self.first = self.last
+        metrics = collections.OrderedDict()
+        metrics["traced bytes"] = sum(trace.size for trace in self.last.traces)
+        metrics["traced peak"] = tracemalloc.get_traced_memory()[1]
+        counts, sizes = class_usage()
+        for name in TRACKED_CLASSES:
+            metrics[name] = counts[name]
+            metrics[name + " bytes"] = sizes[name]
+        for label, pool in (("player bullets", game.player_bullets), ("enemy bullets", game.enemy_bullets)):
+            metrics[label] = len(pool)
+            metrics[label + " capacity"] = pool.x.shape[0]
+            metrics[label + " bytes"] = pool_bytes(pool)
+        if self.surface_cache is not None:
+            metrics["surface cache bytes"] = self.surface_cache.bytes
+            metrics["surface cache entries"] = len(self.surface_cache)
+        grid = game.platform_grid
+        metrics["platform grid bytes"] = grid.table.nbytes + grid.rects.nbytes + sys.getsizeof(grid.platforms)
+        self.samples.append((self.frame, metrics))
+        return metrics
+
+    # Metrics that grew at each of the last LEAK_SAMPLES samples
+    def suspects(self):
+        if len(self.samples) <= LEAK_SAMPLES:
+            return []
+        recent = [metrics for _, metrics in self.samples[-LEAK_SAMPLES - 1:]]
+        return [name for name in recent[-1]
+                if name != "traced peak" and all(b[name] > a[name] for a, b in zip(recent, recent[1:]))]
+
+    def report(self):
+        if not self.samples:
+            return "memory: no samples (ran for fewer than %d frames)" % self.interval
+        names = list(self.samples[-1][1])
+        columns = self.samples if len(self.samples) <= 6 else (
+            self.samples[:2] + self.samples[len(self.samples) // 2:len(self.samples) // 2 + 1] + self.samples[-3:])
+        lines = ["memory samples, every %d frames" % self.interval,
+                 "%-24s" % "frame" + "".join("%12d" % frame for frame, _ in columns)]
+        for name in names:
+            lines.append("%-24s" % name + "".join("%12d" % metrics.get(name, 0) for _, metrics in columns))
+
+        if self.first is not None and self.last is not self.first:
+            lines.append("allocation growth by line, frame %d to %d:" % (self.samples[0][0], self.samples[-1][0]))
+            for stat in [stat for stat in self.last.compare_to(self.first, "lineno")
+                         if stat.size_diff > 0][:TOP_SITES]:
+                frame = stat.traceback[0]
+                lines.append("  %+10.1f kB %+7d blocks  %s:%d" % (
+                    stat.size_diff / 1024, stat.count_diff, frame.filename, frame.lineno))
+        suspects = self.suspects()
+        if suspects:
+            lines.append("grew at each of the last %d samples: %s" % (LEAK_SAMPLES, ", ".join(suspects)))
+        return "\n".join(lines)
@@ -0,0 +1,272 @@
+# In-process network simulator for testing the netcode offline.
+#
+# Every packet between the GameServer and its clients goes through a Link, one
+# per client and direction. A link delays packets by the latency plus uniform
+# jitter, drops some, duplicates some and holds a few back long enough to
+# arrive after later ones. Everything runs on a virtual millisecond clock with
+# one seeded RNG per link, so a run is the same every time and takes no longer
+# than the simulation itself.
+#
+# The clients behave like real ones: they say hello until welcomed, send an
+# input every tick of their own (not in answer to snapshots), predict their own
+# player (prediction.py) and reconcile with every snapshot they can decode.
+# The report shows, per network profile, what reached the clients (snapshot
+# rate, gaps, stale and undecodable snapshots), the input round trip, and how
+# often prediction had to be corrected.
+#
+#   python netsim.py                                  # every profile
+#   python netsim.py --profiles wifi mobile --clients 8
+#   python netsim.py --latency 80 --jitter 30 --loss 0.1 --seed 3
+import argparse
+import heapq
+import json
+import random
+import sys
+import time
+
+import protocol
+from behaviours import BEHAVIOURS
+from bench import percentile
+from prediction import Predictor
+from server import GameServer, TICK_RATE
+
+HELLO_RETRY_MS = 500
+
+# Packets held back to be reordered arrive this much later
+REORDER_MS = 40
+
+
+# One-way network conditions
+class Conditions:
+    def __init__(self, latency_ms=0, jitter_ms=0, loss=0, duplicate=0, reorder=0, reorder_ms=REORDER_MS):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.loss = loss  # Probability a packet is dropped
+        self.duplicate = duplicate  # Probability it arrives twice
+        self.reorder = reorder  # Probability it is held back behind later packets
+        self.reorder_ms = reorder_ms
+
+    def describe(self):
+        return "%g ms +-%g, %g%% loss, %g%% dup, %g%% reorder" % (
+            self.latency_ms, self.jitter_ms, self.loss * 100, self.duplicate * 100, self.reorder * 100)
+
+
+PROFILES = {
+    "perfect": Conditions(),
+    "lan": Conditions(1, 0.5),
+    "broadband": Conditions(25, 5, loss=0.005),
+    "wifi": Conditions(40, 15, loss=0.02, duplicate=0.01, reorder=0.02),
+    "mobile": Conditions(100, 40, loss=0.05, duplicate=0.01, reorder=0.05),
+    "satellite": Conditions(300, 20, loss=0.02),
+}
+
+
+# Packets in one direction, delivered by poll() once the clock reaches them
+class Link:
+    def __init__(self, conditions, seed, clock):
+        self.conditions = conditions
+        self.rng = random.Random(seed)
+        self.clock = clock
+        self.queue = []  # Heap of (delivery time, order sent, payload)
+        self.order = 0
+        self.sent = 0
+        self.dropped = 0
+        self.duplicated = 0
+        self.delivered = 0
+
+    def send(self, payload):
+        conditions = self.conditions
+        rng = self.rng
+        self.sent += 1
+        if rng.random() < conditions.loss:
+            self.dropped += 1
+            return
+        copies = 1
+        if rng.random() < conditions.duplicate:
+            self.duplicated += 1
+            copies = 2
+        for _ in range(copies):
+            delay = max(conditions.latency_ms + rng.uniform(-conditions.jitter_ms, conditions.jitter_ms), 0)
+            if rng.random() < conditions.reorder:
+                delay += conditions.reorder_ms
+            heapq.heappush(self.queue, (self.clock() + delay, self.order, payload))
+            self.order += 1
+
+    # Payloads due by now, in arrival order
+    def poll(self):
+        now = self.clock()
+        while self.queue and self.queue[0][0] <= now:
+            self.delivered += 1
+            yield heapq.heappop(self.queue)[2]
+
+
+class SimClient:
+    def __init__(self, index, level, module, behaviour, seed, phase_ms=0):
+        self.index = index
+        self.next_step_ms = phase_ms  # Clients don't tick in step with the server
+        self.behaviour = behaviour
+        self.rng = random.Random("%s:%d:input" % (seed, index))
+        self.memory = {}  # The behaviour's state
+        self.up = None  # Link to the server
+        self.down = None  # Link from the server
+        self.remote = None  # The server's RemoteClient, once the hello got through
+        self.player_id = None
+        self.last_hello = None
+        self.tick = 0
+        self.sequence = 0
+        self.receiver = protocol.SnapshotReceiver()
+        self.snapshot = None  # Newest decoded, what the behaviour sees
+        self.predictor = Predictor(level, module)
+        self.sent_at = {}  # Input sequence -> send time
+        self.round_trips = []
+        self.arrivals = []
+        self.decoded = 0
+        self.stale = 0  # Older than one already decoded, or a duplicate
+
+    def receive(self, now):
+        for payload in self.down.poll():
+            kind = protocol.message_type(payload)
+            if kind == protocol.WELCOME:
+                if self.player_id is None:
+                    self.player_id, _ = protocol.decode_welcome(payload)
+            elif kind == protocol.SNAPSHOT:
+                self.arrivals.append(now)
+                latest = self.receiver.latest
+                missing = self.receiver.missing_baseline
+                snapshot = self.receiver.decode(payload)
+                if snapshot is None:
+                    if self.receiver.missing_baseline == missing and latest >= 0:
+                        self.stale += 1
+                    continue
+                self.decoded += 1
+                self.snapshot = snapshot
+                sent = self.sent_at.pop(snapshot.input_sequence, None)
+                if sent is not None:
+                    self.round_trips.append(now - sent)
+                self.predictor.reconcile(snapshot)
+
+    # One tick of the client: say hello or send the next input
+    def step(self, now):
+        if self.player_id is None:
+            if self.last_hello is None or now - self.last_hello >= HELLO_RETRY_MS:
+                self.up.send(protocol.encode_hello())
+                self.last_hello = now
+            return
+        bits = self.behaviour(self, self.tick, self.snapshot)
+        self.tick += 1
+        self.sequence += 1
+        self.sent_at[self.sequence] = now
+        self.up.send(protocol.encode_input(self.sequence, self.receiver.latest, bits))
+        self.predictor.apply(self.sequence, bits)
+
+
+# Run a server and clients over links with the given conditions for a number
+# of simulated seconds, returns the statistics
+def simulate(conditions, clients=4, seconds=10, behaviour="run-and-gun", tick_rate=TICK_RATE, seed=0):
+    now = [0.0]
+    clock = lambda: now[0]
+    server = GameServer(tick_rate=tick_rate)
+    level, module = server.coop.level, server.coop.module
+    rng = random.Random(seed)
+    interval = 1000 / tick_rate
+    sims = []
+    for index in range(clients):
+        sim = SimClient(index, level, module, BEHAVIOURS[behaviour], seed, rng.uniform(0, interval))
+        sim.up = Link(conditions, "%s:%d:up" % (seed, index), clock)
+        sim.down = Link(conditions, "%s:%d:down" % (seed, index), clock)
+        sims.append(sim)
+
+    server_tick = 0
+    start = time.perf_counter()
+    for ms in range(int(seconds * 1000)):
+        now[0] = float(ms)
+        for sim in sims:
+            for payload in sim.up.poll():
+                if sim.remote is None:
+                    if protocol.message_type(payload) == protocol.HELLO:
+                        sim.remote = server.connect(sim.down.send)
+                    continue
+                server.receive(sim.remote, payload)
+        if ms >= server_tick * interval:
+            server.step()
+            server_tick += 1
+        for sim in sims:
+            sim.receive(now[0])
+            if ms >= sim.next_step_ms:
+                sim.step(now[0])
+                sim.next_step_ms += interval
+    elapsed = time.perf_counter() - start
+
+    stats = server.stats()
+    gaps = sorted(b - a for sim in sims for a, b in zip(sim.arrivals, sim.arrivals[1:]))
+    trips = sorted(trip for sim in sims for trip in sim.round_trips)
+    replays = sorted(t for sim in sims for t in sim.predictor.replay_times)
+    reconciled = sum(sim.predictor.reconciled for sim in sims)
+    links = [sim.up for sim in sims] + [sim.down for sim in sims]
+    return {
+        "conditions": conditions.describe(),
+        "seconds": seconds,
+        "clients": clients,
+        "wall_s": elapsed,
+        "snapshots_sent": stats["snapshots_sent"] / clients / seconds,
+        "snapshots_received": sum(len(sim.arrivals) for sim in sims) / clients / seconds,
+        "snapshots_decoded": sum(sim.decoded for sim in sims) / clients / seconds,
+        "stale": sum(sim.stale for sim in sims),
+        "undecodable": sum(sim.receiver.missing_baseline for sim in sims),
+        "full_snapshots": stats["full_snapshots"],
+        "kb_per_s": stats["bytes_sent"] / clients / seconds / 1024,
+        "dropped": sum(link.dropped for link in links),
+        "duplicated": sum(link.duplicated for link in links),
+        "gap_ms_p50": percentile(gaps, 0.5),
+        "gap_ms_p99": percentile(gaps, 0.99),
+        "gap_ms_max": gaps[-1] if gaps else 0.0,
+        "round_trip_ms_p50": percentile(trips, 0.5),
+        "round_trip_ms_p99": percentile(trips, 0.99),
+        "corrections": sum(sim.predictor.corrections for sim in sims),
+        "correction_rate": sum(sim.predictor.corrections for sim in sims) / max(reconciled, 1),
+        "replay_ms_p50": percentile(replays, 0.5) * 1000,
+        "replay_ms_max": replays[-1] * 1000 if replays else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play the co-op game over a simulated network")
+    parser.add_argument("--profiles", nargs="+", choices=list(PROFILES), help="network profiles to run")
+    parser.add_argument("--latency", type=float, help="one-way latency in ms, runs a custom profile")
+    parser.add_argument("--jitter", type=float, default=0, help="uniform jitter in ms, +-")
+    parser.add_argument("--loss", type=float, default=0)
+    parser.add_argument("--duplicate", type=float, default=0)
+    parser.add_argument("--reorder", type=float, default=0)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10, help="simulated time")
+    parser.add_argument("--behaviour", choices=list(BEHAVIOURS), default="wander")
+    parser.add_argument("--tick-rate", type=int, default=TICK_RATE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    if args.latency is not None:
+        profiles = {"custom": Conditions(args.latency, args.jitter, args.loss, args.duplicate, args.reorder)}
+    else:
+        profiles = {name: PROFILES[name] for name in args.profiles or PROFILES}
+
+    results = {}
+    print("%d clients (%s), %g s simulated, per client" % (args.clients, args.behaviour, args.seconds))
+    print("%-10s %6s %6s %6s %6s %6s %8s %8s %7s %9s %9s" % (
+        "profile", "sent/s", "recv/s", "used/s", "stale", "undec", "gap p99", "RTT p50", "kB/s",
+        "corrected", "replay ms"))
+    for name, conditions in profiles.items():
+        row = simulate(conditions, args.clients, args.seconds, args.behaviour, args.tick_rate, args.seed)
+        results[name] = row
+        print("%-10s %6.1f %6.1f %6.1f %6d %6d %8.1f %8.1f %7.2f %8.1f%% %9.3f" % (
+            name, row["snapshots_sent"], row["snapshots_received"], row["snapshots_decoded"], row["stale"],
+            row["undecodable"], row["gap_ms_p99"], row["round_trip_ms_p50"], row["kb_per_s"],
+            row["correction_rate"] * 100, row["replay_ms_p50"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+# Parallax background made of pre-rendered, horizontally wrapping tiles.
+#
+# Each layer's art is drawn once into a tile surface. Every frame the tile is
+# blitted at the layer's scroll offset, which takes one or two blits per layer
+# however detailed the art is.
+import math
+
+import pygame
+
+
+# Create a tile surface with a transparent colorkey and let draw() paint on it
+def make_tile(width, height, draw, colorkey=(255, 0, 255)):
+    tile = pygame.Surface((width, height)).convert()
+    tile.fill(colorkey)
+    tile.set_colorkey(colorkey, pygame.RLEACCEL)
+    draw(tile)
+    return tile
+
+
+class ParallaxLayer:
+    def __init__(self, tile, factor, y=0):
+        self.tile = tile
+        self.factor = factor  # 0 stays fixed, 1 moves with the level
+        self.y = y
+        self.width = tile.get_width()
+
+    def draw(self, surface, scroll):
+        # Small epsilon so factors like 1/3 land on the same pixel as scroll // 3
+        offset = math.floor(scroll * self.factor + 1e-6) % self.width
+        x = -offset
+        surface_width = surface.get_width()
+        while x < surface_width:
+            surface.blit(self.tile, (x, self.y))
+            x += self.width
+
+
+class ParallaxBackground:
+    def __init__(self, color, layers=()):
+        self.color = color
+        self.layers = list(layers)
+
+    def add_layer(self, layer):
+        self.layers.append(layer)
+
+    # Layers are drawn back to front in the order they were added
+    def draw(self, surface, scroll):
+        surface.fill(self.color)
+        for layer in self.layers:
+            layer.draw(surface, scroll)
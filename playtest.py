@@ -0,0 +1,177 @@
+# Batch playtesting with bots over a process pool.
+#
+# Plays many headless single-player sessions of V4, each one a level file and a
+# bot policy (a behaviour from behaviours.py) with its own seed, spread over a
+# multiprocessing pool. Sessions end when the level is complete, the player
+# dies or --max-seconds of game time run out. Results come back one by one as
+# workers finish them: a running summary is printed every --report-every
+# sessions and, with --output, every result is appended to a JSON lines file
+# right away, so a long batch can be watched or cut short without losing what
+# was already played.
+#
+# The final report gives per policy and level the completion rate, time to
+# reach the boss, deaths by cause (spike, enemy contact, enemy bullet) and
+# timeouts, plus the simulation speed of every worker.
+#
+#   python playtest.py --sessions 1000
+#   python playtest.py --sessions 5000 --workers 8 --policies boss --output runs.jsonl
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from behaviours import GAME_BEHAVIOURS, BotState
+from bench import percentile
+from campaign import level_files, read_level
+from coop import INPUTS, SHOOT, load_game
+from kinds import CAUSES
+from levelpack import LevelPack
+
+TICK_RATE = 60
+
+
+# The policies played by default, out of the behaviours (behaviours.py)
+POLICIES = ("random", "run-and-shoot", "boss")
+
+_levels = {}
+
+
+# Parsed level data, read once per worker. Level packs are mapped instead, so
+# the workers share their pages.
+def level_data(path):
+    if path not in _levels:
+        _levels[path] = LevelPack(path) if path.endswith(".lvl") else read_level(path)
+    return _levels[path]
+
+
+# Play one session, returns a JSON-friendly dict
+def play_session(task):
+    index, path, policy_name, seed, max_ticks = task
+    module = load_game()
+    data = level_data(path)
+    game = module.Game(module.open_level(data) if isinstance(data, LevelPack) else module.build_level(data, scheduled=True))
+    policy = GAME_BEHAVIOURS[policy_name]
+    bot = BotState(seed)
+    boss_tick = None
+    start = time.perf_counter()
+    tick = 0
+    while tick < max_ticks and not (game.game_over or game.level_complete):
+        bits = policy(bot, tick, game)
+        game.update(INPUTS[bits & 31])
+        if bits & SHOOT:
+            game.shoot()
+        tick += 1
+        if boss_tick is None and game.boss.x < game.scroll + module.WIDTH:
+            boss_tick = tick
+    elapsed = time.perf_counter() - start
+    return {
+        "index": index,
+        "level": os.path.basename(path),
+        "policy": policy_name,
+        "seed": seed,
+        "completed": game.level_complete,
+        "death": game.death_cause,
+        "ticks": tick,
+        "boss_tick": boss_tick,
+        "health": game.player.health,
+        "boss_health": game.boss.health,
+        "seconds": elapsed,
+        "worker": os.getpid(),
+    }
+
+
+# Running totals of the results seen so far, by (policy, level)
+class Summary:
+    def __init__(self):
+        self.groups = collections.OrderedDict()
+        self.workers = collections.defaultdict(lambda: [0, 0.0])  # pid -> [ticks, seconds]
+        self.count = 0
+
+    def add(self, result):
+        key = (result["policy"], result["level"])
+        group = self.groups.setdefault(key, {"sessions": 0, "completed": 0, "timeouts": 0, "boss_ticks": [],
+                                             "deaths": collections.Counter()})
+        group["sessions"] += 1
+        group["completed"] += result["completed"]
+        if result["death"]:
+            group["deaths"][result["death"]] += 1
+        elif not result["completed"]:
+            group["timeouts"] += 1
+        if result["boss_tick"] is not None:
+            group["boss_ticks"].append(result["boss_tick"])
+        worker = self.workers[result["worker"]]
+        worker[0] += result["ticks"]
+        worker[1] += result["seconds"]
+        self.count += 1
+
+    def progress(self, total, elapsed):
+        completed = sum(group["completed"] for group in self.groups.values())
+        ticks = sum(worker[0] for worker in self.workers.values())
+        return "%d / %d sessions, %.1f%% completed, %.0f ticks/s overall" % (
+            self.count, total, completed / max(self.count, 1) * 100, ticks / max(elapsed, 1e-9))
+
+    def report(self):
+        lines = ["%-14s %-12s %8s %9s %10s %10s %7s %8s %8s %8s" % (
+            "policy", "level", "sessions", "complete", "boss p50 s", "reached", "spike", "contact", "bullet",
+            "timeout")]
+        order = list(GAME_BEHAVIOURS)
+        for (policy, level), group in sorted(self.groups.items(), key=lambda item: (order.index(item[0][0]),
+                                                                                      item[0][1])):
+            boss_ticks = sorted(group["boss_ticks"])
+            lines.append("%-14s %-12s %8d %8.1f%% %10s %10d %7d %8d %8d %8d" % (
+                policy, level, group["sessions"], group["completed"] / group["sessions"] * 100,
+                "%.1f" % (percentile(boss_ticks, 0.5) / TICK_RATE) if boss_ticks else "-", len(boss_ticks),
+                *[group["deaths"][cause] for cause in CAUSES], group["timeouts"]))
+        lines.append("ticks/s per worker: " + "  ".join(
+            "%d: %.0f" % (pid, ticks / max(seconds, 1e-9)) for pid, (ticks, seconds) in sorted(self.workers.items())))
+        return "\n".join(lines)
+
+
+def make_tasks(args, paths):
+    tasks = []
+    for index in range(args.sessions):
+        policy = args.policies[index % len(args.policies)]
+        path = paths[(index // len(args.policies)) % len(paths)]
+        tasks.append((index, path, policy, args.seed + index, int(args.max_seconds * TICK_RATE)))
+    return tasks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play many headless sessions with bots and summarize them")
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--policies", nargs="+", choices=list(GAME_BEHAVIOURS), default=list(POLICIES))
+    parser.add_argument("--levels", nargs="+", help="level files or compiled .lvl packs, the shipped level files by default")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-seconds", type=float, default=120, help="game time before a session times out")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report-every", type=int, default=50, help="print a progress line every N sessions")
+    parser.add_argument("--output", help="append every result to this JSON lines file as it arrives")
+    args = parser.parse_args(argv)
+
+    tasks = make_tasks(args, args.levels or level_files())
+    summary = Summary()
+    output = open(args.output, "a") if args.output else None
+    start = time.perf_counter()
+    # Small chunks keep results flowing back while every worker stays busy
+    chunksize = max(1, min(8, len(tasks) // (args.workers * 8)))
+    try:
+        with multiprocessing.Pool(args.workers) as pool:
+            for result in pool.imap_unordered(play_session, tasks, chunksize):
+                summary.add(result)
+                if output:
+                    output.write(json.dumps(result) + "\n")
+                    output.flush()
+                if summary.count % args.report_every == 0 or summary.count == len(tasks):
+                    print(summary.progress(len(tasks), time.perf_counter() - start), flush=True)
+    finally:
+        if output:
+            output.close()
+    print(summary.report())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
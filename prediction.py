@@ -0,0 +1,123 @@
+# Client-side prediction and server reconciliation for the local player.
+#
+# A client moves its own player as soon as it sends an input instead of waiting
+# a round trip for the server: every input is applied locally with the same
+# movement code the server runs (step_player in V4) and kept, together with the
+# state it predicted, until a snapshot says the server has applied it. The
+# server's state for that input is then compared with the prediction. If they
+# agree up to the snapshot quantization nothing else happens; otherwise the
+# player is rewound to the server state and the inputs still in flight are
+# replayed on top of it.
+#
+# Movement only reads the player state, the keys and the platforms, so a replay
+# gives exactly what the server will compute for the same inputs. Replays only
+# sweep the platforms near the player, looked up in the level's PlatformGrid;
+# with ~12 inputs in flight at 200 ms that keeps a full replay well under a
+# millisecond (see prediction_bench.py).
+import collections
+import time
+
+from coop import INPUTS, load_game
+
+# Snapshots carry positions to 1/8 px and velocities to 1/16 px per tick
+POSITION_TOLERANCE = 0.25
+VELOCITY_TOLERANCE = 0.125
+
+# Platforms this far around the player are swept, more than one tick of movement
+NEARBY_MARGIN = 32
+
+
+# Movement state (see Player.get_state) of a decoded player record
+def record_state(record):
+    return (float(record["x"]), float(record["y"]), 0, float(record["vel_y"]), bool(record["jumping"]),
+            int(record["direction"]), (int(record["aim_x"]), int(record["aim_y"])))
+
+
+# Whether a predicted state matches the server's within the quantization
+def close(predicted, server):
+    return (abs(predicted[0] - server[0]) <= POSITION_TOLERANCE
+            and abs(predicted[1] - server[1]) <= POSITION_TOLERANCE
+            and abs(predicted[3] - server[3]) <= VELOCITY_TOLERANCE
+            and predicted[4] == server[4] and predicted[5] == server[5] and predicted[6] == server[6])
+
+
+class Predictor:
+    def __init__(self, level, module=None, nearby=True):
+        self.module = module or load_game()
+        self.level = level
+        self.nearby = nearby  # False sweeps every platform of the level
+        self.width = self.module.Player(0, 0).width
+        self.nearby_platforms = {}  # (first column, last column) -> platforms
+        self.state = None  # Predicted state, None until the first snapshot and while dead
+        self.pending = collections.deque()  # (sequence, bits, predicted state), not acknowledged yet
+        self.acknowledged = None  # Server state after the last acknowledged input
+        self.reconciled = 0
+        self.corrections = 0
+        self.replayed = 0
+        self.replay_times = []  # Seconds per correction
+
+    def _platforms(self, state):
+        if not self.nearby:
+            return self.level.platforms
+        grid = self.level.platform_grid
+        key = (int((state[0] - NEARBY_MARGIN) // grid.cell_size),
+               int((state[0] + self.width + NEARBY_MARGIN) // grid.cell_size))
+        platforms = self.nearby_platforms.get(key)
+        if platforms is None:
+            left, right = key[0] * grid.cell_size, (key[1] + 1) * grid.cell_size - 1
+            platforms = self.nearby_platforms[key] = [
+                self.level.platforms[i] for i in grid.query_range(left, right)]
+        return platforms
+
+    def step(self, state, bits):
+        return self.module.step_player(state, INPUTS[bits & 31], self._platforms(state), self.level.length)
+
+    # Apply an input the moment it is sent. Without a state yet it is only
+    # kept, to be replayed once a snapshot gives one.
+    def apply(self, sequence, bits):
+        if self.state is not None:
+            self.state = self.step(self.state, bits)
+        self.pending.append((sequence, bits, self.state))
+
+    # Replay the pending inputs on top of a server state, returns the new
+    # pending entries and the final state
+    def replay(self, state):
+        entries = []
+        for sequence, bits, _ in self.pending:
+            state = self.step(state, bits)
+            entries.append((sequence, bits, state))
+        return entries, state
+
+    # Take a decoded snapshot into account, returns True if the player had to
+    # be corrected
+    def reconcile(self, snapshot):
+        record = snapshot.own_player()
+        if record is None:
+            return False
+        server = record_state(record)
+        # With no new input applied the server state shouldn't have changed
+        predicted = self.acknowledged
+        self.acknowledged = server
+        while self.pending and self.pending[0][0] <= snapshot.input_sequence:
+            sequence, _, state = self.pending.popleft()
+            if sequence == snapshot.input_sequence:
+                predicted = state
+        if record["health"] <= 0:
+            # Dead players don't move, pick up again from wherever they respawn
+            self.state = self.acknowledged = None
+            return False
+        if self.state is None:
+            entries, self.state = self.replay(server)
+            self.pending = collections.deque(entries)
+            return False
+        self.reconciled += 1
+        if predicted is not None and close(predicted, server):
+            return False
+
+        self.corrections += 1
+        start = time.perf_counter()
+        entries, self.state = self.replay(server)
+        self.pending = collections.deque(entries)
+        self.replay_times.append(time.perf_counter() - start)
+        self.replayed += len(entries)
+        return True
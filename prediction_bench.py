@@ -0,0 +1,122 @@
+# Client-side prediction benchmark.
+#
+# Runs a GameServer in process with one predicting client (and optionally a few
+# more plain ones) behind a fixed round-trip latency, ticking the server and
+# the client in lock step so runs are deterministic. Every snapshot the client
+# reconciles, and on top of that the benchmark times a forced rewind-and-replay
+# of everything still in flight: the worst case a snapshot can cost. Reported
+# per latency: inputs in flight, how often the prediction had to be corrected,
+# and the reconcile and forced replay times per snapshot.
+#
+#   python prediction_bench.py                        # 0, 50, 100 and 200 ms
+#   python prediction_bench.py --latencies 200 --behaviour wander --all-platforms
+import argparse
+import collections
+import json
+import sys
+import time
+
+import protocol
+from behaviours import BEHAVIOURS, BotState
+from bench import percentile
+from prediction import Predictor
+from server import GameServer
+
+
+# Packets in one direction, delivered a fixed number of ticks after sending
+class Pipe:
+    def __init__(self, delay):
+        self.delay = delay
+        self.queue = collections.deque()  # (delivery tick, payload)
+
+    def send(self, tick, payload):
+        self.queue.append((tick + self.delay, payload))
+
+    def receive(self, tick):
+        while self.queue and self.queue[0][0] <= tick:
+            yield self.queue.popleft()[1]
+
+
+def measure(latency_ms, ticks, behaviour, nearby=True, others=0, tick_rate=60, seed=0):
+    bot = BotState(seed)
+    server = GameServer(tick_rate=tick_rate)
+    # Half the round trip each way, in whole ticks
+    delay = round(latency_ms / 1000 * tick_rate / 2)
+    up, down = Pipe(delay), Pipe(delay)
+    tick = 0
+    client = server.connect(lambda payload: down.send(tick, payload))
+    for _ in range(others):
+        server.connect(lambda payload: None)
+    receiver = protocol.SnapshotReceiver()
+    predictor = Predictor(server.coop.level, server.coop.module, nearby)
+    sequence = 0
+    pending, reconcile_times, replay_times = [], [], []
+
+    for tick in range(ticks):
+        for payload in up.receive(tick):
+            server.receive(client, payload)
+        server.step()
+
+        snapshot = None
+        for payload in down.receive(tick):
+            if protocol.message_type(payload) == protocol.SNAPSHOT:
+                snapshot = receiver.decode(payload) or snapshot
+        if snapshot is None:
+            continue
+        start = time.perf_counter()
+        predictor.reconcile(snapshot)
+        reconcile_times.append(time.perf_counter() - start)
+        if predictor.state is not None:
+            pending.append(len(predictor.pending))
+            start = time.perf_counter()
+            predictor.replay(predictor.acknowledged)
+            replay_times.append(time.perf_counter() - start)
+
+        bits = BEHAVIOURS[behaviour](bot, tick, snapshot)
+        sequence += 1
+        up.send(tick, protocol.encode_input(sequence, receiver.latest, bits))
+        predictor.apply(sequence, bits)
+
+    reconcile_times.sort()
+    replay_times.sort()
+    return {
+        "latency_ms": latency_ms,
+        "snapshots": len(reconcile_times),
+        "pending_mean": sum(pending) / max(len(pending), 1),
+        "corrections": predictor.corrections,
+        "correction_rate": predictor.corrections / max(predictor.reconciled, 1),
+        "reconcile_ms_mean": sum(reconcile_times) / max(len(reconcile_times), 1) * 1000,
+        "replay_ms_mean": sum(replay_times) / max(len(replay_times), 1) * 1000,
+        "replay_ms_p99": percentile(replay_times, 0.99) * 1000 if replay_times else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure client-side prediction and replay cost")
+    parser.add_argument("--latencies", type=float, nargs="+", default=[0, 50, 100, 200],
+                        help="round trip latencies in ms")
+    parser.add_argument("--ticks", type=int, default=1800)
+    parser.add_argument("--behaviour", choices=list(BEHAVIOURS), default="run-and-gun")
+    parser.add_argument("--others", type=int, default=0, help="extra clients that don't predict")
+    parser.add_argument("--all-platforms", action="store_true", help="sweep every platform, not just nearby ones")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    rows = []
+    print("%8s %9s %8s %11s %9s %13s %11s %10s" % (
+        "RTT ms", "snapshots", "pending", "corrections", "rate", "reconcile ms", "replay ms", "p99 ms"))
+    for latency in args.latencies:
+        row = measure(latency, args.ticks, args.behaviour, not args.all_platforms, args.others, seed=args.seed)
+        rows.append(row)
+        print("%8.0f %9d %8.1f %11d %8.1f%% %13.4f %11.4f %10.4f" % (
+            latency, row["snapshots"], row["pending_mean"], row["corrections"], row["correction_rate"] * 100,
+            row["reconcile_ms_mean"], row["replay_ms_mean"], row["replay_ms_p99"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"behaviour": args.behaviour, "nearby": not args.all_platforms, "rows": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+# Wire format shared by the multiplayer server and its clients.
+#
+# Every message starts with a one-byte type. A client sends HELLO until it gets
+# a WELCOME with its player id, then one INPUT per tick carrying its input
+# sequence number, the last snapshot tick it received and its input bits. The
+# server sends a SNAPSHOT every tick, delta-encoded against the last one the
+# client acknowledged (see snapshot_codec); entity records are NumPy structured
+# arrays so a whole list is packed or unpacked in one call.
+# Over TCP every message is prefixed with its length.
+import collections
+import struct
+
+import numpy as np
+
+from kinds import ENEMY_TYPES
+from snapshot_codec import COUNT_BITS, SnapshotCodec, bullet_schema, enemy_schema, player_schema
+
+HELLO, WELCOME, INPUT, SNAPSHOT, BYE = range(1, 6)
+
+# Largest UDP payload, snapshots are cut down to fit
+MAX_DATAGRAM = 65507
+
+WELCOME_FORMAT = struct.Struct("!BHH")  # type, player id, tick rate
+INPUT_FORMAT = struct.Struct("!BIiB")  # type, input sequence, last snapshot tick, input bits
+SNAPSHOT_HEADER = struct.Struct("!BIIIH")  # type, tick, baseline tick, last input sequence, player id
+NO_BASELINE = 0xFFFFFFFF
+FRAME_HEADER = struct.Struct("!I")  # TCP length prefix
+
+PLAYER_DTYPE = np.dtype([
+    ("id", ">u2"), ("x", ">f4"), ("y", ">f4"), ("vel_y", ">f4"), ("health", ">i2"),
+    ("direction", "i1"), ("aim_x", "i1"), ("aim_y", "i1"), ("jumping", "u1"),
+    ("cooldown", "u1"), ("invincibility", "u1"),
+])
+ENEMY_DTYPE = np.dtype([
+    ("id", ">u2"), ("type", "u1"), ("x", ">f4"), ("y", ">f4"), ("health", ">i2"), ("direction", "i1"),
+])
+BULLET_DTYPE = np.dtype([("id", ">u4"), ("x", ">f4"), ("y", ">f4"), ("vel_x", ">f4"), ("vel_y", ">f4")])
+
+CODEC = SnapshotCodec([
+    player_schema(PLAYER_DTYPE),
+    enemy_schema(ENEMY_DTYPE),
+    bullet_schema("player_bullets", BULLET_DTYPE),
+    bullet_schema("enemy_bullets", BULLET_DTYPE),
+])
+
+# Decoded snapshots a client keeps as possible baselines
+HISTORY = 64
+
+
+def message_type(data):
+    return data[0] if data else 0
+
+
+def encode_hello():
+    return bytes([HELLO])
+
+
+def encode_bye():
+    return bytes([BYE])
+
+
+def encode_welcome(player_id, tick_rate):
+    return WELCOME_FORMAT.pack(WELCOME, player_id, tick_rate)
+
+
+def decode_welcome(data):
+    _, player_id, tick_rate = WELCOME_FORMAT.unpack_from(data)
+    return player_id, tick_rate
+
+
+def encode_input(sequence, ack_tick, bits):
+    return INPUT_FORMAT.pack(INPUT, sequence, ack_tick, bits)
+
+
+# Returns (input sequence, last snapshot tick received, input bits)
+def decode_input(data):
+    _, sequence, ack_tick, bits = INPUT_FORMAT.unpack_from(data)
+    return sequence, ack_tick, bits
+
+
+def pack_players(players):
+    records = np.zeros(len(players), dtype=PLAYER_DTYPE)
+    for i, (player_id, player) in enumerate(players.items()):
+        records[i] = (player_id, player.x, player.y, player.vel_y, max(player.health, -32768),
+                      player.direction, player.shoot_direction[0], player.shoot_direction[1],
+                      player.is_jumping, player.shoot_cooldown, player.invincibility)
+    return records
+
+
+def pack_enemies(enemies):
+    records = np.zeros(len(enemies), dtype=ENEMY_DTYPE)
+    for i, enemy in enumerate(enemies):
+        records[i] = (enemy.net_id, ENEMY_TYPES.index(enemy.type), enemy.x, enemy.y,
+                      enemy.health, enemy.direction)
+    return records
+
+
+def pack_bullets(pool, limit=None):
+    count = len(pool) if limit is None else min(len(pool), limit)
+    records = np.empty(count, dtype=BULLET_DTYPE)
+    records["id"] = pool.ids[:count]
+    records["x"] = pool.x[:count]
+    records["y"] = pool.y[:count]
+    records["vel_x"] = pool.vel_x[:count]
+    records["vel_y"] = pool.vel_y[:count]
+    return records
+
+
+# The entity records of one tick
+class SnapshotBody:
+    def __init__(self, players, enemies, player_bullets, enemy_bullets):
+        self.players = players
+        self.enemies = enemies
+        self.player_bullets = player_bullets
+        self.enemy_bullets = enemy_bullets
+
+    def tables(self):
+        return [self.players, self.enemies, self.player_bullets, self.enemy_bullets]
+
+
+# Pack the state of a CoopGame. Bullets are cut so a full snapshot still fits in
+# max_bytes, enemy bullets first since they matter most to the clients.
+def snapshot_body(coop, max_bytes=MAX_DATAGRAM):
+    players = pack_players(coop.players)
+    enemies = pack_enemies(coop.enemies)
+    player_schema, enemy_schema, bullet_schema, _ = CODEC.schemas
+    room = ((max_bytes - SNAPSHOT_HEADER.size - 1) * 8 - len(CODEC.schemas) * COUNT_BITS
+            - len(players) * player_schema.full_bits() - len(enemies) * enemy_schema.full_bits())
+    per_bullet = bullet_schema.full_bits()
+    enemy_bullets = pack_bullets(coop.enemy_bullets, max(room, 0) // per_bullet)
+    room -= len(enemy_bullets) * per_bullet
+    player_bullets = pack_bullets(coop.player_bullets, max(room, 0) // per_bullet)
+    return SnapshotBody(players, enemies, player_bullets, enemy_bullets)
+
+
+def encode_snapshot(tick, baseline_tick, input_sequence, player_id, payload):
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT, tick, NO_BASELINE if baseline_tick is None else baseline_tick,
+                                  input_sequence, player_id)
+    return header + payload
+
+
+class Snapshot:
+    def __init__(self, tick, input_sequence, player_id, players, enemies, player_bullets, enemy_bullets):
+        self.tick = tick
+        self.input_sequence = input_sequence  # Last input of this client the server applied
+        self.player_id = player_id
+        self.players = players
+        self.enemies = enemies
+        self.player_bullets = player_bullets
+        self.enemy_bullets = enemy_bullets
+
+    # This client's own player record, or None
+    def own_player(self):
+        mine = self.players[self.players["id"] == self.player_id]
+        return mine[0] if len(mine) else None
+
+
+# Client side decoding: keeps recent decoded states to apply deltas to
+class SnapshotReceiver:
+    def __init__(self, codec=CODEC, history=HISTORY):
+        self.codec = codec
+        self.history = history
+        self.states = collections.OrderedDict()  # Tick -> State, oldest first
+        self.latest = -1  # Newest tick decoded, acknowledged with every input
+        self.missing_baseline = 0
+
+    # Decode a SNAPSHOT message. Returns None for one that is older than the
+    # newest decoded or whose baseline is no longer kept.
+    def decode(self, data):
+        _, tick, baseline_tick, sequence, player_id = SNAPSHOT_HEADER.unpack_from(data)
+        if tick <= self.latest:
+            return None
+        baseline = None
+        if baseline_tick != NO_BASELINE:
+            baseline = self.states.get(baseline_tick)
+            if baseline is None:
+                self.missing_baseline += 1
+                return None
+        state = self.codec.decode(data, tick, baseline, SNAPSHOT_HEADER.size)
+        self.states[tick] = state
+        self.latest = tick
+        while len(self.states) > self.history:
+            self.states.popitem(last=False)
+        return Snapshot(tick, sequence, player_id, *self.codec.records(state))
+
+
+# TCP framing: length prefix plus payload
+def frame(payload):
+    return FRAME_HEADER.pack(len(payload)) + payload
@@ -0,0 +1,145 @@
+# Performance regression gate.
+#
+# Times the hot paths (Player.move, the bullet updates, Enemy.update and the whole
+# frame) on the standard bench scenarios and compares them with stored baselines.
+# Each scenario is run a few times to warm up and then repeated, every run in a
+# fresh process so none inherits another's state; a metric counts
+# as a regression when a bootstrap confidence interval for the ratio of medians
+# (current / baseline) lies entirely above 1 + threshold, so run-to-run noise
+# doesn't fail the gate but a real slowdown does.
+#
+#   python regress.py record               # store perf_baseline.json
+#   python regress.py check                # exit 1 if a hot path got slower
+#   python regress.py check --threshold 0.05 --reps 9 --scenarios boss-fight
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+
+from bench import DEFAULT_TICKS, ROOT, SCENARIOS, git_revision, run_isolated
+
+BASELINE_FILE = os.path.join(ROOT, "perf_baseline.json")
+
+# Metric name -> how to read it from a bench result (ms per tick)
+METRICS = {
+    "frame": lambda result: result["frame_ms"]["mean"],
+    "player": lambda result: result["phases_ms_per_tick"]["player"],
+    "bullets": lambda result: result["phases_ms_per_tick"]["bullets"],
+    "enemies": lambda result: result["phases_ms_per_tick"]["enemies"],
+}
+
+# Metrics below this many ms per tick are too small to time reliably
+MIN_MS = 0.005
+
+
+# Run a scenario warmup + reps times and return the samples per metric
+def sample(path, scenario, ticks, reps, warmup):
+    samples = {name: [] for name in METRICS}
+    for i in range(warmup + reps):
+        result = run_isolated(path, scenario, ticks)
+        if i < warmup:
+            continue
+        for name, read in METRICS.items():
+            samples[name].append(read(result))
+    return samples
+
+
+# Bootstrap confidence interval for median(current) / median(baseline)
+def ratio_interval(baseline, current, confidence=0.95, resamples=2000, seed=0):
+    rng = random.Random(seed)
+    ratios = []
+    for _ in range(resamples):
+        base = statistics.median(rng.choices(baseline, k=len(baseline)))
+        cur = statistics.median(rng.choices(current, k=len(current)))
+        ratios.append(cur / base if base else 1.0)
+    ratios.sort()
+    tail = (1 - confidence) / 2
+    low = ratios[int(tail * (resamples - 1))]
+    high = ratios[int((1 - tail) * (resamples - 1))]
+    return low, high
+
+
+# Compare current samples against the baseline ones.
+# Returns one row per metric: (metric, baseline median, current median, ratio, low, high, verdict)
+def compare(baseline, current, threshold, confidence):
+    rows = []
+    for name in METRICS:
+        base, cur = baseline.get(name), current.get(name)
+        if not base or not cur:
+            continue
+        base_median = statistics.median(base)
+        cur_median = statistics.median(cur)
+        if base_median < MIN_MS and cur_median < MIN_MS:
+            rows.append((name, base_median, cur_median, 1.0, 1.0, 1.0, "skip"))
+            continue
+        low, high = ratio_interval(base, cur, confidence)
+        ratio = cur_median / base_median if base_median else 1.0
+        if low > 1 + threshold:
+            verdict = "SLOWER"
+        elif high < 1 - threshold:
+            verdict = "faster"
+        else:
+            verdict = "ok"
+        rows.append((name, base_median, cur_median, ratio, low, high, verdict))
+    return rows
+
+
+def record(args):
+    path = os.path.join(ROOT, args.variant)
+    baseline = {"commit": git_revision(ROOT), "variant": args.variant, "ticks": args.ticks, "scenarios": {}}
+    for scenario in args.scenarios:
+        print("recording %s ..." % scenario, file=sys.stderr)
+        baseline["scenarios"][scenario] = sample(path, scenario, args.ticks, args.reps, args.warmup)
+    with open(args.baseline, "w") as f:
+        json.dump(baseline, f, indent=2)
+    print("baseline for %d scenarios written to %s" % (len(args.scenarios), args.baseline))
+    return 0
+
+
+def check(args):
+    if not os.path.exists(args.baseline):
+        print("no baseline at %s, run 'python regress.py record' first" % args.baseline, file=sys.stderr)
+        return 2
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    path = os.path.join(ROOT, args.variant)
+    ticks = baseline.get("ticks", args.ticks)
+    failed = False
+    print("baseline %s, %s, %d ticks, threshold %.0f%%" % (
+        baseline.get("commit", "?"), args.variant, ticks, args.threshold * 100))
+    for scenario in args.scenarios:
+        if scenario not in baseline["scenarios"]:
+            print("%s: no baseline, skipped" % scenario)
+            continue
+        current = sample(path, scenario, ticks, args.reps, args.warmup)
+        for name, base, cur, ratio, low, high, verdict in compare(
+                baseline["scenarios"][scenario], current, args.threshold, args.confidence):
+            print("%-14s %-8s %8.3f -> %8.3f ms  x%.3f  [%.3f, %.3f]  %s" % (
+                scenario, name, base, cur, ratio, low, high, verdict))
+            failed = failed or verdict == "SLOWER"
+    if failed:
+        print("performance regression detected", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Performance regression gate for the hot paths")
+    parser.add_argument("command", choices=("record", "check"))
+    parser.add_argument("--variant", default="2D_game_V4.py")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--ticks", type=int, default=DEFAULT_TICKS // 2)
+    parser.add_argument("--reps", type=int, default=7, help="measured repetitions per scenario")
+    parser.add_argument("--warmup", type=int, default=1, help="discarded runs per scenario")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown, 0.10 = 10%%")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    args = parser.parse_args(argv)
+    return record(args) if args.command == "record" else check(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+# Authoritative co-op server.
+#
+# The server owns the simulation (a CoopGame) and advances it at a fixed tick
+# rate on an asyncio event loop. Clients connect over UDP or TCP on localhost,
+# send one input packet per tick and get a state snapshot back every tick.
+# Inputs are queued per client and applied one per tick in sequence order; if a
+# client's next input hasn't arrived its last keys are held, so a late packet
+# delays that player rather than stalling the tick. Snapshots only hold what is
+# near the client's camera (interest.py) and are delta-encoded against the
+# newest one it has acknowledged, so the server keeps the states it sent to
+# every client for a while.
+#
+# GameServer itself doesn't know about sockets: a transport calls connect() with
+# a send function, feeds received packets to receive() and calls disconnect().
+# The UDP and TCP front ends below are two such transports. UDP has no
+# connection to lose, so a UDP client that sends nothing for CLIENT_TIMEOUT
+# seconds is dropped as if it had said BYE.
+#
+#   python server.py                              # UDP 47800 and TCP 47801
+#   python server.py --ticks 3600 --stats         # stop after a minute, print tick stats
+import argparse
+import asyncio
+import collections
+import json
+import sys
+import time
+
+import protocol
+from coop import CoopGame, SHOOT
+from interest import INTEREST_MARGIN, InterestManager
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_UDP_PORT = 47800
+DEFAULT_TCP_PORT = 47801
+TICK_RATE = 60
+
+# Inputs a client may run ahead of the server before old ones are dropped.
+# Every queued input is a tick of extra input delay, so keep it short.
+MAX_QUEUED_INPUTS = 6
+
+# Seconds a UDP client may stay silent before it is disconnected
+CLIENT_TIMEOUT = 10.0
+
+
+# Server side of one connected client
+class RemoteClient:
+    def __init__(self, player_id, send):
+        self.player_id = player_id
+        self.send = send
+        self.inputs = collections.deque()  # (sequence, bits) not applied yet
+        self.input_sequence = 0  # Last input applied
+        self.bits = 0
+        self.ack_tick = -1  # Last snapshot the client said it received
+        self.sent = collections.OrderedDict()  # Tick -> State sent, possible baselines
+        self.bytes_sent = 0
+        self.snapshots_sent = 0
+
+    # Take the next input for this tick, holding the previous keys if none came
+    def next_input(self):
+        if self.inputs:
+            self.input_sequence, self.bits = self.inputs.popleft()
+            return self.bits
+        # A held shot would fire again every cooldown, only held movement carries over
+        return self.bits & ~SHOOT
+
+    # The acknowledged state to encode against, None if it is no longer kept
+    def baseline(self):
+        return self.sent.get(self.ack_tick)
+
+    def remember(self, state):
+        self.sent[state.tick] = state
+        # Older than the acknowledged one can't become a baseline any more
+        while self.sent and (next(iter(self.sent)) < self.ack_tick or len(self.sent) > protocol.HISTORY):
+            self.sent.popitem(last=False)
+
+
+class GameServer:
+    def __init__(self, coop=None, tick_rate=TICK_RATE, max_bytes=protocol.MAX_DATAGRAM,
+                 interest_margin=INTEREST_MARGIN):
+        self.coop = coop or CoopGame()
+        self.tick_rate = tick_rate
+        self.max_bytes = max_bytes
+        # None sends every client the whole level
+        self.interest = None
+        if interest_margin is not None:
+            self.interest = InterestManager(protocol.CODEC, self.coop.module.WIDTH, interest_margin)
+        self.clients = {}  # Player id -> RemoteClient
+        self.tick_times = []  # Seconds spent in each step()
+        self.late_ticks = 0
+        self.bytes_sent = 0
+        self.snapshots_sent = 0
+        self.peak_players = 0
+        self.full_snapshots = 0
+        self.encode_time = 0.0
+        self.running = False
+
+    def connect(self, send):
+        player_id = self.coop.add_player()
+        client = RemoteClient(player_id, send)
+        self.clients[player_id] = client
+        self.peak_players = max(self.peak_players, len(self.clients))
+        send(protocol.encode_welcome(player_id, self.tick_rate))
+        return client
+
+    def disconnect(self, client):
+        if self.clients.pop(client.player_id, None) is not None:
+            self.coop.remove_player(client.player_id)
+
+    def receive(self, client, data):
+        kind = protocol.message_type(data)
+        if kind == protocol.INPUT:
+            sequence, ack_tick, bits = protocol.decode_input(data)
+            # Drop duplicates and inputs older than the last one applied or queued
+            newest = client.inputs[-1][0] if client.inputs else client.input_sequence
+            if sequence > newest:
+                client.inputs.append((sequence, bits))
+                while len(client.inputs) > MAX_QUEUED_INPUTS:
+                    client.inputs.popleft()
+            client.ack_tick = max(client.ack_tick, ack_tick)
+        elif kind == protocol.HELLO:
+            client.send(protocol.encode_welcome(client.player_id, self.tick_rate))
+        elif kind == protocol.BYE:
+            self.disconnect(client)
+
+    def broadcast(self):
+        coop = self.coop
+        start = time.perf_counter()
+        state = protocol.CODEC.state(coop.tick, protocol.snapshot_body(coop, self.max_bytes).tables())
+        if self.interest:
+            self.interest.prepare(state)
+        payloads = {}  # (state, baseline) -> encoded delta, nearby clients share them
+        for client in list(self.clients.values()):
+            if self.interest:
+                client_state = self.interest.state_for(coop.scrolls[client.player_id])
+            else:
+                client_state = state
+            baseline = client.baseline()
+            key = (id(client_state), id(baseline))
+            if key not in payloads:
+                payloads[key] = protocol.CODEC.encode(client_state, baseline)
+            if baseline is None:
+                self.full_snapshots += 1
+            client.remember(client_state)
+            data = protocol.encode_snapshot(coop.tick, baseline.tick if baseline else None,
+                                            client.input_sequence, client.player_id, payloads[key])
+            client.send(data)
+            client.bytes_sent += len(data)
+            client.snapshots_sent += 1
+            self.bytes_sent += len(data)
+            self.snapshots_sent += 1
+        self.encode_time += time.perf_counter() - start
+
+    # One server tick: apply inputs, simulate, send snapshots
+    def step(self):
+        start = time.perf_counter()
+        inputs = {player_id: client.next_input() for player_id, client in self.clients.items()}
+        self.coop.update(inputs)
+        self.broadcast()
+        self.tick_times.append(time.perf_counter() - start)
+
+    # Run at the fixed tick rate until stop() or for the given number of ticks
+    async def run(self, ticks=None):
+        loop = asyncio.get_running_loop()
+        interval = 1 / self.tick_rate
+        next_tick = loop.time()
+        self.running = True
+        done = 0
+        while self.running and (ticks is None or done < ticks):
+            self.step()
+            done += 1
+            next_tick += interval
+            delay = next_tick - loop.time()
+            if delay < 0:
+                # Fell behind: count it and restart the schedule instead of bursting
+                self.late_ticks += 1
+                next_tick = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+        self.running = False
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        times = sorted(self.tick_times)
+        count = len(times)
+        return {
+            "ticks": count,
+            "players": self.peak_players,
+            "tick_ms_mean": sum(times) / count * 1000 if count else 0.0,
+            "tick_ms_p99": times[min(int(count * 0.99), count - 1)] * 1000 if count else 0.0,
+            "tick_ms_max": times[-1] * 1000 if count else 0.0,
+            "late_ticks": self.late_ticks,
+            "bytes_sent": self.bytes_sent,
+            "snapshots_sent": self.snapshots_sent,
+            "full_snapshots": self.full_snapshots,
+            "encode_ms_mean": self.encode_time / count * 1000 if count else 0.0,
+        }
+
+
+# UDP transport: a client is identified by its address
+class UdpEndpoint(asyncio.DatagramProtocol):
+    def __init__(self, server, timeout=CLIENT_TIMEOUT):
+        self.server = server
+        self.timeout = timeout
+        self.transport = None
+        self.clients = {}  # Address -> RemoteClient
+        self.last_seen = {}  # Address -> loop time of its last packet
+        self.sweeper = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self.timeout is not None:
+            self.sweeper = asyncio.get_running_loop().call_later(self.timeout / 2, self.expire)
+
+    def connection_lost(self, exc):
+        if self.sweeper is not None:
+            self.sweeper.cancel()
+
+    def datagram_received(self, data, addr):
+        client = self.clients.get(addr)
+        if client is None:
+            if protocol.message_type(data) == protocol.HELLO:
+                self.clients[addr] = self.server.connect(lambda payload: self.transport.sendto(payload, addr))
+                self.last_seen[addr] = asyncio.get_running_loop().time()
+            return
+        self.last_seen[addr] = asyncio.get_running_loop().time()
+        self.server.receive(client, data)
+        if protocol.message_type(data) == protocol.BYE:
+            self.drop(addr)
+
+    def drop(self, addr):
+        self.server.disconnect(self.clients.pop(addr))
+        del self.last_seen[addr]
+
+    # Disconnect clients that went quiet, then check again in half a timeout
+    def expire(self):
+        loop = asyncio.get_running_loop()
+        cutoff = loop.time() - self.timeout
+        for addr in [addr for addr, seen in self.last_seen.items() if seen < cutoff]:
+            self.drop(addr)
+        self.sweeper = loop.call_later(self.timeout / 2, self.expire)
+
+
+# TCP transport: length-prefixed messages on one stream per client
+async def handle_tcp(server, reader, writer):
+    client = None
+    try:
+        while True:
+            header = await reader.readexactly(protocol.FRAME_HEADER.size)
+            data = await reader.readexactly(protocol.FRAME_HEADER.unpack(header)[0])
+            if client is None:
+                if protocol.message_type(data) == protocol.HELLO:
+                    client = server.connect(lambda payload: writer.write(protocol.frame(payload)))
+                continue
+            server.receive(client, data)
+            if protocol.message_type(data) == protocol.BYE:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+        pass  # Client went away or the server is shutting down
+    finally:
+        if client is not None:
+            server.disconnect(client)
+        writer.close()
+
+
+# Open the UDP and TCP listeners, returns a function that closes them
+async def listen(server, host=DEFAULT_HOST, udp_port=DEFAULT_UDP_PORT, tcp_port=DEFAULT_TCP_PORT,
+                 client_timeout=CLIENT_TIMEOUT):
+    loop = asyncio.get_running_loop()
+    closers = []
+    if udp_port is not None:
+        transport, _ = await loop.create_datagram_endpoint(lambda: UdpEndpoint(server, client_timeout),
+                                                           local_addr=(host, udp_port))
+        closers.append(transport.close)
+    if tcp_port is not None:
+        tcp = await asyncio.start_server(lambda reader, writer: handle_tcp(server, reader, writer),
+                                         host, tcp_port)
+        closers.append(tcp.close)
+
+    def close():
+        for closer in closers:
+            closer()
+    return close
+
+
+async def serve(args):
+    server = GameServer(tick_rate=args.tick_rate, interest_margin=None if args.no_interest else args.margin)
+    close = await listen(server, args.host, args.udp_port, args.tcp_port, args.client_timeout)
+    # The bot harness waits for this line before connecting
+    print("listening udp %s tcp %s" % (args.udp_port, args.tcp_port), flush=True)
+    try:
+        await server.run(args.ticks)
+    finally:
+        close()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Authoritative co-op server for the V4 level")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--udp-port", type=int, default=DEFAULT_UDP_PORT)
+    parser.add_argument("--tcp-port", type=int, default=DEFAULT_TCP_PORT)
+    parser.add_argument("--tick-rate", type=int, default=TICK_RATE)
+    parser.add_argument("--ticks", type=int, help="stop after this many ticks")
+    parser.add_argument("--margin", type=float, default=INTEREST_MARGIN,
+                        help="px around each camera a client hears about")
+    parser.add_argument("--no-interest", action="store_true", help="send every client the whole level")
+    parser.add_argument("--client-timeout", type=float, default=CLIENT_TIMEOUT,
+                        help="seconds without a packet before a UDP client is dropped")
+    parser.add_argument("--stats", action="store_true", help="print tick statistics as JSON at exit")
+    args = parser.parse_args(argv)
+    try:
+        server = asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        return 0
+    if args.stats:
+        print(json.dumps(server.stats()), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# Simulation on its own thread, rendering from published snapshots.
+#
+# SimulationThread calls step() at a fixed tick rate on a background thread.
+# Each step advances the game and returns a new immutable snapshot of what the
+# renderer needs to draw. The sim thread publishes it by replacing the latest
+# one under a lock (LatestSnapshot), while the main thread draws whichever
+# snapshot it last took. A snapshot is never changed once published, so the
+# renderer never sees a half-updated game, and neither side waits for the
+# other except for that replacement. Snapshots are not reused: each tick
+# allocates a fresh one, and the old one is freed once nothing draws it.
+# Input goes the other way: the main thread sets the held keys and posts key
+# presses, and the sim thread applies them at its next tick.
+#
+# With the GIL only one thread runs Python at a time, so what overlaps is the
+# work that releases it (SDL blits and fills, NumPy, the display flip, and
+# waiting for the next tick). On a free-threaded build the two threads can run
+# Python in parallel too. thread_bench.py measures both loops.
+import queue
+import threading
+import time
+
+from frametime import FrameHistogram
+
+# Ticks the sim thread runs back to back to catch up before it gives up and
+# drops them
+MAX_CATCH_UP = 5
+
+
+# The newest published snapshot
+class LatestSnapshot:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self.published = 0
+
+    def publish(self, snapshot):
+        with self._lock:
+            self._snapshot = snapshot
+            self.published += 1
+
+    # The newest snapshot and how many were published up to it
+    def latest(self):
+        with self._lock:
+            return self._snapshot, self.published
+
+
+class SimulationThread:
+    # step(keys, presses) runs one tick with the held keys and the key presses
+    # posted since the last one, and returns the snapshot to publish
+    def __init__(self, step, tick_rate, max_catch_up=MAX_CATCH_UP):
+        self.step = step
+        self.period = 1 / tick_rate
+        self.max_catch_up = max_catch_up
+        self.snapshot = LatestSnapshot()
+        self.keys = None  # Held keys, set by the main thread
+        self._presses = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self.error = None
+        self.histogram = FrameHistogram()  # Tick durations
+        self.ticks = 0
+        self.dropped = 0  # Ticks skipped after falling too far behind
+        self.thread = threading.Thread(target=self._run, name="simulation", daemon=True)
+
+    def start(self, first_snapshot=None):
+        if first_snapshot is not None:
+            self.snapshot.publish(first_snapshot)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.thread.join()
+
+    def post(self, key):
+        self._presses.put(key)
+
+    # Re-raise on the calling thread whatever stopped the sim thread
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        next_tick = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                now = time.perf_counter()
+                if now < next_tick:
+                    self._stop.wait(next_tick - now)
+                    continue
+                presses = []
+                while not self._presses.empty():
+                    presses.append(self._presses.get())
+                snapshot = self.step(self.keys, presses)
+                self.histogram.record(time.perf_counter() - now)
+                self.snapshot.publish(snapshot)
+                self.ticks += 1
+                next_tick += self.period
+                behind = int((time.perf_counter() - next_tick) / self.period)
+                if behind > self.max_catch_up:
+                    self.dropped += behind
+                    next_tick += behind * self.period
+        except Exception as error:
+            self.error = error
+
+    def stats_lines(self):
+        h = self.histogram
+        return ["sim ticks %d  dropped %d  tick ms p50 %.2f  p99 %.2f" % (
+            self.ticks, self.dropped, h.percentile_ms(50), h.percentile_ms(99))]
@@ -0,0 +1,166 @@
+# Snapshot size and encode time benchmark.
+#
+# Runs the co-op simulation headless with a few run-and-gun players spread
+# along the level and a growing load (enemy bullets kept topped up around the
+# players, bosses firing their circle volley, or enemies spread over the whole
+# level), and for every tick and client measures:
+#  - raw:   the plain float records (what a naive full snapshot would send)
+#  - full:  the quantized, bit-packed snapshot with no baseline
+#  - delta: the snapshot encoded against the one acknowledged --lag ticks ago
+# together with the server time to quantize, cut and encode the deltas for all
+# clients and the time to decode one. With --no-interest every client gets the
+# whole level instead of its own window.
+#
+#   python snapshot_bench.py
+#   python snapshot_bench.py --scenario boss-volley --loads 1 4 16 --lag 12
+#   python snapshot_bench.py --scenario spread --no-interest
+import argparse
+import json
+import math
+import random
+import sys
+import time
+
+import protocol
+from coop import CoopGame, RIGHT, SHOOT, UP
+from interest import INTEREST_MARGIN, InterestManager
+
+
+def run_and_gun(tick):
+    return RIGHT | (UP if tick % 40 == 0 else 0) | (SHOOT if tick % 10 == 0 else 0)
+
+
+# Keep the enemy bullets topped up to load around random players, flying in straight lines
+def bullets(coop, load, rng):
+    game = coop.module
+    scrolls = list(coop.scrolls.values())
+    for _ in range(load - len(coop.enemy_bullets)):
+        scroll = rng.choice(scrolls)
+        speed = rng.uniform(2, 10)
+        angle = rng.uniform(0, 2 * math.pi)
+        coop.enemy_bullets.spawn(rng.uniform(scroll, scroll + game.WIDTH), rng.uniform(0, game.HEIGHT - 60),
+                                 speed * math.cos(angle), speed * math.sin(angle))
+
+
+# load bosses in view, all in the circle-shot pattern with staggered timers, so
+# new bullets appear nearly every tick
+def boss_volley(coop, load, rng):
+    game = coop.module
+    bosses = [enemy for enemy in coop.enemies if enemy.type == "boss" and enemy is not coop.boss]
+    scrolls = list(coop.scrolls.values())
+    for i in range(load - len(bosses)):
+        scroll = rng.choice(scrolls)
+        boss = game.Enemy(rng.uniform(scroll, scroll + game.WIDTH), game.HEIGHT - 190, "boss")
+        boss.net_id = len(coop.enemies)
+        boss.shoot_cooldown = rng.randrange(boss.shoot_delay)
+        coop.enemies.append(boss)
+        bosses.append(boss)
+    for boss in bosses:
+        boss.attack_pattern = 2
+        boss.attack_timer = 0
+
+
+# load extra flying enemies spread evenly over the whole level, the world-size case
+def spread(coop, load, rng):
+    game = coop.module
+    if getattr(coop, "spread_done", False):
+        return
+    for i in range(load):
+        enemy = game.Enemy(coop.level.length * (i + 0.5) / load, rng.uniform(150, 350), "flying")
+        enemy.net_id = len(coop.enemies)
+        coop.enemies.append(enemy)
+    coop.spread_done = True
+
+
+SCENARIOS = {"bullets": bullets, "boss-volley": boss_volley, "spread": spread}
+DEFAULT_LOADS = {
+    "bullets": [0, 100, 500, 1000, 2000, 5000],
+    "boss-volley": [1, 2, 4, 8, 16, 32],
+    "spread": [0, 100, 1000, 5000, 20000],
+}
+
+
+def measure(scenario, load, ticks, players, lag, margin=INTEREST_MARGIN, seed=0):
+    rng = random.Random(seed)
+    coop = CoopGame()
+    ids = [coop.add_player() for _ in range(players)]
+    # Spread the players along the level, a screen apart at least
+    for i, player_id in enumerate(ids):
+        coop.players[player_id].x = (100 + i * max(coop.level.length // players, coop.module.WIDTH)) % coop.level.length
+    codec = protocol.CODEC
+    interest = InterestManager(codec, coop.module.WIDTH, margin) if margin is not None else None
+    sent = {player_id: [] for player_id in ids}  # States sent to each client, newest last
+    totals = {"raw": 0, "full": 0, "delta": 0, "entities": 0, "encode_s": 0.0, "decode_s": 0.0}
+    for tick in range(ticks):
+        SCENARIOS[scenario](coop, load, rng)
+        coop.update({player_id: run_and_gun(tick) for player_id in ids})
+
+        start = time.perf_counter()
+        body = protocol.snapshot_body(coop)
+        state = codec.state(coop.tick, body.tables())
+        if interest:
+            interest.prepare(state)
+        deltas = {}
+        for player_id in ids:
+            client_state = interest.state_for(coop.scrolls[player_id]) if interest else state
+            history = sent[player_id]
+            baseline = history[-lag] if len(history) >= lag else None
+            deltas[player_id] = (client_state, baseline, codec.encode(client_state, baseline))
+            sent[player_id] = history[-lag:] + [client_state]
+        encoded = time.perf_counter()
+        totals["encode_s"] += encoded - start
+
+        # Decode and the other sizes for one client, the rest look the same
+        client_state, baseline, delta = deltas[ids[0]]
+        decode_start = time.perf_counter()
+        codec.decode(delta, client_state.tick, baseline)
+        totals["decode_s"] += time.perf_counter() - decode_start
+        entities = sum(len(ids_) for ids_, _ in client_state.tables)
+        totals["entities"] += entities
+        totals["raw"] += protocol.SNAPSHOT_HEADER.size + sum(
+            len(ids_) * schema.dtype.itemsize for (ids_, _), schema in zip(client_state.tables, codec.schemas))
+        totals["full"] += protocol.SNAPSHOT_HEADER.size + len(codec.encode(client_state))
+        totals["delta"] += sum(protocol.SNAPSHOT_HEADER.size + len(delta) for _, _, delta in deltas.values()) / players
+    return {
+        "load": load,
+        "entities": totals["entities"] / ticks,
+        "raw_bytes": totals["raw"] / ticks,
+        "full_bytes": totals["full"] / ticks,
+        "delta_bytes": totals["delta"] / ticks,
+        "encode_ms": totals["encode_s"] / ticks * 1000,
+        "decode_ms": totals["decode_s"] / ticks * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure snapshot bytes per tick and encode time")
+    parser.add_argument("--scenario", choices=list(SCENARIOS), default="bullets")
+    parser.add_argument("--loads", type=int, nargs="+")
+    parser.add_argument("--ticks", type=int, default=300)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--lag", type=int, default=6, help="ticks between a snapshot and its baseline")
+    parser.add_argument("--margin", type=float, default=INTEREST_MARGIN, help="interest margin in px")
+    parser.add_argument("--no-interest", action="store_true", help="send every client the whole level")
+    parser.add_argument("--output", help="write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    rows = []
+    print("per client and tick, encode ms for all %d clients" % args.players)
+    print("%8s %9s %10s %10s %10s %7s %10s %10s" % (
+        "load", "entities", "raw B", "full B", "delta B", "ratio", "encode ms", "decode ms"))
+    for load in args.loads or DEFAULT_LOADS[args.scenario]:
+        row = measure(args.scenario, load, args.ticks, args.players, args.lag,
+                      None if args.no_interest else args.margin)
+        rows.append(row)
+        print("%8d %9.0f %10.0f %10.0f %10.0f %6.1fx %10.3f %10.3f" % (
+            load, row["entities"], row["raw_bytes"], row["full_bytes"], row["delta_bytes"],
+            row["raw_bytes"] / max(row["delta_bytes"], 1), row["encode_ms"], row["decode_ms"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"scenario": args.scenario, "lag": args.lag, "interest": not args.no_interest,
+                       "rows": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
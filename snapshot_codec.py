@@ -0,0 +1,302 @@
+# Quantized, bit-packed, delta-compressed snapshots.
+#
+# Every entity field is quantized to a fixed-point integer of a fixed bit width
+# (positions to 1/8 px, velocities to 1/16 px per tick). A snapshot is encoded
+# against the last one the client acknowledged:
+#  - one bit per baseline entity says whether it still exists
+#  - new entities are sent with their id (usually as a small gap from the
+#    previous id) and every field in full
+#  - for kept entities one bit per field says whether it changed, and a changed
+#    field is sent as a tiny or a medium signed delta when it fits, or in full.
+#    Positions are compared with the baseline extrapolated by its velocity, so a
+#    bullet flying in a straight line only costs rounding noise.
+# With no baseline every entity is new, which gives a full quantized snapshot.
+#
+# The stream is laid out section by section (all flags, then all values) so the
+# widths of each section are known from the ones before it; packing and
+# unpacking run as a few NumPy operations per section rather than per field.
+import numpy as np
+
+COUNT_BITS = 16  # New entities per section
+GAP_BITS = 4  # New ids within 16 of the previous one are sent as a gap
+TINY_BITS = 3  # Rounding noise, one tick of slow motion
+MEDIUM_BITS = 8  # One tick of a running player or a bullet hit
+
+
+class Field:
+    def __init__(self, name, bits, scale=1, signed=True):
+        self.name = name
+        self.bits = bits
+        self.scale = scale
+        self.signed = signed
+        if signed:
+            self.low, self.high = -(1 << (bits - 1)), (1 << (bits - 1)) - 1
+        else:
+            self.low, self.high = 0, (1 << bits) - 1
+
+
+# How one kind of entity is quantized. motion pairs a position field with the
+# velocity field that moves it every tick.
+class Schema:
+    def __init__(self, name, dtype, fields, id_bits, motion=()):
+        self.name = name
+        self.dtype = dtype
+        self.fields = fields
+        self.id_bits = id_bits
+        self.bits = np.array([field.bits for field in fields], dtype=np.int64)
+        self.masks = (1 << self.bits) - 1
+        self.signed = np.array([field.signed for field in fields])
+        names = [field.name for field in fields]
+        self.motion = [(names.index(pos), names.index(vel),
+                        fields[names.index(pos)].scale, fields[names.index(vel)].scale)
+                       for pos, vel in motion]
+
+    # Upper bound of the bits one new entity takes
+    def full_bits(self):
+        return 1 + self.id_bits + int(self.bits.sum())
+
+
+POSITION_SCALE = 8
+VELOCITY_SCALE = 16
+
+
+def player_schema(dtype):
+    return Schema("players", dtype, [
+        Field("x", 17, POSITION_SCALE), Field("y", 14, POSITION_SCALE), Field("vel_y", 10, VELOCITY_SCALE),
+        Field("health", 10), Field("direction", 2), Field("aim_x", 2), Field("aim_y", 2),
+        Field("jumping", 1, signed=False), Field("cooldown", 5, signed=False),
+        Field("invincibility", 6, signed=False),
+    ], id_bits=16)
+
+
+def enemy_schema(dtype):
+    return Schema("enemies", dtype, [
+        Field("type", 2, signed=False), Field("x", 17, POSITION_SCALE), Field("y", 14, POSITION_SCALE),
+        Field("health", 10), Field("direction", 2),
+    ], id_bits=16)
+
+
+def bullet_schema(name, dtype):
+    return Schema(name, dtype, [
+        Field("x", 17, POSITION_SCALE), Field("y", 14, POSITION_SCALE),
+        Field("vel_x", 10, VELOCITY_SCALE), Field("vel_y", 10, VELOCITY_SCALE),
+    ], id_bits=32, motion=[("x", "vel_x"), ("y", "vel_y")])
+
+
+class BitWriter:
+    def __init__(self):
+        self.values = []
+        self.widths = []
+
+    # Append values (non-negative, already masked to their widths), MSB first
+    def write(self, values, widths):
+        values = np.asarray(values, dtype=np.int64).ravel()
+        self.values.append(values)
+        if np.ndim(widths) == 0:
+            widths = np.full(values.shape, widths, dtype=np.int64)
+        self.widths.append(widths)
+
+    def getvalue(self):
+        if not self.values:
+            return b""
+        values = np.concatenate(self.values)
+        widths = np.concatenate(self.widths)
+        total = int(widths.sum())
+        starts = np.cumsum(widths) - widths
+        shift = np.repeat(starts + widths - 1, widths) - np.arange(total)
+        bits = (np.repeat(values, widths) >> shift) & 1
+        return np.packbits(bits.astype(np.uint8)).tobytes()
+
+
+class BitReader:
+    def __init__(self, data, offset=0):
+        self.bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8, offset=offset)).astype(np.int64)
+        self.position = 0
+
+    def _take(self, total):
+        if self.position + total > len(self.bits):
+            raise ValueError("truncated snapshot")
+        bits = self.bits[self.position:self.position + total]
+        self.position += total
+        return bits
+
+    def read(self, count, widths):
+        if count == 0:
+            return np.zeros(0, dtype=np.int64)
+        if np.ndim(widths) == 0:
+            # Same width for every value: a reshape and a dot product
+            bits = self._take(count * widths)
+            if widths == 1:
+                return bits
+            return bits.reshape(count, widths) @ (1 << np.arange(widths - 1, -1, -1, dtype=np.int64))
+        widths = np.asarray(widths, dtype=np.int64)
+        total = int(widths.sum())
+        bits = self._take(total)
+        starts = np.cumsum(widths) - widths
+        shift = np.repeat(starts + widths - 1, widths) - np.arange(total)
+        return np.add.reduceat(bits << shift, starts)
+
+
+# Which of values are in sorted, a sorted array of unique values
+def member(values, sorted):
+    if len(sorted) == 0:
+        return np.zeros(len(values), dtype=bool)
+    index = np.minimum(np.searchsorted(sorted, values), len(sorted) - 1)
+    return sorted[index] == values
+
+
+# Whether signed values fit in the given width
+def fits(values, bits):
+    return (values >= -(1 << (bits - 1))) & (values < (1 << (bits - 1)))
+
+
+# Two's complement values of the given widths back to signed integers
+def sign_extend(values, widths):
+    sign = 1 << (widths - 1)
+    return (values ^ sign) - sign
+
+
+# Quantized form of a table of records: ids and an (entities, fields) int matrix, sorted by id
+def quantize(records, schema):
+    ids = records["id"].astype(np.int64)
+    q = np.empty((len(records), len(schema.fields)), dtype=np.int64)
+    for j, field in enumerate(schema.fields):
+        q[:, j] = np.clip(np.round(records[field.name].astype(float) * field.scale), field.low, field.high)
+    order = np.argsort(ids, kind="stable")
+    return ids[order], q[order]
+
+
+def dequantize(ids, q, schema):
+    records = np.zeros(len(ids), dtype=schema.dtype)
+    records["id"] = ids
+    for j, field in enumerate(schema.fields):
+        records[field.name] = q[:, j] / field.scale
+    return records
+
+
+EMPTY = (np.zeros(0, dtype=np.int64), None)
+
+
+# Baseline rows moved on by their velocity over dt ticks
+def extrapolate(schema, q, dt):
+    if not schema.motion or dt <= 0:
+        return q
+    q = q.copy()
+    for pos, vel, pos_scale, vel_scale in schema.motion:
+        q[:, pos] += np.floor_divide(q[:, vel] * (dt * pos_scale), vel_scale)
+    return q
+
+
+def encode_table(writer, schema, base, current, dt):
+    base_ids, base_q = base
+    ids, q = current
+    if base_q is None:
+        base_q = np.zeros((0, len(schema.fields)), dtype=np.int64)
+
+    # Which baseline entities are still there, and which current ones are new
+    kept = member(base_ids, ids)
+    writer.write(kept, 1)
+    is_new = ~member(ids, base_ids)
+
+    # New entities: ids as small gaps where possible, then every field in full
+    new_ids = ids[is_new]
+    writer.write(len(new_ids), COUNT_BITS)
+    previous = np.concatenate(([base_ids[-1] if len(base_ids) else -1], new_ids[:-1]))
+    gaps = new_ids - previous - 1
+    small_gap = (gaps >= 0) & (gaps < (1 << GAP_BITS))
+    writer.write(small_gap, 1)
+    writer.write(np.where(small_gap, gaps, new_ids & ((1 << schema.id_bits) - 1)),
+                 np.where(small_gap, GAP_BITS, schema.id_bits))
+    new_q = q[is_new]
+    writer.write(new_q & schema.masks, np.tile(schema.bits, len(new_q)))
+
+    # Kept entities: changed-field mask, then small deltas or full values
+    predicted = extrapolate(schema, base_q[kept], dt)
+    kept_q = q[~is_new]
+    diff = kept_q - predicted
+    changed = diff != 0
+    writer.write(changed, 1)
+    deltas = diff[changed]
+    columns = np.nonzero(changed)[1]
+    tiny = fits(deltas, TINY_BITS)
+    writer.write(tiny, 1)
+    medium = fits(deltas[~tiny], MEDIUM_BITS)
+    writer.write(medium, 1)
+    widths = schema.bits[columns]
+    widths[tiny] = TINY_BITS
+    widths[np.flatnonzero(~tiny)[medium]] = MEDIUM_BITS
+    widths = np.minimum(widths, schema.bits[columns])  # Narrow fields are always sent in full
+    values = np.where(widths < schema.bits[columns], deltas, kept_q[changed]) & ((1 << widths) - 1)
+    writer.write(values, widths)
+
+
+def decode_table(reader, schema, base, dt):
+    base_ids, base_q = base
+    fields = len(schema.fields)
+    if base_q is None:
+        base_q = np.zeros((0, fields), dtype=np.int64)
+
+    kept = reader.read(len(base_ids), 1).astype(bool)
+
+    count = int(reader.read(1, COUNT_BITS)[0])
+    small_gap = reader.read(count, 1).astype(bool)
+    values = reader.read(count, np.where(small_gap, GAP_BITS, schema.id_bits))
+    # Ids are absolute where sent in full and relative to the previous id elsewhere
+    steps = np.cumsum(np.where(small_gap, values + 1, 0))
+    anchors = np.maximum.accumulate(np.where(small_gap, -1, np.arange(count))) if count else np.zeros(0, np.int64)
+    start = base_ids[-1] if len(base_ids) else -1
+    new_ids = np.where(anchors >= 0, (values - steps)[np.maximum(anchors, 0)], start) + steps
+    new_q = reader.read(count * fields, np.tile(schema.bits, count)).reshape(count, fields)
+    new_q = np.where(schema.signed, sign_extend(new_q, schema.bits), new_q)
+
+    predicted = extrapolate(schema, base_q[kept], dt)
+    changed = reader.read(predicted.size, 1).astype(bool).reshape(predicted.shape)
+    columns = np.nonzero(changed)[1]
+    tiny = reader.read(len(columns), 1).astype(bool)
+    medium = reader.read(int((~tiny).sum()), 1).astype(bool)
+    widths = schema.bits[columns]
+    widths[tiny] = TINY_BITS
+    widths[np.flatnonzero(~tiny)[medium]] = MEDIUM_BITS
+    widths = np.minimum(widths, schema.bits[columns])  # Narrow fields are always sent in full
+    values = reader.read(len(columns), widths)
+    full = np.where(schema.signed[columns], sign_extend(values, widths), values)
+    kept_q = predicted.copy()
+    kept_q[changed] = np.where(widths < schema.bits[columns],
+                               predicted[changed] + sign_extend(values, widths), full)
+
+    ids = np.concatenate((base_ids[kept], new_ids))
+    q = np.concatenate((kept_q, new_q))
+    order = np.argsort(ids, kind="stable")
+    return ids[order], q[order]
+
+
+# The quantized state of one tick, one (ids, q) table per schema
+class State:
+    def __init__(self, tick, tables):
+        self.tick = tick
+        self.tables = tables
+
+
+class SnapshotCodec:
+    def __init__(self, schemas):
+        self.schemas = schemas
+
+    def state(self, tick, record_tables):
+        return State(tick, [quantize(records, schema) for records, schema in zip(record_tables, self.schemas)])
+
+    def records(self, state):
+        return [dequantize(ids, q, schema) for (ids, q), schema in zip(state.tables, self.schemas)]
+
+    # Encode state against baseline (None for a full snapshot)
+    def encode(self, state, baseline=None):
+        writer = BitWriter()
+        dt = state.tick - baseline.tick if baseline else 0
+        for i, schema in enumerate(self.schemas):
+            encode_table(writer, schema, baseline.tables[i] if baseline else EMPTY, state.tables[i], dt)
+        return writer.getvalue()
+
+    def decode(self, data, tick, baseline=None, offset=0):
+        reader = BitReader(data, offset)
+        dt = tick - baseline.tick if baseline else 0
+        return State(tick, [decode_table(reader, schema, baseline.tables[i] if baseline else EMPTY, dt)
+                            for i, schema in enumerate(self.schemas)])
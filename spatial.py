@@ -0,0 +1,109 @@
+# Spatial indexes over the level.
+#
+# Levels are long and short, so everything is bucketed into fixed-width columns
+# along x. PlatformGrid is built once: each column stores the indices of the
+# platforms overlapping it in a padded NumPy table, which lets a whole batch of
+# bullets gather its candidate platforms and run the swept test in one
+# vectorized pass per tick. ColumnIndex is rebuilt every tick for things that
+# move (enemies, bullets) with one sort by column.
+import numpy as np
+
+from collision import first_hits, sweep_points_vs_boxes
+
+
+class PlatformGrid:
+    def __init__(self, platforms, cell_size=200):
+        self.platforms = list(platforms)
+        self.cell_size = cell_size
+        self.rects = np.array([platform.get_rect() for platform in self.platforms],
+                              dtype=float).reshape(-1, 4)
+
+        # Bucket every platform into the columns its x range covers
+        right_edge = (self.rects[:, 0] + self.rects[:, 2]).max() if len(self.rects) else 0
+        self.columns = int(right_edge // cell_size) + 1
+        buckets = [[] for _ in range(self.columns)]
+        for index, (x, y, width, height) in enumerate(self.rects):
+            first = max(int(x // cell_size), 0)
+            last = min(int((x + width) // cell_size), self.columns - 1)
+            for column in range(first, last + 1):
+                buckets[column].append(index)
+
+        # Pad the buckets into a (columns, depth) table, -1 marks an empty slot
+        depth = max((len(bucket) for bucket in buckets), default=0)
+        self.table = np.full((self.columns, max(depth, 1)), -1, dtype=np.intp)
+        for column, bucket in enumerate(buckets):
+            self.table[column, :len(bucket)] = bucket
+
+    def __len__(self):
+        return len(self.platforms)
+
+    def _column(self, x):
+        return np.clip(np.floor_divide(x, self.cell_size).astype(np.intp), 0, self.columns - 1)
+
+    # Indices of the platforms that may overlap the x range [left, right]
+    def query_range(self, left, right):
+        first, last = self._column(np.array([left, right]))
+        found = np.unique(self.table[first:last + 1])
+        return found[found >= 0].tolist()
+
+    # Platforms that may overlap a rect
+    def query_rect(self, rect):
+        return [self.platforms[i] for i in self.query_range(rect[0], rect[0] + rect[2])]
+
+    # Batched swept query for bullets moving from (x, y) by (dx, dy) this tick.
+    # Returns (t, index): time of impact per bullet (inf for none) and the index
+    # of the platform hit first (-1 for none).
+    def sweep_points(self, x, y, dx, dy, radius):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        dx = np.asarray(dx, dtype=float)
+        dy = np.asarray(dy, dtype=float)
+        count = x.shape[0]
+        if count == 0 or len(self.platforms) == 0:
+            return np.full(count, np.inf), np.full(count, -1, dtype=np.intp)
+
+        # Columns covered by each bullet's swept box
+        first = self._column(np.minimum(x, x + dx) - radius)
+        last = self._column(np.maximum(x, x + dx) + radius)
+        span = int((last - first).max()) + 1
+        columns = first[:, None] + np.arange(span)
+        in_range = columns <= last[:, None]
+        columns = np.minimum(columns, self.columns - 1)
+
+        # Gather candidate platforms per bullet: (count, span * depth)
+        candidates = self.table[columns].reshape(count, -1)
+        candidates = np.where(np.repeat(in_range, self.table.shape[1], axis=1), candidates, -1)
+        valid = candidates >= 0
+        rects = self.rects[np.where(valid, candidates, 0)]
+
+        toi = sweep_points_vs_boxes(
+            x[:, None], y[:, None], dx[:, None], dy[:, None],
+            rects[..., 0] - radius,
+            rects[..., 1] - radius,
+            rects[..., 0] + rects[..., 2] + radius,
+            rects[..., 1] + rects[..., 3] + radius,
+        )
+        toi = np.where(valid, toi, np.inf)
+        t, slot = first_hits(toi)
+        index = np.where(slot >= 0, candidates[np.arange(count), np.maximum(slot, 0)], -1)
+        return t, index
+
+
+class ColumnIndex:
+    def __init__(self, x, cell_size=200):
+        self.x = np.asarray(x, dtype=float)
+        self.cell_size = cell_size
+        columns = np.floor_divide(self.x, cell_size).astype(np.intp)
+        self.order = np.argsort(columns, kind="stable")
+        self.columns = columns[self.order]
+
+    def __len__(self):
+        return len(self.x)
+
+    # Indices of the entities with left <= x <= right, ascending
+    def query_range(self, left, right):
+        first = np.searchsorted(self.columns, int(left // self.cell_size), side="left")
+        last = np.searchsorted(self.columns, int(right // self.cell_size), side="right")
+        found = self.order[first:last]
+        x = self.x[found]
+        return np.sort(found[(x >= left) & (x <= right)])
@@ -0,0 +1,94 @@
+# Enemy spawn scheduling keyed on the camera.
+#
+# Instead of creating every enemy of a level up front and updating all of them
+# from the first tick, the level keeps a spawn table: (x, y, kind) records
+# sorted by x. SpawnScheduler walks it with a cursor as the camera scrolls
+# right and creates each enemy when its x comes within SPAWN_LEAD of the right
+# edge of the view, just before it is drawn. Enemies the camera leaves more
+# than FREEZE_DISTANCE behind (or ahead, when it turns back) are taken out of
+# the active list and frozen as they are, and put back when the view comes
+# near them again. Only the enemies around the camera are updated, shot at
+# and drawn, however long the level is.
+#
+# The table can be any array with x, y and kind fields, such as the enemies of
+# a mapped level pack (see levelpack.py), which the cursor then reads a record
+# at a time. Enemies built elsewhere, like a level's boss that the game has to
+# hold on to, are scheduled by freezing them before the first update.
+import bisect
+
+import numpy as np
+
+from kinds import ENEMY_TYPES
+
+SPAWN_DTYPE = np.dtype([("x", "<f8"), ("y", "<f8"), ("kind", "u1")])  # kind indexes ENEMY_TYPES
+
+# How far outside the view enemies are spawned or thawed, and how far before
+# they are frozen again. The gap keeps an enemy at the edge from flickering
+# between the two.
+SPAWN_LEAD = 160
+FREEZE_DISTANCE = 800
+
+
+# A spawn table for (x, y, kind name) rows, sorted by x
+def spawn_table(rows):
+    table = np.array([(x, y, ENEMY_TYPES.index(kind)) for x, y, kind in rows], dtype=SPAWN_DTYPE)
+    return table[np.argsort(table["x"], kind="stable")]
+
+
+class SpawnScheduler:
+    def __init__(self, table, make_enemy, view_width, lead=SPAWN_LEAD, freeze_distance=FREEZE_DISTANCE):
+        self.table = table
+        self.make_enemy = make_enemy
+        self.view_width = view_width
+        self.lead = lead
+        self.freeze_distance = freeze_distance
+        self.cursor = 0  # Next record of the table to spawn
+        self.frozen = []  # Frozen enemies sorted by x
+        self.frozen_x = []
+        self.spawned = 0
+        self.peak_active = 0
+
+    def freeze(self, enemy):
+        index = bisect.bisect(self.frozen_x, enemy.x)
+        self.frozen_x.insert(index, enemy.x)
+        self.frozen.insert(index, enemy)
+
+    # Every enemy spawned so far that is still alive, active or frozen
+    def living(self, enemies):
+        return enemies + self.frozen
+
+    # Spawn, thaw and freeze the enemies for a view starting at scroll, span
+    # wider for several cameras, adding to and removing from the active list
+    # enemies
+    def update(self, scroll, enemies, span=0):
+        view_width = self.view_width + span
+        left = scroll - self.lead
+        right = scroll + view_width + self.lead
+        table = self.table
+        while self.cursor < len(table):
+            x, y, kind = table[self.cursor].tolist()
+            if x >= right:
+                break
+            enemies.append(self.make_enemy(x, y, ENEMY_TYPES[kind]))
+            self.cursor += 1
+            self.spawned += 1
+
+        # Frozen enemies back in range
+        first = bisect.bisect_left(self.frozen_x, left)
+        last = bisect.bisect_left(self.frozen_x, right)
+        if first < last:
+            enemies += self.frozen[first:last]
+            del self.frozen[first:last], self.frozen_x[first:last]
+
+        # Active enemies too far behind or ahead
+        near = scroll - self.freeze_distance
+        far = scroll + view_width + self.freeze_distance
+        if any(enemy.x < near or enemy.x > far for enemy in enemies):
+            active = []
+            for enemy in enemies:
+                if near <= enemy.x <= far:
+                    active.append(enemy)
+                else:
+                    self.freeze(enemy)
+            enemies[:] = active
+        self.peak_active = max(self.peak_active, len(enemies))
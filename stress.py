@@ -0,0 +1,203 @@
+# Stress scenarios for finding the game's breaking points.
+#
+# Each scenario loads the simulation with N of something (enemies of one type,
+# bullets, bosses stuck in one attack pattern), runs it headless for K ticks and
+# checks whether the frame time still fits in the budget. The load is doubled
+# until it doesn't, then bisected to find the largest load that fits. Every
+# probe runs in a fresh process, so its result doesn't depend on the probes
+# before it.
+#
+#   python stress.py                          # every scenario against 2D_game_V4.py
+#   python stress.py --scenarios bullets enemies-flying --ticks 300 --output curves.json
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+
+import headless
+from bench import ROOT, add_bullet, keep_alive, percentile
+from kinds import ENEMY_TYPES
+
+BUDGET_MS = 1000 / 60
+BOSS_PATTERNS = (0, 1, 2)
+
+
+# Spawn count enemies of one type spread over the visible part of the level
+def spawn_enemies(ns, count, enemy_type, rng):
+    scroll, width, height = ns["scroll"], ns["WIDTH"], ns["HEIGHT"]
+    for _ in range(count):
+        x = rng.uniform(scroll, scroll + width)
+        if enemy_type == "ground":
+            y = height - 80
+        elif enemy_type == "flying":
+            y = rng.uniform(150, 350)
+        else:
+            y = height - 190
+        ns["enemies"].append(ns["Enemy"](x, y, enemy_type))
+
+
+# Top the enemy bullets up to count with random positions and velocities
+def inject_bullets(ns, count, rng):
+    scroll, width, height = ns["scroll"], ns["WIDTH"], ns["HEIGHT"]
+    for _ in range(count - len(ns["enemy_bullets"])):
+        speed = rng.uniform(2, 10)
+        angle = rng.uniform(0, 2 * math.pi)
+        add_bullet(ns, "enemy_bullets", rng.uniform(scroll, scroll + width), rng.uniform(0, height - 60),
+                   speed * math.cos(angle), speed * math.sin(angle))
+
+
+# Keep every boss in the given attack pattern
+def force_boss_pattern(ns, pattern):
+    for enemy in ns["enemies"]:
+        if enemy.type == "boss":
+            enemy.attack_pattern = pattern
+            enemy.attack_timer = 0
+
+
+# A scenario maps a load to (setup, on_tick) hooks for headless.run_script
+class StressScenario:
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build
+
+    def hooks(self, load, seed):
+        return self.build(load, random.Random(seed))
+
+
+def _enemies(enemy_type):
+    def build(load, rng):
+        def setup(ns):
+            keep_alive(ns)
+            spawn_enemies(ns, load, enemy_type, rng)
+        return setup, None
+    return build
+
+
+def _bullets(load, rng):
+    def on_tick(ns, tick):
+        inject_bullets(ns, load, rng)
+    return keep_alive, on_tick
+
+
+def _boss_pattern(pattern):
+    def build(load, rng):
+        def setup(ns):
+            keep_alive(ns)
+            spawn_enemies(ns, load, "boss", rng)
+
+        def on_tick(ns, tick):
+            force_boss_pattern(ns, pattern)
+        return setup, on_tick
+    return build
+
+
+SCENARIOS = {}
+for _type in ENEMY_TYPES:
+    SCENARIOS["enemies-" + _type] = StressScenario("enemies-" + _type, _enemies(_type))
+SCENARIOS["bullets"] = StressScenario("bullets", _bullets)
+for _pattern in BOSS_PATTERNS:
+    SCENARIOS["boss-pattern-%d" % _pattern] = StressScenario("boss-pattern-%d" % _pattern,
+                                                             _boss_pattern(_pattern))
+
+
+# Run one load level and return its frame time statistics in ms
+def measure(path, scenario, load, ticks, seed=0):
+    setup, on_tick = scenario.hooks(load, seed)
+    result = headless.run_script(path, ticks, setup=setup, on_tick=on_tick)
+    frames = sorted(result["frame_times"])
+    return {
+        "load": load,
+        "mean_ms": sum(frames) / max(len(frames), 1) * 1000,
+        "p95_ms": percentile(frames, 0.95) * 1000,
+        "max_ms": (frames[-1] if frames else 0.0) * 1000,
+    }
+
+
+# measure() in a child process
+def measure_isolated(path, scenario, load, ticks, seed=0):
+    command = [sys.executable, os.path.abspath(__file__), "_run", path, scenario.name, str(load), str(ticks),
+               str(seed)]
+    output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=os.path.dirname(path))
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+# Double the load until it stops fitting the budget, then bisect.
+# Returns (largest load that fits, every probe made).
+def find_capacity(path, scenario, ticks, budget_ms=BUDGET_MS, metric="p95_ms",
+                  start=8, limit=1 << 20, tolerance=0.05):
+    probes = []
+
+    def fits(load):
+        probe = measure_isolated(path, scenario, load, ticks)
+        probe["fits"] = probe[metric] <= budget_ms
+        probes.append(probe)
+        print("  %-16s load %7d  mean %7.2f ms  p95 %7.2f ms  %s" % (
+            scenario.name, load, probe["mean_ms"], probe["p95_ms"], "ok" if probe["fits"] else "over"),
+            file=sys.stderr)
+        return probe["fits"]
+
+    good, bad = 0, None
+    load = start
+    while load <= limit:
+        if not fits(load):
+            bad = load
+            break
+        good = load
+        load *= 2
+    if bad is None:
+        return good, probes
+
+    while bad - good > max(1, int(good * tolerance)):
+        middle = (good + bad) // 2
+        if fits(middle):
+            good = middle
+        else:
+            bad = middle
+    return good, probes
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "_run":
+        parser = argparse.ArgumentParser()
+        parser.add_argument("path")
+        parser.add_argument("scenario", choices=list(SCENARIOS))
+        parser.add_argument("load", type=int)
+        parser.add_argument("ticks", type=int)
+        parser.add_argument("seed", type=int)
+        args = parser.parse_args(argv[1:])
+        print(json.dumps(measure(args.path, SCENARIOS[args.scenario], args.load, args.ticks, args.seed)))
+        return 0
+
+    parser = argparse.ArgumentParser(description="Find the largest load that fits the frame budget")
+    parser.add_argument("--variant", default="2D_game_V4.py")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--ticks", type=int, default=240, help="ticks simulated per probe")
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--metric", choices=("mean_ms", "p95_ms", "max_ms"), default="p95_ms")
+    parser.add_argument("--start", type=int, default=8, help="first load to try")
+    parser.add_argument("--output", help="write the capacity curves as JSON here")
+    args = parser.parse_args(argv)
+
+    path = os.path.join(ROOT, args.variant)
+    report = {"variant": args.variant, "budget_ms": args.budget_ms, "metric": args.metric, "scenarios": {}}
+    for name in args.scenarios:
+        capacity, probes = find_capacity(path, SCENARIOS[name], args.ticks, args.budget_ms,
+                                         args.metric, args.start)
+        report["scenarios"][name] = {"capacity": capacity,
+                                     "curve": sorted(probes, key=lambda probe: probe["load"])}
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print("%-18s %10s  (%s <= %.1f ms)" % ("scenario", "capacity", args.metric, args.budget_ms))
+    for name, entry in report["scenarios"].items():
+        print("%-18s %10d" % (name, entry["capacity"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+# Central cache for pre-rendered surfaces (sprites, text, level chunks).
+#
+# Surfaces are looked up by a hashable key and built on a miss. The cache counts
+# the bytes of pixel memory it holds and evicts the least recently used surfaces
+# once a configurable budget is exceeded, so memory stays bounded on long runs.
+import collections
+
+
+# Bytes of pixel memory used by a surface
+def surface_bytes(surface):
+    return surface.get_pitch() * surface.get_height()
+
+
+class SurfaceCache:
+    def __init__(self, budget_bytes=16 * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self.entries = collections.OrderedDict()  # key -> (surface, bytes), oldest first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    # Return the surface for key, calling build() to create it on a miss
+    def get(self, key, build):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        surface = build()
+        self.put(key, surface)
+        return surface
+
+    def put(self, key, surface):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        size = surface_bytes(surface)
+        self.entries[key] = (surface, size)
+        self.bytes += size
+        self._evict(keep=key)
+
+    # Drop least recently used surfaces until within budget, never the one just added
+    def _evict(self, keep=None):
+        while self.bytes > self.budget_bytes and len(self.entries) > 1:
+            key, (surface, size) = next(iter(self.entries.items()))
+            if key == keep:
+                break
+            del self.entries[key]
+            self.bytes -= size
+            self.evictions += 1
+
+    def set_budget(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self._evict()
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def reset_counters(self):
+        self.hits = self.misses = self.evictions = 0
+
+    # Lines for the profiler overlay
+    def stats_lines(self):
+        lookups = self.hits + self.misses
+        return [
+            "surface cache %d items, %.1f / %.1f MB" % (
+                len(self.entries), self.bytes / (1024 * 1024), self.budget_bytes / (1024 * 1024)),
+            "hits %d  misses %d  evictions %d  hit rate %.1f%%" % (
+                self.hits, self.misses, self.evictions, 100 * self.hits / lookups if lookups else 0.0),
+        ]
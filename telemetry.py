@@ -0,0 +1,166 @@
+# Gameplay telemetry as a stream of fixed-size binary records.
+#
+# The game emits an event wherever it changes health or the entity lists
+# (shots, hits, kills, damage by source, pickups, boss pattern changes) plus
+# one record per frame with its duration. Records are packed straight into a
+# preallocated batch buffer; a full batch is handed to a background thread that
+# writes it out, so a frame never waits on the disk. If the thread falls behind
+# and the queue fills up, batches are dropped and counted rather than stalling.
+#
+# A log is a small header (magic, version, record size) followed by records in
+# the RECORD layout. read_log() loads one as a NumPy structured array and the
+# command line prints a summary or converts it to CSV or .npy.
+#
+#   python telemetry.py run.tlm                   # summary
+#   python telemetry.py run.tlm --csv run.csv --npy run.npy
+import argparse
+import queue
+import struct
+import sys
+import threading
+
+import numpy as np
+
+from kinds import CAUSES, ENEMY_TYPES
+
+MAGIC = b"TLM1"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")  # magic, version, record size
+
+# frame, kind, detail, amount, x, y, value
+RECORD = struct.Struct("<IBBhfff")
+DTYPE = np.dtype([("frame", "<u4"), ("kind", "u1"), ("detail", "u1"), ("amount", "<i2"),
+                  ("x", "<f4"), ("y", "<f4"), ("value", "<f4")])
+
+# Event kinds. What detail, amount and value hold for each:
+#   LEVEL         value: campaign index of the level started
+#   RESET         the level was restarted after a game over
+#   FRAME         value: frame time in ms
+#   SHOT          x, y: where the bullet starts
+#   HIT, KILL     detail: enemy type, amount: damage, value: enemy health left
+#   DAMAGE        detail: cause, amount: damage, value: player health left
+#   PICKUP        amount: health restored, value: player health after
+#   BOSS_PATTERN  detail: the new attack pattern, value: boss health
+LEVEL, RESET, FRAME, SHOT, HIT, KILL, DAMAGE, PICKUP, BOSS_PATTERN = range(1, 10)
+KIND_NAMES = {LEVEL: "level", RESET: "reset", FRAME: "frame", SHOT: "shot", HIT: "hit", KILL: "kill",
+              DAMAGE: "damage", PICKUP: "pickup", BOSS_PATTERN: "boss pattern"}
+
+DETAIL_NAMES = {HIT: ENEMY_TYPES, KILL: ENEMY_TYPES, DAMAGE: CAUSES}
+
+BATCH_RECORDS = 4096
+MAX_QUEUED_BATCHES = 64
+
+
+class TelemetryWriter:
+    def __init__(self, path, batch_records=BATCH_RECORDS, max_queued=MAX_QUEUED_BATCHES):
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self.buffer = bytearray(RECORD.size * batch_records)
+        self.capacity = batch_records
+        self.count = 0  # Records in the current batch
+        self.frame = 0
+        self.emitted = 0
+        self.dropped = 0  # Records lost because the queue was full
+        self.queue = queue.Queue(max_queued)
+        self.thread = threading.Thread(target=self._write_batches, name="telemetry-writer", daemon=True)
+        self.thread.start()
+
+    def _write_batches(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+            self.file.write(batch)
+
+    def emit(self, kind, detail=0, amount=0, x=0.0, y=0.0, value=0.0):
+        RECORD.pack_into(self.buffer, self.count * RECORD.size, self.frame, kind, detail, amount, x, y, value)
+        self.count += 1
+        self.emitted += 1
+        if self.count == self.capacity:
+            self.flush()
+
+    # Close the frame with its duration in seconds
+    def end_frame(self, seconds):
+        self.emit(FRAME, value=seconds * 1000)
+        self.frame += 1
+
+    # Hand the current batch to the writer thread
+    def flush(self):
+        if not self.count:
+            return
+        try:
+            self.queue.put_nowait(bytes(self.buffer[:self.count * RECORD.size]))
+        except queue.Full:
+            self.dropped += self.count
+        self.count = 0
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+
+
+# A log as a structured array with the DTYPE fields. A log cut short by a crash
+# is read up to its last whole record.
+def read_log(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, size = HEADER.unpack_from(data)
+    if magic != MAGIC or size != RECORD.size:
+        raise ValueError("%s is not a version %d telemetry log" % (path, VERSION))
+    count = (len(data) - HEADER.size) // size
+    return np.frombuffer(data, dtype=DTYPE, count=count, offset=HEADER.size)
+
+
+def write_csv(records, path):
+    with open(path, "w") as f:
+        f.write("frame,kind,detail,amount,x,y,value\n")
+        for frame, kind, detail, amount, x, y, value in records.tolist():
+            names = DETAIL_NAMES.get(kind)
+            detail = names[detail] if names and detail < len(names) else detail
+            f.write("%d,%s,%s,%d,%.2f,%.2f,%.3f\n" % (frame, KIND_NAMES.get(kind, kind), detail, amount, x, y, value))
+
+
+def summary(records):
+    kinds = records["kind"]
+    frames = records[kinds == FRAME]["value"]
+    lines = ["%d records, %d frames" % (len(records), len(frames))]
+    if len(frames):
+        lines.append("frame ms: mean %.2f  p99 %.2f  max %.2f" % (
+            frames.mean(), np.percentile(frames, 99), frames.max()))
+    for kind, name in KIND_NAMES.items():
+        if kind == FRAME:
+            continue
+        events = records[kinds == kind]
+        if not len(events):
+            continue
+        line = "%-13s %7d" % (name, len(events))
+        names = DETAIL_NAMES.get(kind)
+        if names:
+            line += "   " + ", ".join("%s %d" % (names[detail], (events["detail"] == detail).sum())
+                                     for detail in range(len(names)) if (events["detail"] == detail).any())
+        if kind == DAMAGE:
+            line += "   total %d" % events["amount"].sum()
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize or convert a telemetry log")
+    parser.add_argument("log")
+    parser.add_argument("--csv", help="write the records as CSV here")
+    parser.add_argument("--npy", help="write the records as a NumPy structured array here")
+    args = parser.parse_args(argv)
+
+    records = read_log(args.log)
+    if args.csv:
+        write_csv(records, args.csv)
+    if args.npy:
+        np.save(args.npy, records)
+    print(summary(records))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
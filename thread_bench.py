@@ -0,0 +1,225 @@
+# Single-threaded loop against the --threaded simulation/render split.
+#
+# Plays the first level with the player running right, shooting and kept
+# alive, under a load that can be raised on either side: --bullets keeps that
+# many enemy bullets in flight around the camera (simulation work: sweeps
+# against the player and the platforms) and --draw-passes draws each frame
+# that many times (render work: blits and fills). Both loops aim at --rate
+# ticks and frames a second, or run flat out with --rate 0:
+#  - single: tick, draw, flip, in series on one thread, as in the game loop
+#  - threaded: a SimulationThread ticks and publishes GameSnapshots while the
+#    main thread draws the latest one
+# The report gives the tick and frame rates reached and the tick and frame
+# times. While the two sides together take longer than a period the single
+# loop falls behind; the threaded one keeps up as long as each side fits and
+# they overlap, which with the GIL is only the time spent in SDL and NumPy.
+#
+# --python runs the benchmark under other interpreters as well, such as a
+# free-threaded build (python3.13t), where the two threads can run Python
+# code in parallel. Each needs pygame and NumPy installed.
+#
+#   python thread_bench.py
+#   python thread_bench.py --bullets 2000 --draw-passes 4 --seconds 10
+#   python thread_bench.py --rate 0 --python python3.13 python3.13t
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+import pygame
+
+from coop import INPUTS, RIGHT, UP, load_game
+from frametime import FrameHistogram
+from sim_thread import SimulationThread
+
+MODES = ("single", "threaded")
+
+
+def gil_enabled():
+    return getattr(sys, "_is_gil_enabled", lambda: True)()
+
+
+# A game on the first level whose step(tick) plays one tick of the load
+class Workload:
+    def __init__(self, module, bullets, seed=0):
+        self.module = module
+        self.game = module.Game(module.build_level(scheduled=True))
+        self.game.level.prerender()
+        self.bullets = bullets
+        self.rng = np.random.default_rng(seed)
+
+    def step(self, tick):
+        module = self.module
+        game = self.game
+        game.player.health = game.player.max_health
+        pool = game.enemy_bullets
+        missing = self.bullets - len(pool)
+        if missing > 0:
+            angle = self.rng.uniform(0, 2 * np.pi, missing)
+            speed = self.rng.uniform(2, 8, missing)
+            for x, y, vel_x, vel_y in zip((game.scroll + self.rng.uniform(0, module.WIDTH, missing)).tolist(),
+                                          self.rng.uniform(0, module.HEIGHT - 60, missing).tolist(),
+                                          (speed * np.cos(angle)).tolist(), (speed * np.sin(angle)).tolist()):
+                pool.spawn(x, y, vel_x, vel_y)
+        if tick % 10 == 0:
+            game.shoot()
+        game.update(INPUTS[RIGHT | (UP if tick % 40 == 0 else 0)])
+
+    def draw(self, screen, view, passes):
+        for _ in range(passes):
+            view.draw_static(screen)
+            view.draw(screen)
+        pygame.display.flip()
+
+
+# Sleep until the next period starts, or don't wait at all with rate 0
+def wait_until(deadline):
+    delay = deadline - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def run_single(workload, screen, seconds, rate, passes):
+    frames = FrameHistogram()
+    period = 1 / rate if rate else 0
+    tick = 0
+    start = next_frame = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        begin = time.perf_counter()
+        workload.step(tick)
+        workload.draw(screen, workload.game, passes)
+        frames.record(time.perf_counter() - begin)
+        tick += 1
+        next_frame += period
+        wait_until(next_frame)
+    elapsed = time.perf_counter() - start
+    return {"ticks_s": tick / elapsed, "frames_s": tick / elapsed, "tick_p50_ms": frames.percentile_ms(50),
+            "tick_p99_ms": frames.percentile_ms(99), "frame_p50_ms": frames.percentile_ms(50),
+            "frame_p99_ms": frames.percentile_ms(99), "new_frames": 1.0}
+
+
+def run_threaded(workload, screen, seconds, rate, passes):
+    module = workload.module
+    ticks = [0]
+
+    def step(keys, presses):
+        workload.step(ticks[0])
+        ticks[0] += 1
+        return module.GameSnapshot(workload.game)
+
+    # Flat out, the sim thread never waits and never drops ticks
+    sim = SimulationThread(step, rate or 1e9, max_catch_up=sys.maxsize if not rate else 5)
+    frames = FrameHistogram()
+    period = 1 / rate if rate else 0
+    count = new = 0
+    last = None
+    sim.start(module.GameSnapshot(workload.game))
+    start = next_frame = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        begin = time.perf_counter()
+        sim.check()
+        view, published = sim.snapshot.latest()
+        new += published != last
+        last = published
+        workload.draw(screen, view, passes)
+        frames.record(time.perf_counter() - begin)
+        count += 1
+        next_frame += period
+        wait_until(next_frame)
+    elapsed = time.perf_counter() - start
+    sim.stop()
+    return {"ticks_s": sim.ticks / elapsed, "frames_s": count / elapsed,
+            "tick_p50_ms": sim.histogram.percentile_ms(50), "tick_p99_ms": sim.histogram.percentile_ms(99),
+            "frame_p50_ms": frames.percentile_ms(50), "frame_p99_ms": frames.percentile_ms(99),
+            "new_frames": new / max(count, 1)}
+
+
+def measure(args):
+    module = load_game()
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((module.WIDTH, module.HEIGHT))
+    results = []
+    for bullets in args.bullets:
+        for passes in args.draw_passes:
+            for mode in MODES:
+                workload = Workload(module, bullets, args.seed)
+                run = run_single if mode == "single" else run_threaded
+                row = run(workload, screen, args.seconds, args.rate, passes)
+                row.update({"mode": mode, "bullets": bullets, "draw_passes": passes})
+                results.append(row)
+    pygame.quit()
+    return results
+
+
+def print_results(header, results):
+    print(header)
+    print("%8s %7s %9s | %9s %9s %9s | %-15s %-15s" % (
+        "bullets", "passes", "mode", "ticks/s", "frames/s", "new", "tick ms p50/p99", "frame ms p50/p99"))
+    for row in results:
+        print("%8d %7d %9s | %9.1f %9.1f %8.0f%% | %6.2f/%-8.2f %6.2f/%-8.2f" % (
+            row["bullets"], row["draw_passes"], row["mode"], row["ticks_s"], row["frames_s"],
+            row["new_frames"] * 100, row["tick_p50_ms"], row["tick_p99_ms"], row["frame_p50_ms"],
+            row["frame_p99_ms"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the single-threaded game loop with --threaded")
+    parser.add_argument("--bullets", type=int, nargs="+", default=[0, 1000],
+                        help="enemy bullets kept in flight, simulation load")
+    parser.add_argument("--draw-passes", type=int, nargs="+", default=[1, 3],
+                        help="times each frame is drawn, render load")
+    parser.add_argument("--rate", type=float, default=60, help="ticks and frames a second to aim for, 0 for no limit")
+    parser.add_argument("--seconds", type=float, default=5, help="how long to run each case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--python", nargs="+", metavar="EXE",
+                        help="run under these interpreters instead of this one, e.g. a free-threaded build")
+    parser.add_argument("--output", help="write the results as JSON here")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps({"python": platform.python_version(), "gil": gil_enabled(), "cpus": os.cpu_count(),
+                          "results": measure(args)}))
+        return 0
+
+    runs = []
+    if args.python:
+        forwarded = (["--bullets"] + [str(count) for count in args.bullets]
+                     + ["--draw-passes"] + [str(passes) for passes in args.draw_passes]
+                     + ["--rate", str(args.rate), "--seconds", str(args.seconds), "--seed", str(args.seed)])
+        for executable in args.python:
+            command = [executable, os.path.abspath(__file__), "--child"] + forwarded
+            try:
+                process = subprocess.run(command, capture_output=True, text=True)
+            except OSError as error:
+                print("%s: %s" % (executable, error))
+                continue
+            if process.returncode:
+                print("%s failed: %s" % (executable, (process.stderr.strip().splitlines() or ["?"])[-1]))
+                continue
+            run = json.loads(process.stdout.splitlines()[-1])
+            run["executable"] = executable
+            runs.append(run)
+    else:
+        runs.append({"executable": sys.executable, "python": platform.python_version(), "gil": gil_enabled(),
+                     "cpus": os.cpu_count(), "results": measure(args)})
+
+    for run in runs:
+        print_results("%s (Python %s, GIL %s, %s CPUs, rate %s)" % (
+            run["executable"], run["python"], "on" if run["gil"] else "off", run["cpus"],
+            "%g/s" % args.rate if args.rate else "unlimited"), run["results"])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(runs, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
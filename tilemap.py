@@ -0,0 +1,453 @@
+# Tile map backend for level geometry.
+#
+# The level is rasterized once into a (rows, columns) uint8 grid of small
+# square tiles. The low bits of a tile are flags (SOLID, SPIKE, PICKUP) and the
+# high four bits say which part of its object the tile is, so the renderer can
+# pick the right piece of artwork. Collision tests look at the handful of
+# cells a box covers or sweeps over instead of testing every platform, so
+# their cost doesn't depend on how big the level is:
+#  - sweep_rect() moves a box along one axis, for Player.move
+#  - sweep_points() is the batched bullet sweep, same as PlatformGrid's
+#  - flags_in_rect() / pickups_in_rect() for hazards and pickups
+# The shipped levels are laid out on a 10 px grid, so with the default tile
+# size the tiles cover exactly the same area as the platforms and both
+# backends give the same results. TileRenderer draws the tiles in view from a
+# pre-rendered atlas.
+#
+# Very wide worlds can be kept run-length encoded instead (RunLengthTileMap),
+# with a TileWindow holding the tiles around the camera decoded as a plain
+# TileMap for the game to query and draw. Compiled level packs (levelpack.py)
+# keep the grid in a memory-mapped file instead.
+import math
+
+import numpy as np
+import pygame
+
+from collision import EPSILON, first_hits, sweep_points_vs_boxes
+
+TILE_SIZE = 10
+
+# Columns rasterized at a time when a world is built in pieces
+CHUNK_COLUMNS = 4096
+
+# Tile flags
+EMPTY = 0
+SOLID = 1
+SPIKE = 2
+PICKUP = 4
+FLAGS = SOLID | SPIKE | PICKUP
+
+# Flags the renderer draws, pickups come and go so the game draws those
+DRAWN = SOLID | SPIKE
+
+
+# First and last cell the open interval (lo, lo + size) overlaps: touching a
+# cell edge doesn't count as overlapping it, same as check_collision
+def cell_span(lo, size, tile_size):
+    return int(lo // tile_size), math.ceil((lo + size) / tile_size) - 1
+
+
+# Queries take and return world coordinates. A map can hold just a stretch of
+# the world: origin is the world column of its first column (see TileWindow).
+class TileMap:
+    def __init__(self, columns, rows, tile_size=TILE_SIZE, origin=0):
+        self.tile_size = tile_size
+        self.tiles = np.zeros((rows, columns), dtype=np.uint8)
+        self.origin = origin
+        self.pickups = {}  # (row, world column) -> pickup covering that cell
+        self.exact = True  # Every rect stamped so far lies on the tile grid
+
+    @property
+    def rows(self):
+        return self.tiles.shape[0]
+
+    @property
+    def columns(self):
+        return self.tiles.shape[1]
+
+    # Cells a rect overlaps, clipped to the map: (first row, last row, first
+    # column, last column), columns counted from the map's origin
+    def cells(self, rect):
+        size = self.tile_size
+        first_column, last_column = cell_span(rect[0], rect[2], size)
+        first_row, last_row = cell_span(rect[1], rect[3], size)
+        return (max(first_row, 0), min(last_row, self.rows - 1),
+                max(first_column - self.origin, 0), min(last_column - self.origin, self.columns - 1))
+
+    # Mark every cell a rect overlaps. part(row, column) gives each tile's part
+    # number, relative to the rect's first cell.
+    def stamp(self, rect, flag, part=None):
+        size = self.tile_size
+        if any(value % size for value in rect):
+            self.exact = False
+        first_row, last_row, first_column, last_column = self.cells(rect)
+        if first_row > last_row or first_column > last_column:
+            return
+        value = np.full((last_row - first_row + 1, last_column - first_column + 1), flag, dtype=np.uint8)
+        if part is not None:
+            row, column = np.indices(value.shape)
+            row += first_row - int(rect[1] // size)
+            column += self.origin + first_column - int(rect[0] // size)
+            value |= (part(row, column) << 4).astype(np.uint8)
+        self.tiles[first_row:last_row + 1, first_column:last_column + 1] |= value
+
+    # Rasterize platforms, spikes and health pickups, as far as they lie on the map
+    def stamp_objects(self, platforms, spikes, pickups):
+        for platform in platforms:
+            self.stamp(platform.get_rect(), SOLID)
+
+        # Spikes are drawn as 20 px wide teeth: the part is the tile's column
+        # within a tooth and its row below the spike top, two bits each
+        tooth = max(20 // self.tile_size, 1)
+        for spike in spikes:
+            self.stamp(spike.get_rect(), SPIKE, lambda row, column: (column % tooth & 3) | (row & 3) << 2)
+
+        for pickup in pickups:
+            self.stamp(pickup.get_rect(), PICKUP)
+            self.add_pickup(pickup)
+
+    # Point the cells under a pickup's rect at it, for pickups_in_rect()
+    def add_pickup(self, pickup):
+        first_row, last_row, first_column, last_column = self.cells(pickup.get_rect())
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                self.pickups[row, self.origin + column] = pickup
+
+    # Rasterize a level's platforms, spikes and health pickups
+    @classmethod
+    def from_level(cls, level, height, tile_size=TILE_SIZE):
+        tilemap = cls(math.ceil(level.length / tile_size), math.ceil(height / tile_size), tile_size)
+        tilemap.stamp_objects(level.platforms, level.spikes, level.health_pickups)
+        return tilemap
+
+    @property
+    def nbytes(self):
+        return self.tiles.nbytes
+
+    # Distinct tile values in the map
+    def values(self):
+        return np.unique(self.tiles)
+
+    # Nothing to do, every tile of a full map is decoded already
+    def follow(self, scroll, span=0):
+        pass
+
+    def tile_at(self, x, y):
+        row, column = int(y // self.tile_size), int(x // self.tile_size) - self.origin
+        if 0 <= row < self.rows and 0 <= column < self.columns:
+            return int(self.tiles[row, column])
+        return EMPTY
+
+    # Tiles at many (row, world column) cells at once, EMPTY outside the map
+    def lookup(self, rows, columns):
+        rows = np.asarray(rows, dtype=np.intp)
+        columns = np.asarray(columns, dtype=np.intp) - self.origin
+        inside = (rows >= 0) & (rows < self.rows) & (columns >= 0) & (columns < self.columns)
+        found = self.tiles[np.clip(rows, 0, self.rows - 1), np.clip(columns, 0, self.columns - 1)]
+        return np.where(inside, found, EMPTY).astype(np.uint8)
+
+    # The flags of every tile a rect overlaps, or-ed together
+    def flags_in_rect(self, rect):
+        first_row, last_row, first_column, last_column = self.cells(rect)
+        block = self.tiles[first_row:last_row + 1, first_column:last_column + 1]
+        return int(np.bitwise_or.reduce(block, axis=None)) & FLAGS if block.size else EMPTY
+
+    # Pickups with a tile under a rect. A pickup tile without a pickup object
+    # (one not created yet, see levelpack.py) is skipped.
+    def pickups_in_rect(self, rect):
+        first_row, last_row, first_column, last_column = self.cells(rect)
+        block = self.tiles[first_row:last_row + 1, first_column:last_column + 1]
+        found = []
+        rows, columns = np.nonzero(block & PICKUP)
+        for row, column in zip(rows.tolist(), columns.tolist()):
+            pickup = self.pickups.get((first_row + row, self.origin + first_column + column))
+            if pickup is not None and pickup not in found:
+                found.append(pickup)
+        return found
+
+    # Sweep a rect by dx or dy (one axis at a time, like Player.move) against
+    # the solid tiles. Returns the rect of the tile it runs into first, or None.
+    # Tiles the rect already overlaps are ignored, as in collision.sweep_aabb.
+    def sweep_rect(self, rect, dx, dy):
+        x, y, width, height = rect
+        size = self.tile_size
+        left = self.origin * size
+        x -= left
+        if dx:
+            first, last = cell_span(y, height, size)
+            lead, delta, count = (x + width if dx > 0 else x), dx, self.columns
+        elif dy:
+            first, last = cell_span(x, width, size)
+            lead, delta, count = (y + height if dy > 0 else y), dy, self.rows
+        else:
+            return None
+        first, last = max(first, 0), min(last, (self.rows if dx else self.columns) - 1)
+        if first > last:
+            return None
+
+        # Walk the cells along the move, from the last one the rect overlaps on
+        # its leading side to the one its leading edge ends up touching
+        slack = EPSILON * abs(delta)
+        if delta > 0:
+            start, end, step = math.ceil((lead - slack) / size) - 1, math.floor((lead + delta) / size), 1
+        else:
+            start, end, step = math.floor((lead + slack) / size), math.ceil((lead + delta) / size) - 1, -1
+        if (end - start) * step <= 0:
+            return None
+
+        # A platform the rect is already inside is ignored as a whole, like in
+        # sweep_aabb: solid runs starting in the overlapped cell don't count
+        tile = self.tiles.item
+        others = range(first, last + 1)
+        embedded = None
+        for cell in range(start, end + step, step):
+            if 0 <= cell < count:
+                solid = [tile(other, cell) & SOLID if dx else tile(cell, other) & SOLID for other in others]
+            else:
+                solid = [0] * len(others)
+            if embedded is None:
+                embedded = solid
+                continue
+            for index, other in enumerate(others):
+                if not solid[index]:
+                    embedded[index] = 0
+                elif not embedded[index]:
+                    if dx:
+                        return (left + cell * size, other * size, size, size)
+                    return (left + other * size, cell * size, size, size)
+        return None
+
+    # Batched swept query for bullets moving from (x, y) by (dx, dy) this tick,
+    # the tile version of PlatformGrid.sweep_points. Returns (t, index): time of
+    # impact per bullet (inf for none) and the flat index into tiles of the
+    # solid tile hit first (-1 for none).
+    def sweep_points(self, x, y, dx, dy, radius):
+        size = self.tile_size
+        x = np.asarray(x, dtype=float) - self.origin * size
+        y = np.asarray(y, dtype=float)
+        dx = np.asarray(dx, dtype=float)
+        dy = np.asarray(dy, dtype=float)
+        count = x.shape[0]
+        if count == 0:
+            return np.full(count, np.inf), np.full(count, -1, dtype=np.intp)
+
+        # Cells covered or touched by each bullet's swept box, padded to the widest span
+        first_column = (np.ceil((np.minimum(x, x + dx) - radius) / size) - 1).astype(np.intp)
+        last_column = np.floor_divide(np.maximum(x, x + dx) + radius, size).astype(np.intp)
+        first_row = (np.ceil((np.minimum(y, y + dy) - radius) / size) - 1).astype(np.intp)
+        last_row = np.floor_divide(np.maximum(y, y + dy) + radius, size).astype(np.intp)
+        span_columns = int((last_column - first_column).max()) + 1
+        span_rows = int((last_row - first_row).max()) + 1
+        columns = (first_column[:, None] + np.arange(span_columns))[:, None, :]
+        rows = (first_row[:, None] + np.arange(span_rows))[:, :, None]
+        valid = ((columns <= last_column[:, None, None]) & (rows <= last_row[:, None, None])
+                 & (columns >= 0) & (columns < self.columns) & (rows >= 0) & (rows < self.rows))
+        valid &= (self.tiles[np.clip(rows, 0, self.rows - 1), np.clip(columns, 0, self.columns - 1)] & SOLID) > 0
+        columns = np.broadcast_to(columns, valid.shape).reshape(count, -1)
+        rows = np.broadcast_to(rows, valid.shape).reshape(count, -1)
+        valid = valid.reshape(count, -1)
+
+        # Most bullets are in open air, only sweep the ones near a solid tile
+        t = np.full(count, np.inf)
+        index = np.full(count, -1, dtype=np.intp)
+        near = np.flatnonzero(valid.any(axis=1))
+        if not len(near):
+            return t, index
+        columns, rows, valid = columns[near], rows[near], valid[near]
+        left = columns * size
+        top = rows * size
+        toi = sweep_points_vs_boxes(
+            x[near, None], y[near, None], dx[near, None], dy[near, None],
+            left - radius, top - radius, left + size + radius, top + size + radius,
+        )
+        toi = np.where(valid, toi, np.inf)
+        t[near], slot = first_hits(toi)
+        slot = np.maximum(slot, 0)
+        picked = np.arange(len(near))
+        index[near] = np.where(np.isfinite(t[near]), rows[picked, slot] * self.columns + columns[picked, slot], -1)
+        return t, index
+
+
+# Rasterize a level as consecutive TileMaps of chunk_columns columns each,
+# every object stamped into the chunks it overlaps
+def level_pieces(level, height, tile_size=TILE_SIZE, chunk_columns=CHUNK_COLUMNS):
+    columns = math.ceil(level.length / tile_size)
+    rows = math.ceil(height / tile_size)
+    chunks = [([], [], []) for _ in range(math.ceil(columns / chunk_columns))]
+    for kind, objects in enumerate((level.platforms, level.spikes, level.health_pickups)):
+        for obj in objects:
+            first, last = cell_span(obj.x, obj.width, tile_size)
+            for chunk in range(max(first // chunk_columns, 0), min(last // chunk_columns, len(chunks) - 1) + 1):
+                chunks[chunk][kind].append(obj)
+
+    for index, objects in enumerate(chunks):
+        origin = index * chunk_columns
+        piece = TileMap(min(chunk_columns, columns - origin), rows, tile_size, origin)
+        piece.stamp_objects(*objects)
+        yield piece
+
+
+# Tile storage for worlds too wide to keep every tile decoded. Columns are
+# run-length encoded along x: a run is a stretch of identical columns, stored
+# as the world column it starts at and an index into a table of the distinct
+# columns. Open sky and flat ground cost nothing per tile, so memory grows with
+# how often the level changes along its length instead of with its size.
+# Lookups binary search the run starts, O(log runs); lookup(), tile_at() and
+# values() match TileMap. Collision and drawing go through a TileWindow.
+class RunLengthTileMap:
+    def __init__(self, rows, tile_size=TILE_SIZE):
+        self.tile_size = tile_size
+        self.rows = rows
+        self.columns = 0
+        self.starts = np.zeros(0, dtype=np.int64)  # First world column of every run
+        self.patterns = np.zeros(0, dtype=np.int32)  # Row of table for every run
+        self.table = np.zeros((0, rows), dtype=np.uint8)  # The distinct columns
+        self.pickups = {}  # (row, world column) -> pickup, like TileMap
+        self.exact = True
+
+    # Encode TileMaps covering the world from column 0 on, one after another,
+    # so a world can be built and encoded in pieces
+    @classmethod
+    def encode(cls, pieces, rows, tile_size=TILE_SIZE):
+        store = cls(rows, tile_size)
+        starts = []
+        patterns = []
+        table = {}  # Column bytes -> row of table
+        for piece in pieces:
+            block = piece.tiles
+            # A run starts wherever a column differs from the one before it
+            changed = np.flatnonzero((block[:, 1:] != block[:, :-1]).any(axis=0)) + 1
+            for column in [0] + changed.tolist():
+                pattern = table.setdefault(block[:, column].tobytes(), len(table))
+                if not patterns or patterns[-1] != pattern:
+                    starts.append(store.columns + column)
+                    patterns.append(pattern)
+            store.columns += block.shape[1]
+            store.pickups.update(piece.pickups)
+            store.exact = store.exact and piece.exact
+        store.starts = np.array(starts, dtype=np.int64)
+        store.patterns = np.array(patterns, dtype=np.int32)
+        store.table = np.frombuffer(b"".join(table), dtype=np.uint8).reshape(len(table), rows).copy()
+        return store
+
+    # Rasterize a level a chunk at a time, so the whole world is never decoded at once
+    @classmethod
+    def from_level(cls, level, height, tile_size=TILE_SIZE):
+        return cls.encode(level_pieces(level, height, tile_size), math.ceil(height / tile_size), tile_size)
+
+    @property
+    def nbytes(self):
+        return self.starts.nbytes + self.patterns.nbytes + self.table.nbytes
+
+    def values(self):
+        return np.unique(self.table)
+
+    def tile_at(self, x, y):
+        row, column = int(y // self.tile_size), int(x // self.tile_size)
+        if 0 <= row < self.rows and 0 <= column < self.columns:
+            run = int(np.searchsorted(self.starts, column, side="right")) - 1
+            return int(self.table[self.patterns[run], row])
+        return EMPTY
+
+    def lookup(self, rows, columns):
+        rows = np.asarray(rows, dtype=np.intp)
+        columns = np.asarray(columns, dtype=np.intp)
+        inside = (rows >= 0) & (rows < self.rows) & (columns >= 0) & (columns < self.columns)
+        runs = np.searchsorted(self.starts, columns, side="right") - 1
+        found = self.table[self.patterns[np.maximum(runs, 0)], np.clip(rows, 0, self.rows - 1)]
+        return np.where(inside, found, EMPTY).astype(np.uint8)
+
+    # The dense (rows, last - first) tiles of world columns first to last
+    def decode(self, first, last):
+        runs = np.searchsorted(self.starts, np.arange(first, last), side="right") - 1
+        return np.ascontiguousarray(self.table[self.patterns[runs]].T)
+
+
+# A dense TileMap over the stretch of a RunLengthTileMap around the camera:
+# the view plus a margin on each side. follow() decodes a new stretch once the
+# view comes within half a margin of either end, so it runs every few hundred
+# pixels of scrolling and the queries in between are plain TileMap ones. span
+# widens the view, to cover several cameras from scroll to scroll + span.
+class TileWindow(TileMap):
+    def __init__(self, source, view_width, margin=None):
+        TileMap.__init__(self, 0, source.rows, source.tile_size)
+        self.source = source
+        self.pickups = source.pickups
+        self.exact = source.exact
+        self.view_width = view_width
+        self.margin = view_width if margin is None else margin
+        self.decodes = 0
+        self.follow(0)
+
+    def values(self):
+        return self.source.values()
+
+    def follow(self, scroll, span=0):
+        size = self.tile_size
+        world = self.source.columns * size
+        left = self.origin * size
+        right = left + self.columns * size
+        view_right = scroll + span + self.view_width
+        if (self.columns and left <= max(scroll - self.margin / 2, 0)
+                and right >= min(view_right + self.margin / 2, world)):
+            return
+        first = max(int((scroll - self.margin) // size), 0)
+        last = min(math.ceil((view_right + self.margin) / size), self.source.columns)
+        self.tiles = self.source.decode(first, last)
+        self.origin = first
+        self.decodes += 1
+
+
+# Draws the tiles in view from an atlas holding every distinct tile value of
+# the map. Each atlas row repeats one tile a view's width, so a run of equal
+# tiles along a row (a platform, a stretch of ground) is one blit.
+# paint(surface, value) draws one tile.
+class TileRenderer:
+    def __init__(self, tilemap, paint, view_width, colorkey=(255, 0, 255)):
+        self.tilemap = tilemap
+        size = tilemap.tile_size
+        self.run = view_width // size + 2  # Most columns a view can touch
+        values = [int(value) for value in tilemap.values() if value & DRAWN]
+        atlas = pygame.Surface((self.run * size, max(len(values), 1) * size))
+        atlas.fill(colorkey)
+        tile = pygame.Surface((size, size))
+        self.slots = [0] * 256  # Tile value -> atlas row
+        for slot, value in enumerate(values):
+            tile.fill(colorkey)
+            paint(tile, value)
+            for column in range(self.run):
+                atlas.blit(tile, (column * size, slot * size))
+            self.slots[value] = slot
+        if pygame.display.get_surface():
+            atlas = atlas.convert()
+        atlas.set_colorkey(colorkey, pygame.RLEACCEL)
+        self.atlas = atlas
+
+    # tilemap overrides the map to draw, such as a copy of a TileWindow taken
+    # on another thread, with the same tile values as the one given at init
+    def draw(self, screen, scroll, tilemap=None):
+        tilemap = self.tilemap if tilemap is None else tilemap
+        size = tilemap.tile_size
+        first = max(int(scroll // size) - tilemap.origin, 0)
+        last = min(int((scroll + screen.get_width()) // size) + 1 - tilemap.origin, tilemap.columns, first + self.run)
+        block = tilemap.tiles[:, first:last]
+        if not block.size:
+            return
+
+        # Runs of equal tiles along each row, every row starts a new run
+        starts = np.ones(block.shape, dtype=bool)
+        starts[:, 1:] = block[:, 1:] != block[:, :-1]
+        index = np.flatnonzero(starts)
+        lengths = np.diff(np.append(index, block.size))
+        values = block.ravel()[index]
+        drawn = (values & DRAWN) > 0
+        index, lengths, values = index[drawn], lengths[drawn], values[drawn]
+        rows, columns = np.divmod(index, block.shape[1])
+
+        x = ((columns + first + tilemap.origin) * size - scroll).tolist()
+        y = (rows * size).tolist()
+        atlas = self.atlas
+        slots = self.slots
+        screen.blits([(atlas, (run_x, run_y), (0, slots[value] * size, length * size, size))
+                      for run_x, run_y, value, length in zip(x, y, values.tolist(), lengths.tolist())],
+                     doreturn=False)
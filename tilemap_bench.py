@@ -0,0 +1,238 @@
+# Tile map backend benchmark.
+#
+# Builds worlds made of copies of a level placed end to end and times the
+# collision work of one tick with both backends: Player.move against the
+# platform list (what Game.update passes) and against the tile map, the batched
+# bullet sweep against the PlatformGrid and the tile map, the spike and pickup
+# checks, and drawing the static layer. The rect backend tests every platform
+# and spike each tick, so its cost grows with the world; the tile backend only
+# looks at the cells around the player.
+#
+# With --storage it compares the dense tile grid with the run-length encoded
+# one instead: build time, memory, random cell lookups (one at a time and
+# batched) and the cost of the decoded window following a camera scrolling
+# through the whole world.
+#
+#   python tilemap_bench.py                           # 1, 10 and 100 copies
+#   python tilemap_bench.py --copies 1000 --ticks 300 --level levels/level3.json
+#   python tilemap_bench.py --storage --copies 1 100 1000
+import argparse
+import json
+import random
+import sys
+import time
+
+import numpy as np
+import pygame
+
+from bench import percentile
+from bullets import BulletPool
+from campaign import level_files, read_level
+from coop import INPUTS, RIGHT, UP, load_game
+from tilemap import RunLengthTileMap, TileMap, TileWindow
+
+BULLETS = 64
+LOOKUPS = 1000000
+
+
+# Level data for copies of a level side by side, with one boss at the far end
+def stretch_level(data, copies):
+    length = data["length"]
+    stretched = {"name": "%s x%d" % (data.get("name", ""), copies), "length": length * copies,
+                 "platforms": [], "spikes": [], "pickups": [], "enemies": []}
+    for copy in range(copies):
+        offset = copy * length
+        stretched["platforms"] += [[x + offset, y, width, height] for x, y, width, height in data["platforms"]]
+        stretched["spikes"] += [[x + offset, y, width] for x, y, width in data["spikes"]]
+        stretched["pickups"] += [[x + offset, y] for x, y in data["pickups"]]
+        stretched["enemies"] += [[x + offset, y, kind] for x, y, kind in data["enemies"]]
+    stretched["boss"] = [data["boss"][0] + (copies - 1) * length, data["boss"][1]]
+    return stretched
+
+
+# Mean and p99 microseconds per call
+def timings(samples):
+    samples = sorted(samples)
+    return sum(samples) / len(samples) * 1e6, percentile(samples, 0.99) * 1e6
+
+
+def measure(data, copies, ticks, seed=0):
+    module = load_game()
+    data = stretch_level(data, copies)
+    start = time.perf_counter()
+    level = module.build_level(data)
+    build_s = time.perf_counter() - start
+    start = time.perf_counter()
+    tilemap = module.TileMap.from_level(level, module.HEIGHT)
+    convert_s = time.perf_counter() - start
+
+    rng = random.Random(seed)
+    # Start the player somewhere in the middle of the world
+    player = module.Player(level.length // 2 + 100, 100)
+    players = {"rects": player, "tiles": module.Player(player.x, player.y)}
+    walls = {"rects": level.platform_grid, "tiles": tilemap}
+    samples = {name: [] for name in ("move rects", "move tiles", "bullets rects", "bullets tiles",
+                                     "hazards rects", "hazards tiles")}
+    for tick in range(ticks):
+        keys = INPUTS[RIGHT | (UP if tick % 40 == 0 else 0)]
+        for backend, platforms in (("rects", level.platforms), ("tiles", tilemap)):
+            moving = players[backend]
+            start = time.perf_counter()
+            moving.move(platforms, keys, level.length)
+            samples["move " + backend].append(time.perf_counter() - start)
+
+        # Bullets in flight around the player
+        pool = BulletPool(radius=5)
+        for _ in range(BULLETS):
+            angle = rng.uniform(0, 2 * np.pi)
+            pool.add(module.Bullet(player.x + rng.uniform(-400, 400), rng.uniform(0, module.HEIGHT),
+                                   10 * np.cos(angle), 10 * np.sin(angle)))
+        for backend in ("rects", "tiles"):
+            start = time.perf_counter()
+            pool.sweep_grid(walls[backend])
+            samples["bullets " + backend].append(time.perf_counter() - start)
+
+        rect = players["rects"].get_rect()
+        start = time.perf_counter()
+        [spike for spike in level.spikes if module.check_collision(rect, spike.get_rect())]
+        [pickup for pickup in level.health_pickups if module.check_collision(rect, pickup.get_rect())]
+        samples["hazards rects"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        tilemap.flags_in_rect(rect) & module.SPIKE
+        tilemap.pickups_in_rect(rect)
+        samples["hazards tiles"].append(time.perf_counter() - start)
+
+    if players["rects"].get_state() != players["tiles"].get_state():
+        raise AssertionError("backends disagree: %s != %s" % (players["rects"].get_state(),
+                                                              players["tiles"].get_state()))
+
+    # Static layer of a frame, drawn off screen
+    surface = pygame.Surface((module.WIDTH, module.HEIGHT))
+    renderer = module.TileRenderer(tilemap, module.paint_tile, module.WIDTH)
+    draw = {"draw rects": [], "draw tiles": []}
+    for tick in range(ticks):
+        scroll = (tick * 37) % (level.length - module.WIDTH)
+        start = time.perf_counter()
+        for platform in level.platforms:
+            platform.draw(surface, scroll)
+        for spike in level.spikes:
+            spike.draw(surface, scroll)
+        draw["draw rects"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        renderer.draw(surface, scroll)
+        draw["draw tiles"].append(time.perf_counter() - start)
+    samples.update(draw)
+
+    result = {"copies": copies, "length": level.length, "platforms": len(level.platforms),
+              "tiles": tilemap.tiles.size, "tile_kb": tilemap.nbytes / 1024, "exact": tilemap.exact,
+              "build_ms": build_s * 1000, "convert_ms": convert_s * 1000}
+    for name, values in samples.items():
+        result[name.replace(" ", "_") + "_us"], result[name.replace(" ", "_") + "_p99_us"] = timings(values)
+    return result
+
+
+# Dense against run-length encoded storage of the same world
+def measure_storage(data, copies, seed=0):
+    module = load_game()
+    level = module.build_level(stretch_level(data, copies))
+    rng = np.random.default_rng(seed)
+    result = {"copies": copies, "length": level.length}
+
+    start = time.perf_counter()
+    store = RunLengthTileMap.from_level(level, module.HEIGHT)
+    result["rle_build_ms"] = (time.perf_counter() - start) * 1000
+    result["rle_kb"] = store.nbytes / 1024
+    result["runs"] = len(store.starts)
+    result["distinct_columns"] = len(store.table)
+    result["tiles"] = store.rows * store.columns
+
+    # Dense grids of the biggest worlds don't fit in memory
+    dense = None
+    if result["tiles"] <= 2 ** 30:
+        start = time.perf_counter()
+        dense = TileMap.from_level(level, module.HEIGHT)
+        result["dense_build_ms"] = (time.perf_counter() - start) * 1000
+    result["dense_kb"] = result["tiles"] / 1024
+
+    rows = rng.integers(0, store.rows, LOOKUPS)
+    columns = rng.integers(0, store.columns, LOOKUPS)
+    for name, tiles in (("dense", dense), ("rle", store)):
+        if tiles is None:
+            continue
+        start = time.perf_counter()
+        found = tiles.lookup(rows, columns)
+        result[name + "_batch_mcells_s"] = LOOKUPS / (time.perf_counter() - start) / 1e6
+        points = list(zip((columns[:20000] * tiles.tile_size).tolist(), (rows[:20000] * tiles.tile_size).tolist()))
+        start = time.perf_counter()
+        for x, y in points:
+            tiles.tile_at(x, y)
+        result[name + "_tile_at_us"] = (time.perf_counter() - start) / len(points) * 1e6
+        if name == "dense":
+            expected = found
+        elif not np.array_equal(found, expected):
+            raise AssertionError("run-length lookups differ from the dense grid")
+
+    # A camera scrolling through the whole world at 5 px a tick
+    window = TileWindow(store, module.WIDTH)
+    follows = []
+    for scroll in range(0, level.length - module.WIDTH, 5):
+        start = time.perf_counter()
+        window.follow(scroll)
+        follows.append(time.perf_counter() - start)
+    result["window_kb"] = window.nbytes / 1024
+    result["decodes"] = window.decodes
+    result["follow_us"], result["follow_p99_us"] = timings(follows)
+    result["follow_max_us"] = max(follows) * 1e6
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the platform and tile map collision backends")
+    parser.add_argument("--copies", type=int, nargs="+", default=[1, 10, 100],
+                        help="world sizes, in copies of the level")
+    parser.add_argument("--level", help="level file to stretch, the first shipped level by default")
+    parser.add_argument("--ticks", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--storage", action="store_true",
+                        help="compare dense and run-length encoded tile storage instead")
+    parser.add_argument("--output", help="write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    data = read_level(args.level or level_files()[0])
+    results = []
+    if args.storage:
+        print("%7s %12s %10s %9s %8s %9s | %-13s %-15s %-13s | %9s %9s %9s" % (
+            "copies", "tiles", "dense kB", "rle kB", "runs", "columns", "build ms", "Mcells/s", "tile_at us",
+            "window kB", "decodes", "follow us"))
+        for copies in args.copies:
+            row = measure_storage(data, copies, args.seed)
+            results.append(row)
+            print("%7d %12d %10.0f %9.1f %8d %9d | %5s/%-7.0f %6s/%-8.1f %5s/%-7.2f | %9.0f %9d %9.2f" % (
+                copies, row["tiles"], row["dense_kb"], row["rle_kb"], row["runs"], row["distinct_columns"],
+                "%.0f" % row["dense_build_ms"] if "dense_build_ms" in row else "-", row["rle_build_ms"],
+                "%.0f" % row["dense_batch_mcells_s"] if "dense_batch_mcells_s" in row else "-",
+                row["rle_batch_mcells_s"],
+                "%.2f" % row["dense_tile_at_us"] if "dense_tile_at_us" in row else "-", row["rle_tile_at_us"],
+                row["window_kb"], row["decodes"], row["follow_us"]))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+        return 0
+
+    print("%7s %9s %9s %9s | %-15s %-15s %-15s %-15s   (us, rects / tiles)" % (
+        "copies", "platforms", "tiles kB", "convert", "move", "bullets", "hazards", "draw"))
+    for copies in args.copies:
+        row = measure(data, copies, args.ticks, args.seed)
+        results.append(row)
+        print("%7d %9d %9.0f %7.1fms | %s" % (
+            copies, row["platforms"], row["tile_kb"], row["convert_ms"], " ".join(
+                "%7.1f/%-7.1f" % (row[name + "_rects_us"], row[name + "_tiles_us"])
+                for name in ("move", "bullets", "hazards", "draw"))))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())